@@ -0,0 +1,109 @@
+# bench_classifier.py - 比较逐条请求与批量分类（打包、并发、缓存）的请求数和耗时
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.bench_classifier [--debug-dir DEBUG] [--synthetic 2000] [--repost-ratio 0.3]
+#                                        [--latency 0.05] [--concurrency 4] [--token-budget 3000]
+#
+# 使用本地的 FakeProvider，每个请求有固定延迟，另按条数增加处理时间，模拟LLM接口；
+# 依次运行：逐条顺序请求、批量分类（首次，缓存为空）、重复运行（全部命中缓存），并检查三者结果一致
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.classifier import BatchClassifier, ClassificationCache, FakeProvider, DEFAULT_CATEGORIES
+from lib.text_normalizer import normalize_weibo_text
+from benchmarks.corpus import iter_weibo_payloads
+
+WORDS = ['今天', '发布', '新款', '手机', '比赛', '进球', '股市', '上涨', '电影', '上映', '学习', '笔记', '火锅',
+         '旅行', '攻略', '科技', '论文', '明星', '综艺', '天气', '通勤', '猫', '咖啡', '跑步', '基金', '芯片']
+
+
+def make_synthetic_posts(count, repost_ratio, seed=0):
+    """
+    生成合成微博正文，repost_ratio 比例的微博与之前某条内容相同，只有短链和空白不同
+    """
+    rng = random.Random(seed)
+    posts = []
+    for n in range(count):
+        if posts and rng.random() < repost_ratio:
+            text = rng.choice(posts)[1] + f' http://t.cn/{rng.randint(0, 10 ** 6)} '
+        else:
+            text = ''.join(rng.choice(WORDS) for _ in range(rng.randint(10, 80)))
+        posts.append((f'B{n:06d}', text))
+    return posts
+
+
+def load_posts(args):
+    posts = []
+    if args.debug_dir:
+        for payload in iter_weibo_payloads(args.debug_dir):
+            text, _ = normalize_weibo_text(payload.get('text', ''))
+            posts.append((str(payload.get('bid') or payload.get('mblogid') or len(posts)), text))
+    posts.extend(make_synthetic_posts(args.synthetic, args.repost_ratio))
+    return posts
+
+
+def run_naive(posts, provider):
+    """每条微博一个请求，顺序执行（没有批量分类时的做法）"""
+    return {key: provider.classify_batch([text], DEFAULT_CATEGORIES)[0] for key, text in posts if text.strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量分类基准测试')
+    parser.add_argument('--debug-dir', default=None, help='调试采集归档目录，使用其中的微博正文')
+    parser.add_argument('--synthetic', type=int, default=2000, help='合成微博的数量')
+    parser.add_argument('--repost-ratio', type=float, default=0.3, help='合成微博中重复内容（转发）的比例')
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的模拟延迟（秒）')
+    parser.add_argument('--per-item', type=float, default=0.001, help='每条文本增加的模拟处理时间（秒）')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时进行的请求数')
+    parser.add_argument('--token-budget', type=int, default=3000, help='每个请求的估算token上限')
+    parser.add_argument('--naive-limit', type=int, default=200,
+                        help='逐条请求只测前N条再按比例推算总耗时，0为全部')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    posts = load_posts(args)
+
+    naive_posts = posts[:args.naive_limit] if args.naive_limit else posts
+    naive_provider = FakeProvider(delay=args.latency, per_item_delay=args.per_item)
+    start = time.perf_counter()
+    naive_labels = run_naive(naive_posts, naive_provider)
+    naive_seconds = (time.perf_counter() - start) * len(posts) / max(len(naive_posts), 1)
+
+    with tempfile.TemporaryDirectory() as work_dir, ClassificationCache(os.path.join(work_dir, 'cache.db')) as cache:
+        runs = []
+        for _ in range(2):
+            provider = FakeProvider(delay=args.latency, per_item_delay=args.per_item)
+            classifier = BatchClassifier(provider, cache=cache, token_budget=args.token_budget,
+                                         concurrency=args.concurrency)
+            start = time.perf_counter()
+            results = classifier.classify(posts)
+            runs.append({'seconds': round(time.perf_counter() - start, 3), 'requests': provider.requests,
+                         'items_sent': provider.items, 'results': results})
+
+    first, second = runs
+    mismatch = sum(1 for key, label in naive_labels.items() if first['results'].get(key, (None,))[0] != label)
+    mismatch += sum(1 for key, value in first['results'].items() if second['results'].get(key) != value)
+    report = {
+        'posts': len(posts),
+        'classified': len(first['results']),
+        'naive': {'requests': len(posts), 'seconds_estimated': round(naive_seconds, 2)},
+        'batched': {key: value for key, value in first.items() if key != 'results'},
+        'cached_rerun': {key: value for key, value in second.items() if key != 'results'},
+        'speedup': round(naive_seconds / first['seconds'], 1) if first['seconds'] else None,
+        'mismatch': mismatch
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if not mismatch else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
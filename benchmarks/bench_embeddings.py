@@ -0,0 +1,140 @@
+# bench_embeddings.py - 向量索引的建立、相似查询和近似重复分组的耗时
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.bench_embeddings [--posts 100000] [--duplicate-ratio 0.05] [--queries 200]
+#                                        [--cluster-posts 20000] [--threshold 0.8]
+#
+# 使用 HashingEmbedder 和合成微博正文，其中 duplicate-ratio 比例的微博是之前某条微博的改写（增删少量词、加短链），
+# 统计：计算并写入向量的速度、重新打开索引（内存映射）的耗时、top-k 查询的 p50/p99、
+# 与逐行Python计算的对比，以及近似重复分组找回改写微博的比例
+
+import os
+import sys
+import json
+import time
+import math
+import random
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.embeddings import EmbeddingIndex, HashingEmbedder
+from benchmarks.bench_classifier import WORDS
+
+
+def make_posts(count, duplicate_ratio, seed=0):
+    """
+    生成合成微博，返回 (posts, 改写关系)
+
+    改写关系为 {改写微博BID: 原微博BID}
+    """
+    rng = random.Random(seed)
+    posts = []
+    rewrites = {}
+    originals = []
+    for n in range(count):
+        bid = f'B{n:07d}'
+        if originals and rng.random() < duplicate_ratio:
+            source_bid, words = rng.choice(originals)
+            words = list(words)
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            text = ''.join(words) + f' http://t.cn/{rng.randint(0, 10 ** 6)}'
+            rewrites[bid] = source_bid
+        else:
+            words = [rng.choice(WORDS) for _ in range(rng.randint(15, 60))]
+            originals.append((bid, words))
+            text = ''.join(words)
+        posts.append((bid, text))
+    return posts, rewrites
+
+
+def python_top_k(matrix, row, k):
+    """逐行计算余弦相似度的纯Python实现，用于对比"""
+    query = matrix[row].tolist()
+    scores = []
+    for i in range(len(matrix)):
+        if i != row:
+            scores.append((sum(a * b for a, b in zip(query, matrix[i].tolist())), i))
+    scores.sort(reverse=True)
+    return scores[:k]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(math.ceil(p / 100 * len(values)), 1) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='向量索引基准测试')
+    parser.add_argument('--posts', type=int, default=100000, help='合成微博数量')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.05, help='改写自其他微博的比例')
+    parser.add_argument('--dim', type=int, default=256, help='向量维度')
+    parser.add_argument('--queries', type=int, default=200, help='top-k 查询次数')
+    parser.add_argument('--top-k', type=int, default=10, help='每次查询返回的条数')
+    parser.add_argument('--python-rows', type=int, default=5000, help='纯Python对比只计算前N行再按比例推算')
+    parser.add_argument('--cluster-posts', type=int, default=20000, help='近似重复分组使用的微博数量')
+    parser.add_argument('--threshold', type=float, default=0.8, help='近似重复的相似度阈值')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    posts, rewrites = make_posts(args.posts, args.duplicate_ratio)
+    rng = random.Random(1)
+    report = {'posts': len(posts), 'dim': args.dim}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'weibo_embeddings')
+        index = EmbeddingIndex(path, HashingEmbedder(args.dim))
+        start = time.perf_counter()
+        index.update(posts)
+        seconds = time.perf_counter() - start
+        report['build'] = {'seconds': round(seconds, 2), 'posts_per_second': round(len(posts) / seconds),
+                           'file_mb': round(os.path.getsize(path + '.f32') / 1024 / 1024, 1)}
+
+        start = time.perf_counter()
+        index = EmbeddingIndex(path, HashingEmbedder(args.dim))
+        unchanged = index.update(posts)
+        report['reopen_and_check_seconds'] = round(time.perf_counter() - start, 2)
+        report['recomputed_on_reopen'] = unchanged
+
+        bids = [rng.choice(index.bids) for _ in range(args.queries)]
+        latencies = []
+        for bid in bids:
+            start = time.perf_counter()
+            index.most_similar(bid, k=args.top_k)
+            latencies.append(time.perf_counter() - start)
+        report['query_ms'] = {'p50': round(percentile(latencies, 50) * 1000, 2),
+                              'p99': round(percentile(latencies, 99) * 1000, 2)}
+
+        sample = index.matrix[:args.python_rows]
+        start = time.perf_counter()
+        python_result = python_top_k(sample, 0, args.top_k)
+        python_seconds = (time.perf_counter() - start) * len(index) / len(sample)
+        report['python_query_ms_estimated'] = round(python_seconds * 1000)
+        numpy_scores = sample @ sample[0]
+        report['python_numpy_agree'] = all(abs(numpy_scores[i] - score) < 1e-4 for score, i in python_result)
+
+        cluster_posts = posts[:args.cluster_posts]
+        cluster_index = EmbeddingIndex(os.path.join(work_dir, 'cluster'), HashingEmbedder(args.dim))
+        cluster_index.update(cluster_posts)
+        start = time.perf_counter()
+        clusters = cluster_index.near_duplicates(threshold=args.threshold)
+        seconds = time.perf_counter() - start
+
+    cluster_of = {bid: n for n, cluster in enumerate(clusters) for bid in cluster}
+    expected = [(bid, source) for bid, source in rewrites.items() if bid < f'B{args.cluster_posts:07d}']
+    found = sum(1 for bid, source in expected if bid in cluster_of and cluster_of[bid] == cluster_of.get(source))
+    report['near_duplicates'] = {
+        'posts': len(cluster_posts),
+        'seconds': round(seconds, 2),
+        'clusters': len(clusters),
+        'rewrites': len(expected),
+        'recall': round(found / len(expected), 3) if expected else None
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report['python_numpy_agree'] and not unchanged else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+# bench_end_to_end.py - 离线端到端基准测试：收藏列表 → 任务队列 → 详情页 → 解析 → 媒体下载
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.bench_end_to_end [--fixtures DIR] [--pages 10] [--latency 0.02] [--bandwidth-kb 4096]
+#                                        [--workers 4] [--media-workers 8] [--async-fetch] [--output report.json]
+#                                        [--baseline old.json --tolerance 0.2]
+#
+# 所有请求经 lib.http_client.set_host_rewrite 改发到本地桩服务器（benchmarks/stub_server.py），
+# 夹具可以用 stub_server --record 从调试采集归档生成，不指定时使用合成夹具。
+# 程序在临时目录中运行，不会读写真实的任务数据库、setting.json 和下载目录。
+# 报告为JSON：各阶段的 posts/s、MB/s，接口和媒体请求的 p50/p99 延迟，以及进程的峰值RSS；
+# --metrics 时附带 lib.metrics 记录的各阶段耗时；指定 --baseline 时吞吐量下降或峰值RSS增长超过 --tolerance 以非零状态退出
+
+import os
+import sys
+import glob
+import json
+import time
+import math
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as app
+from lib.http_client import set_host_rewrite, add_response_hook, remove_response_hook
+from lib.rate_limiter import configure_host_limits, API_DOMAINS
+from lib.task_manager import set_tasks_db_path
+from lib.metrics import enable_metrics, get_metrics, close_metrics
+from lib.path_manager import get_download_paths, invalidate_download_paths
+from lib.weibo_api import parse_detail_html
+from lib.weibo_parser import parse_weibo_data
+from benchmarks.stub_server import StubServer, make_synthetic_fixtures
+
+UNLIMITED_RATE = 1e6
+
+
+class LatencyRecorder:
+    """按接口/媒体分别记录每个请求收到响应头的延迟"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {'api': [], 'media': []}
+
+    def __call__(self, url, status_code, latency):
+        host = url.split('/')[2].split(':')[0] if '://' in url else ''
+        kind = 'api' if any(host == d or host.endswith('.' + d) for d in API_DOMAINS) else 'media'
+        with self._lock:
+            self.samples[kind].append(latency)
+
+    def summary(self):
+        return {kind: latency_summary(values) for kind, values in self.samples.items()}
+
+
+def percentile(sorted_values, p):
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 2) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 2) if values else None
+    }
+
+
+def peak_rss_mb():
+    """进程的峰值常驻内存（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def directory_bytes(path):
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                total += entry.stat().st_size
+    return total
+
+
+def bench_parse(fixtures_dir, repeat):
+    """只测解析：从详情页HTML提取数据并 parse_weibo_data"""
+    pages = []
+    for file_path in sorted(glob.glob(os.path.join(fixtures_dir, 'detail', '*.html'))):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            pages.append(f.read())
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            data = parse_detail_html(html)
+            if data:
+                parse_weibo_data(data, str((data.get('user') or {}).get('id', '')))
+        best = min(best, time.perf_counter() - start)
+    return {'posts': len(pages), 'seconds': round(best, 4),
+            'posts_per_second': round(len(pages) / best, 1) if best else None}
+
+
+def bench_favorites(max_pages, use_async):
+    start = time.perf_counter()
+    result = app.fetch_favorites(max_pages=max_pages, add_to_tasks=True, use_async=use_async)
+    seconds = time.perf_counter() - start
+    count = result.get('data', {}).get('count', 0) if result['status'] == 'success' else 0
+    return {'favorites': count, 'seconds': round(seconds, 3),
+            'posts_per_second': round(count / seconds, 1) if seconds else None}
+
+
+def bench_download(workers, media_workers, server, async_fetch=False):
+    media_dir = get_download_paths()['media']
+    bytes_before = server.bytes_sent
+    connections_before, requests_before = server.connections, server.requests
+    start = time.perf_counter()
+    app.main(workers=workers, media_workers=media_workers, cookie='SUB=bench', async_fetch=async_fetch)
+    seconds = time.perf_counter() - start
+
+    with sqlite3.connect(os.path.join(get_download_paths()['base'], 'weibo.db')) as conn:
+        posts = conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+    media_bytes = directory_bytes(media_dir)
+    return {
+        'posts': posts,
+        'media_files': len(os.listdir(media_dir)),
+        'media_mb': round(media_bytes / 1024 / 1024, 2),
+        'served_mb': round((server.bytes_sent - bytes_before) / 1024 / 1024, 2),
+        # 连接数远小于请求数说明连接池在复用连接
+        'requests': server.requests - requests_before,
+        'connections': server.connections - connections_before,
+        'seconds': round(seconds, 3),
+        'posts_per_second': round(posts / seconds, 2) if seconds else None,
+        'mb_per_second': round(media_bytes / 1024 / 1024 / seconds, 2) if seconds else None
+    }
+
+
+def compare(report, baseline, tolerance):
+    """与基准报告比较，返回退化的指标列表"""
+    regressions = []
+    for phase in ('parse', 'favorites', 'download'):
+        for key in ('posts_per_second', 'mb_per_second'):
+            old = baseline.get(phase, {}).get(key)
+            new = report.get(phase, {}).get(key)
+            if old and new is not None and new < old * (1 - tolerance):
+                regressions.append(f'{phase}.{key}: {old} -> {new}')
+    old_rss, new_rss = baseline.get('peak_rss_mb'), report.get('peak_rss_mb')
+    if old_rss and new_rss and new_rss > old_rss * (1 + tolerance):
+        regressions.append(f'peak_rss_mb: {old_rss} -> {new_rss}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线端到端基准测试')
+    parser.add_argument('--fixtures', default=None, help='夹具目录，默认生成合成夹具')
+    parser.add_argument('--pages', type=int, default=10, help='收藏页数（合成夹具）和最大爬取页数')
+    parser.add_argument('--latency', type=float, default=0.02, help='每个请求的模拟延迟（秒）')
+    parser.add_argument('--bandwidth-kb', type=float, default=None, help='每个响应的发送速率上限（KB/s）')
+    parser.add_argument('--image-kb', type=int, default=200, help='合成图片的大小（KB）')
+    parser.add_argument('--video-kb', type=int, default=2048, help='合成视频的大小（KB）')
+    parser.add_argument('--workers', type=int, default=4, help='并发处理任务的线程数')
+    parser.add_argument('--media-workers', type=int, default=8, help='同时进行的媒体下载数')
+    parser.add_argument('--async-fetch', action='store_true', help='用异步引擎获取收藏列表和预取详情页')
+    parser.add_argument('--parse-repeat', type=int, default=3, help='解析阶段的重复次数（取最短）')
+    parser.add_argument('--output', default=None, help='报告写入的JSON文件')
+    parser.add_argument('--baseline', default=None, help='用于比较的基准报告')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的退化比例')
+    parser.add_argument('--metrics', action='store_true', help='在报告中附带各阶段的耗时和计数')
+    parser.add_argument('--verbose', action='store_true', help='输出程序日志')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # 本地服务器不需要限速
+    for kind in ('api', 'cdn'):
+        configure_host_limits(kind, rate=UNLIMITED_RATE, min_rate=UNLIMITED_RATE, max_rate=UNLIMITED_RATE)
+
+    cwd = os.getcwd()
+    recorder = LatencyRecorder()
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixtures_dir = os.path.abspath(args.fixtures) if args.fixtures else os.path.join(work_dir, 'fixtures')
+        if not args.fixtures:
+            make_synthetic_fixtures(fixtures_dir, pages=args.pages)
+
+        # 在临时目录中运行：setting.json、weibo目录和下载目录都在这里
+        os.chdir(work_dir)
+        os.makedirs('weibo', exist_ok=True)
+        with open('setting.json', 'w', encoding='utf-8') as f:
+            json.dump({'download_path': os.path.join(work_dir, 'download'), 'cookie': 'SUB=bench'}, f)
+        invalidate_download_paths()
+        set_tasks_db_path(os.path.join(work_dir, 'download_tasks.db'))
+
+        bandwidth = args.bandwidth_kb * 1024 if args.bandwidth_kb else None
+        server = StubServer(fixtures_dir, latency=args.latency, bandwidth=bandwidth,
+                            image_size=args.image_kb * 1024, video_size=args.video_kb * 1024)
+        try:
+            report = {'parse': bench_parse(fixtures_dir, args.parse_repeat)}
+            with server:
+                set_host_rewrite(server.base_url)
+                add_response_hook(recorder)
+                if args.metrics:
+                    enable_metrics(interval=0)
+                report['favorites'] = bench_favorites(args.pages, args.async_fetch)
+                report['download'] = bench_download(args.workers, args.media_workers, server, args.async_fetch)
+                if args.metrics:
+                    report['stages'] = get_metrics().snapshot()
+        finally:
+            close_metrics()
+            remove_response_hook(recorder)
+            set_host_rewrite(None)
+            set_tasks_db_path(None)
+            os.chdir(cwd)
+            invalidate_download_paths()
+
+    report.update({
+        'latency': recorder.summary(),
+        'peak_rss_mb': peak_rss_mb(),
+        'config': {'latency_seconds': args.latency, 'bandwidth_kb': args.bandwidth_kb, 'workers': args.workers,
+                   'media_workers': args.media_workers, 'async_fetch': args.async_fetch,
+                   'fixtures': args.fixtures or 'synthetic', 'pages': args.pages}
+    })
+
+    exit_code = 0
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+        exit_code = 1 if regressions else 0
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+# bench_media_extractor.py - 对比重构前的图片提取 + get_best_video_urls 与一次遍历的 extract_media
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.bench_media_extractor [debug目录] [--repeat N] [--synthetic N]
+#
+# 先检查两种实现对每条微博（及其转发的原微博）的输出是否完全一致，有差异时以非0状态退出；
+# 然后比较耗时。没有保存的调试数据时可以用 --synthetic 生成带多清晰度LivePhoto的测试数据
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.weibo_parser import extract_media
+from benchmarks.corpus import iter_weibo_payloads
+
+# 两种实现中的日志都不输出，避免影响计时
+logger = logging.getLogger('bench_media_extractor')
+logger.disabled = True
+logging.getLogger('weibo_parser').disabled = True
+
+
+def legacy_get_best_video_urls(weibo_data):
+    """
+    重构前 weibo_parser.get_best_video_urls 的实现，用于对比
+
+    从微博数据中提取所有视频链接，并为每个不同视频选择最高清晰度版本
+
+    Args:
+        weibo_data: 微博数据字典
+
+    Returns:
+        list: 包含视频信息的字典列表，每个字典包含url和index(原始序号)
+    """
+    # 直接从pics数组中提取视频链接
+    video_infos = []
+
+    # 检查pics数组中的videoSrc字段
+    if 'pics' in weibo_data and weibo_data['pics']:
+        # 按照视频文件名分组
+        video_groups = {}
+
+        for i, pic in enumerate(weibo_data['pics']):
+            # 处理LivePhoto类型视频
+            if pic.get('type') == 'livephoto' and 'videoSrc' in pic:
+                url = pic['videoSrc']
+                # 提取视频文件名作为唯一标识
+                video_filename = url.split('/')[-1].split('?')[0]
+
+                # 提取分辨率
+                resolution = 0
+                if 'template=' in url:
+                    try:
+                        res_part = url.split('template=')[1].split('&')[0]
+                        if 'x' in res_part:
+                            width = int(res_part.split('x')[0])
+                            resolution = width
+                    except:
+                        pass
+
+                # 如果这个文件名还没有记录，或者当前分辨率更高，则更新
+                if video_filename not in video_groups or resolution > video_groups[video_filename]['resolution']:
+                    video_groups[video_filename] = {
+                        'url': url,
+                        'resolution': resolution,
+                        'index': i + 1,  # 保存原始序号，从1开始
+                        'is_livephoto': True
+                    }
+            # 处理普通视频类型
+            elif pic.get('type') == 'video' and 'videoSrc' in pic:
+                url = pic['videoSrc']
+                # 提取视频文件名作为唯一标识
+                video_filename = url.split('/')[-1].split('?')[0]
+
+                # 提取分辨率
+                resolution = 0
+                if 'template=' in url:
+                    try:
+                        res_part = url.split('template=')[1].split('&')[0]
+                        if 'x' in res_part:
+                            width = int(res_part.split('x')[0])
+                            resolution = width
+                    except:
+                        pass
+
+                # 如果这个文件名还没有记录，或者当前分辨率更高，则更新
+                if video_filename not in video_groups or resolution > video_groups[video_filename]['resolution']:
+                    video_groups[video_filename] = {
+                        'url': url,
+                        'resolution': resolution,
+                        'index': i + 1,  # 保存原始序号，从1开始
+                        'is_livephoto': False
+                    }
+
+        # 收集每个不同视频的最高清晰度版本
+        for video_info in video_groups.values():
+            video_infos.append({
+                'url': video_info['url'],
+                'index': video_info['index'],
+                'is_livephoto': video_info.get('is_livephoto', False)
+            })
+
+    # 检查page_info中的媒体数据
+    if 'page_info' in weibo_data and weibo_data['page_info']:
+        page_info = weibo_data['page_info']
+
+        # 检查是否为视频类型
+        if page_info.get('type') == 'video':
+            # 尝试获取高清视频链接
+            media_info = page_info.get('media_info', {})
+
+            # 按优先级尝试不同的视频源
+            for video_key in ['mp4_hd_url', 'mp4_720p_mp4', 'mp4_1080p_mp4', 'h265_mp4_hd', 'h265_mp4_ld']:
+                if video_key in media_info and media_info[video_key]:
+                    # 对于page_info中的视频，我们使用0作为特殊索引
+                    # 因为它通常是主视频而不是图片列表中的视频
+                    video_infos.append({
+                        'url': media_info[video_key],
+                        'index': 0,
+                        'is_livephoto': False
+                    })
+                    break
+
+    # 获取LivePhoto链接
+    live_photo_list = legacy_get_live_photo(weibo_data)
+
+    # 查找pics数组中对应的LivePhoto索引
+    if 'pics' in weibo_data and weibo_data['pics'] and live_photo_list:
+        # 创建一个映射，将LivePhoto URL映射到其在pics中的索引
+        livephoto_url_to_index = {}
+
+        # 首先遍历pics数组，建立映射关系
+        for i, pic in enumerate(weibo_data['pics']):
+            if pic.get('type') == 'livephoto' and 'videoSrc' in pic:
+                livephoto_url_to_index[pic['videoSrc']] = i + 1
+
+        # 处理从get_live_photo获取的LivePhoto列表
+        for live_photo_url in live_photo_list:
+            # 检查这个URL是否已经在video_infos中
+            already_added = any(info['url'] == live_photo_url for info in video_infos)
+
+            if not already_added:
+                # 尝试找到对应的图片索引
+                found_index = -1
+                for i, pic in enumerate(weibo_data['pics']):
+                    if pic.get('type') == 'livephoto' and pic.get('videoSrc') == live_photo_url:
+                        found_index = i + 1
+                        break
+
+                # 如果找到了对应的图片索引，使用该索引
+                if found_index != -1:
+                    video_infos.append({
+                        'url': live_photo_url,
+                        'index': found_index,
+                        'is_livephoto': True
+                    })
+                else:
+                    # 如果没找到对应索引，使用连续的索引
+                    next_index = len(weibo_data['pics']) + len(video_infos) + 1
+                    video_infos.append({
+                        'url': live_photo_url,
+                        'index': next_index,
+                        'is_livephoto': True
+                    })
+                    logger.warning(f"LivePhoto未找到对应图片，使用新索引: {next_index}")
+
+    return video_infos
+
+def legacy_get_live_photo(weibo_data):
+    """重构前 weibo_parser.get_live_photo 的实现：获取live photo中的视频url列表
+
+    Args:
+        weibo_data: 微博数据字典
+
+    Returns:
+        list: LivePhoto视频URL列表
+    """
+    live_photo_urls = []
+
+    # 检查pics数组中的videoSrc字段（这是最直接的方式）
+    if 'pics' in weibo_data and weibo_data['pics']:
+        for i, pic in enumerate(weibo_data['pics']):
+            if pic.get('type') == 'livephoto' and 'videoSrc' in pic:
+                live_photo_url = pic['videoSrc']
+                if live_photo_url and live_photo_url not in live_photo_urls:
+                    live_photo_urls.append(live_photo_url)
+                    logger.debug(f"从pics[{i}].videoSrc找到LivePhoto URL: {live_photo_url}")
+
+    # 如果上面的方法没有找到LivePhoto，尝试其他字段
+    if not live_photo_urls:
+        # 检查pics数组中的其他可能字段
+        if 'pics' in weibo_data and weibo_data['pics']:
+            for i, pic in enumerate(weibo_data['pics']):
+                # 直接检查live_photo_url字段
+                if pic.get('live_photo_url'):
+                    live_photo_url = pic.get('live_photo_url')
+                    if live_photo_url and live_photo_url not in live_photo_urls:
+                        live_photo_urls.append(live_photo_url)
+                        logger.debug(f"从pics[{i}].live_photo_url找到LivePhoto URL: {live_photo_url}")
+                # 检查pic.values字段
+                elif pic.get('values') and pic['values'].get('live_photo_url'):
+                    live_photo_url = pic['values'].get('live_photo_url')
+                    if live_photo_url and live_photo_url not in live_photo_urls:
+                        live_photo_urls.append(live_photo_url)
+                        logger.debug(f"从pics[{i}].values.live_photo_url找到LivePhoto URL: {live_photo_url}")
+                # 检查pic.live_photo字段
+                elif pic.get('live_photo'):
+                    live_photo_url = pic.get('live_photo')
+                    if live_photo_url and live_photo_url not in live_photo_urls:
+                        live_photo_urls.append(live_photo_url)
+                        logger.debug(f"从pics[{i}].live_photo找到LivePhoto URL: {live_photo_url}")
+
+    # 检查微博数据中的live_photo字段
+    if 'live_photo' in weibo_data:
+        if isinstance(weibo_data['live_photo'], list):
+            for url in weibo_data['live_photo']:
+                if url and url not in live_photo_urls:
+                    live_photo_urls.append(url)
+            logger.debug(f"从微博根级别live_photo数组找到LivePhoto URLs: {weibo_data['live_photo']}")
+        elif isinstance(weibo_data['live_photo'], str):
+            url = weibo_data['live_photo']
+            if url and url not in live_photo_urls:
+                live_photo_urls.append(url)
+            logger.debug(f"从微博根级别live_photo字符串找到LivePhoto URL: {url}")
+
+    return live_photo_urls
+
+
+def legacy_extract(weibo_data):
+    """重构前 parse_weibo_data 中的图片提取加上 get_best_video_urls，返回 (图片, 视频)"""
+    images = []
+    if 'pics' in weibo_data and weibo_data['pics']:
+        for i, pic in enumerate(weibo_data['pics']):
+            if 'large' in pic and 'url' in pic['large']:
+                images.append((pic['large']['url'], i + 1))
+    return images, legacy_get_best_video_urls(weibo_data)
+
+
+def new_extract(weibo_data):
+    """extract_media 的结果转换为与 legacy_extract 相同的格式"""
+    images = []
+    videos = []
+    for item in extract_media(weibo_data):
+        if item.is_video:
+            videos.append({'url': item.url, 'index': item.index, 'is_livephoto': item.kind == 'livephoto'})
+        else:
+            images.append((item.url, item.index))
+    return images, videos
+
+
+def make_synthetic_payloads(count, seed=0):
+    """生成带图片、多清晰度LivePhoto、普通视频和page_info视频的微博数据"""
+    rng = random.Random(seed)
+    payloads = []
+    for n in range(count):
+        pics = []
+        for i in range(rng.randint(0, 18)):
+            pic = {'pid': f'p{n}_{i}', 'large': {'url': f'https://wx1.sinaimg.cn/large/p{n}_{i}.jpg'}}
+            kind = rng.random()
+            if kind < 0.4:
+                name = f'lp{n}_{rng.randint(0, 5)}.mov'
+                width = rng.choice([480, 720, 1080])
+                pic.update({'type': 'livephoto',
+                            'videoSrc': f'https://video.weibo.com/media/play?livephoto=//us.sinaimg.cn/{name}?template={width}x{width}&a=1'})
+            elif kind < 0.5:
+                pic.update({'type': 'video', 'videoSrc': f'https://f.video.weibocdn.com/v{n}_{i}.mp4?template=720x1280'})
+            elif kind < 0.55:
+                pic['live_photo_url'] = f'https://us.sinaimg.cn/field{n}_{i}.mov'
+            pics.append(pic)
+
+        payload = {'bid': f'SYN{n}', 'pics': pics}
+        if rng.random() < 0.2:
+            payload['page_info'] = {'type': 'video', 'media_info': {'mp4_720p_mp4': f'https://f.video.weibocdn.com/main{n}.mp4'}}
+        if rng.random() < 0.1:
+            payload['live_photo'] = [f'https://us.sinaimg.cn/root{n}.mov']
+        payloads.append(payload)
+    return payloads
+
+
+def iter_media_sources(payloads):
+    """每条微博及其转发的原微博都作为一个媒体来源"""
+    for payload in payloads:
+        yield payload
+        retweet = payload.get('retweeted_status')
+        if retweet:
+            yield retweet
+
+
+def time_it(func, sources, repeat):
+    """返回处理全部数据一遍的最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for source in sources:
+            func(source)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='媒体提取回归检查与性能对比')
+    parser.add_argument('debug_dir', nargs='?', default='debug', help='调试数据所在目录')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最短耗时')
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N', help='额外生成N条测试数据')
+    args = parser.parse_args()
+
+    payloads = list(iter_weibo_payloads(args.debug_dir))
+    payloads.extend(make_synthetic_payloads(args.synthetic))
+    sources = list(iter_media_sources(payloads))
+    if not sources:
+        print(f"{args.debug_dir} 中没有找到调试数据，可以使用 --synthetic 生成测试数据")
+        return 1
+
+    mismatches = []
+    for source in sources:
+        if legacy_extract(source) != new_extract(source):
+            mismatches.append(source.get('bid', ''))
+
+    legacy_time = time_it(legacy_extract, sources, args.repeat)
+    new_time = time_it(extract_media, sources, args.repeat)
+
+    print(json.dumps({
+        'sources': len(sources),
+        'pics': sum(len(source.get('pics') or []) for source in sources),
+        'legacy_seconds': round(legacy_time, 6),
+        'extractor_seconds': round(new_time, 6),
+        'speedup': round(legacy_time / new_time, 2) if new_time else None,
+        'mismatch': len(mismatches),
+        'mismatch_bids': mismatches[:20]
+    }, ensure_ascii=False, indent=2))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
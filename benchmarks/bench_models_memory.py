@@ -0,0 +1,94 @@
+# bench_models_memory.py - 比较字典与 lib.models 中 __slots__ 数据类的内存占用
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.bench_models_memory [--tasks N] [--posts N]
+#
+# 分别用旧的字典形式和新的数据类构造任务队列、收藏列表和解析后的微博，用 tracemalloc 统计占用
+
+import os
+import sys
+import json
+import logging
+import argparse
+import tracemalloc
+from dataclasses import fields
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.models import Task, FavoriteRef
+from lib.weibo_parser import parse_weibo_data
+from benchmarks.bench_media_extractor import make_synthetic_payloads
+
+logging.getLogger('weibo_parser').disabled = True
+
+
+def measure(build):
+    """返回 build() 构造的对象所占用的字节数"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def task_values(n):
+    """第n个任务的字段值，每次调用都生成新的字符串"""
+    return (f"https://weibo.com/{1000000000 + n}/N{n:08d}x", 'pending', '从收藏微博自动添加',
+            f"2024-01-{n % 28 + 1:02d} 12:00:00", '')
+
+
+def legacy_weibo_dict(weibo):
+    """重构前 parse_weibo_data 返回的字典形式：多值字段为逗号连接的字符串，下载任务为字典"""
+    result = {}
+    for f in fields(weibo):
+        value = getattr(weibo, f.name)
+        if f.name == 'media_jobs':
+            value = [{'kind': 'image' if job.kind == 'image' else 'video', 'url': job.url, 'user_id': job.user_id,
+                      'bid': job.bid, 'index': job.index, 'overwrite': job.overwrite} for job in value]
+        elif isinstance(value, list):
+            value = ','.join(value)
+        result[f.name] = value
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据类内存占用对比')
+    parser.add_argument('--tasks', type=int, default=40000, help='任务和收藏的条数')
+    parser.add_argument('--posts', type=int, default=2000, help='解析后微博的条数')
+    args = parser.parse_args()
+
+    columns = ['url', 'status', 'notes', 'created_at', 'completed_at']
+    payloads = make_synthetic_payloads(args.posts)
+    for n, payload in enumerate(payloads):
+        payload.update({'id': n, 'user': {'id': n, 'screen_name': f'user{n}'}, 'text': f'第{n}条 #话题#'})
+
+    report = {
+        'tasks': {
+            'count': args.tasks,
+            'dict_bytes': measure(lambda: [dict(zip(columns, task_values(n))) for n in range(args.tasks)]),
+            'slots_bytes': measure(lambda: [Task(*task_values(n)) for n in range(args.tasks)])
+        },
+        'favorites': {
+            'count': args.tasks,
+            'dict_bytes': measure(lambda: [{'url': task_values(n)[0], 'favorited_time': task_values(n)[3]}
+                                           for n in range(args.tasks)]),
+            'slots_bytes': measure(lambda: [FavoriteRef(task_values(n)[0], task_values(n)[3])
+                                            for n in range(args.tasks)])
+        },
+        'parsed_posts': {
+            'count': args.posts,
+            'dict_bytes': measure(lambda: [legacy_weibo_dict(parse_weibo_data(p, str(p['user']['id'])))
+                                           for p in payloads]),
+            'slots_bytes': measure(lambda: [parse_weibo_data(p, str(p['user']['id'])) for p in payloads])
+        }
+    }
+    for item in report.values():
+        item['saved_percent'] = round(100 * (1 - item['slots_bytes'] / item['dict_bytes']), 1)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# bench_render_data.py - 比较详情页 $render_data 的提取方式
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.bench_render_data [--fixtures DIR] [--debug-dir DEBUG] [--synthetic N] [--tail-kb 256]
+#
+# 旧方法：对整个页面做 re.DOTALL 的非贪婪匹配再 json.loads；
+# 新方法：lib.render_data 的标记查找，出现 "][0] || {};" 时由JSON解析器验证，orjson（如已安装）解析；
+# 同时统计按 16KB 分块流式读取时，解析出完整JSON前需要读取的比例
+
+import os
+import re
+import sys
+import json
+import glob
+import time
+import random
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.render_data import RenderDataScanner, extract_render_data, orjson
+from lib.weibo_api import parse_detail_html, DETAIL_CHUNK_SIZE
+from benchmarks.corpus import iter_weibo_payloads
+from benchmarks.stub_server import render_detail_html
+from benchmarks.bench_media_extractor import make_synthetic_payloads
+
+logging.getLogger('weibo_api').disabled = True
+
+LEGACY_PATTERN = r'var \$render_data = \[(.*?)\]\[0\] \|\| \{\};'
+
+
+def legacy_parse(html):
+    """重构前 get_single_weibo 的提取方式"""
+    match = re.search(LEGACY_PATTERN, html, re.DOTALL)
+    if not match:
+        return None
+    try:
+        render_data = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+    return render_data.get('status')
+
+
+def bytes_parse(html):
+    """直接处理UTF-8字节（流式读取详情页时的情况）"""
+    render_data = extract_render_data(html)
+    return render_data[0].get('status') if render_data else None
+
+
+def make_tail(size_kb, rng):
+    """详情页 $render_data 之后的其他内容（脚本、样式、评论区占位等）"""
+    parts = []
+    size = 0
+    while size < size_kb * 1024:
+        part = f'<div class="card" data-id="{rng.randint(0, 10 ** 9)}"><span>评论{rng.random()}</span></div>\n'
+        parts.append(part)
+        size += len(part)
+    return ''.join(parts)
+
+
+def make_synthetic_pages(count, tail_kb, trap_ratio=0.0, seed=0):
+    """
+    生成带长正文、字符串中含括号和转义、页面末尾有大段其他内容的详情页
+
+    trap_ratio 比例的页面在评论字符串中包含 "][0] || {};"，旧方法会在这里截断
+    """
+    rng = random.Random(seed)
+    pages = []
+    for n, status in enumerate(make_synthetic_payloads(count, seed)):
+        text = ''.join(rng.choice(['正文', '[表情]', '{"a": 1}', '\\"引号\\"', 'emoji😀', ' <a href="x">链接</a> '])
+                       for _ in range(rng.randint(20, 400)))
+        status.update({'id': str(n), 'user': {'id': n, 'screen_name': f'user{n}'}, 'text': text,
+                       'comments': [{'text': f'评论{i} [回复] {{"x": 1}} '} for i in range(rng.randint(0, 30))]})
+        if rng.random() < trap_ratio:
+            status['comments'].append({'text': '引用 ][0] || {}; 结束'})
+        html = render_detail_html(status)
+        pages.append(html.replace('</body>', make_tail(tail_kb, rng) + '</body>'))
+    return pages
+
+
+def load_pages(args):
+    pages = []
+    if args.fixtures:
+        for file_path in sorted(glob.glob(os.path.join(args.fixtures, 'detail', '*.html'))):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                pages.append(f.read())
+    if args.debug_dir:
+        pages.extend(render_detail_html(payload) for payload in iter_weibo_payloads(args.debug_dir))
+    pages.extend(make_synthetic_pages(args.synthetic, args.tail_kb, args.trap_ratio))
+    return pages
+
+
+def time_it(func, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            func(html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def streamed_fraction(pages):
+    """按分块流式读取时，解析出完整JSON前读取的字节数占页面总长度的比例"""
+    read = total = 0
+    for html in pages:
+        html = html.encode('utf-8')
+        scanner = RenderDataScanner()
+        for offset in range(0, len(html), DETAIL_CHUNK_SIZE):
+            chunk = html[offset:offset + DETAIL_CHUNK_SIZE]
+            read += len(chunk)
+            if scanner.feed(chunk):
+                break
+        total += len(html)
+    return read / total if total else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='$render_data 提取方式对比')
+    parser.add_argument('--fixtures', default=None, help='stub_server 夹具目录，使用其中的 detail/*.html')
+    parser.add_argument('--debug-dir', default=None, help='调试采集归档目录，其中的微博数据包装成详情页')
+    parser.add_argument('--synthetic', type=int, default=300, help='合成详情页的数量')
+    parser.add_argument('--tail-kb', type=int, default=256, help='合成详情页 $render_data 之后其他内容的大小（KB）')
+    parser.add_argument('--trap-ratio', type=float, default=0.05,
+                        help='评论中包含 "][0] || {};" 的合成页面比例（旧方法无法正确提取）')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数（取最短）')
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    new_results = [parse_detail_html(html) for html in pages]
+    legacy_results = [legacy_parse(html) for html in pages]
+    chunked_mismatch = 0
+    for html, expected in zip(pages, new_results):
+        # 小分块使标记和 "][0]" 被截断在两块之间
+        data = html.encode('utf-8')
+        scanner = RenderDataScanner()
+        for offset in range(0, len(data), 1000):
+            if scanner.feed(data[offset:offset + 1000]):
+                break
+        else:
+            scanner.finish()
+        if (scanner.result[0].get('status') if scanner.found else None) != expected:
+            chunked_mismatch += 1
+
+    # 只用两种方法都能提取的页面计时，旧方法提前失败的页面会让它显得更快
+    timed_pages = [html for html, result in zip(pages, legacy_results) if result is not None]
+    legacy_seconds = time_it(legacy_parse, timed_pages, args.repeat)
+    new_seconds = time_it(parse_detail_html, timed_pages, args.repeat)
+    bytes_seconds = time_it(bytes_parse, [html.encode('utf-8') for html in timed_pages], args.repeat)
+    report = {
+        'pages': len(pages),
+        'timed_pages': len(timed_pages),
+        'json_backend': 'orjson' if orjson is not None else 'json',
+        'legacy_seconds': round(legacy_seconds, 4),
+        'scanner_seconds': round(new_seconds, 4),
+        'scanner_bytes_seconds': round(bytes_seconds, 4),
+        'speedup': round(legacy_seconds / new_seconds, 2),
+        'streamed_fraction': round(streamed_fraction(pages), 3),
+        # 旧方法在字符串中出现 "][0] || {};" 时会截断JSON，这些页面只有新方法能解析
+        'legacy_failed': sum(1 for result in legacy_results if result is None),
+        'new_failed': sum(1 for result in new_results if result is None),
+        'mismatch': sum(1 for old, new in zip(legacy_results, new_results) if old is not None and old != new),
+        'chunked_mismatch': chunked_mismatch
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if not report['mismatch'] and not report['chunked_mismatch'] and not report['new_failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# bench_text_normalizer.py - 比较旧的逐段正则替换与 text_normalizer 预编译实现的耗时
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.bench_text_normalizer [debug目录] [--repeat N]
+#
+# 语料为 --debug-capture 保存的 debug/capture_*.jsonl.gz 归档，以及旧版本保存的 debug/*_data.json 中的正文和转发正文
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from urllib.parse import unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.text_normalizer import normalize_weibo_text
+from benchmarks.corpus import iter_weibo_payloads
+
+
+def legacy_normalize(text):
+    """重构前 parse_weibo_data 中的处理方式，用于对比"""
+    link_pattern = r'<a[^>]*href="([^"]*)"[^>]*>(.*?)</a>'
+
+    def replace_link(match):
+        url = match.group(1)
+        link_text = match.group(2)
+        if url.startswith('/') or 'emotion' in url or '#' in link_text:
+            return link_text
+        if 'sinaurl?u=' in url:
+            url = unquote(url.split('sinaurl?u=', 1)[1])
+        return f"[{link_text}]({url})"
+
+    text = re.sub(link_pattern, replace_link, text)
+    topics = re.findall(r'#(.*?)#', text)
+    return re.sub('<[^<]+?>', '', text).replace('\n', '').strip(), topics
+
+
+def load_corpus(debug_dir):
+    """读取debug目录下保存的微博数据，返回所有正文HTML"""
+    texts = []
+    for data in iter_weibo_payloads(debug_dir):
+        texts.append(data.get('text') or '')
+        retweet = data.get('retweeted_status') or {}
+        if retweet.get('text'):
+            texts.append(retweet['text'])
+    return texts
+
+
+def time_it(func, texts, repeat):
+    """返回处理整个语料一遍的最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='正文清理性能对比')
+    parser.add_argument('debug_dir', nargs='?', default='debug', help='调试数据所在目录')
+    parser.add_argument('--repeat', type=int, default=5, help='重复次数，取最短耗时')
+    args = parser.parse_args()
+
+    texts = load_corpus(args.debug_dir)
+    if not texts:
+        print(f"{args.debug_dir} 中没有找到调试数据")
+        return 1
+
+    # 清理后的正文必须一致；话题只在旧实现把HTML标签带进话题时不同
+    text_mismatch = sum(legacy_normalize(t)[0] != normalize_weibo_text(t)[0] for t in texts)
+
+    legacy_time = time_it(legacy_normalize, texts, args.repeat)
+    new_time = time_it(normalize_weibo_text, texts, args.repeat)
+
+    print(json.dumps({
+        'texts': len(texts),
+        'chars': sum(len(t) for t in texts),
+        'legacy_seconds': round(legacy_time, 6),
+        'normalizer_seconds': round(new_time, 6),
+        'speedup': round(legacy_time / new_time, 2) if new_time else None,
+        'text_mismatch': text_mismatch
+    }, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+# check_async_crawler.py - 在本地桩服务器上离线对比同步爬虫与 lib.async_crawler
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.check_async_crawler [--fixtures DIR] [--pages N] [--latency 0.05] [--concurrency 8]
+#                                            [--prefetch-pages 3]
+#
+# 不指定 --fixtures 时生成合成夹具（见 benchmarks/stub_server.py）。两种引擎获取同样的收藏列表和 /detail/ 详情页，
+# 同步引擎逐条获取详情页后用 parse_weibo_data 解析，与异步引擎输出的 ParsedWeibo 比较，结果不一致时以非零状态退出
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.http_client import configure_http
+from lib.rate_limiter import configure_host_limits
+from lib.favorites_crawler import FavoritesCrawler
+from lib.weibo_api import extract_ids_from_url, get_single_weibo
+from lib.weibo_parser import parse_weibo_data
+from lib.models import FavoriteRef
+from lib.async_crawler import fetch_all_favorites, fetch_weibos
+from benchmarks.stub_server import StubServer, make_synthetic_fixtures
+
+for name in ('favorites_crawler', 'async_crawler', 'weibo_api', 'weibo_parser'):
+    logging.getLogger(name).disabled = True
+
+
+def run_sync(server, max_pages, setting_path):
+    crawler = FavoritesCrawler(cookie_path=setting_path)
+    crawler.favorites_url = server.favorites_url
+
+    start = time.perf_counter()
+    favorites = crawler.get_all_favorites(max_pages=max_pages)
+    list_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = {}
+    for ref in favorites:
+        user_id, weibo_id = extract_ids_from_url(ref.url)
+        data = get_single_weibo(user_id, weibo_id, detail_url=server.detail_url)
+        results[ref.url] = parse_weibo_data(data, user_id) if data else None
+    return favorites, results, list_seconds, time.perf_counter() - start
+
+
+def run_async(server, max_pages, concurrency, prefetch_pages):
+    start = time.perf_counter()
+    favorites = fetch_all_favorites(max_pages=max_pages, favorites_url=server.favorites_url,
+                                    prefetch_pages=prefetch_pages)
+    list_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = fetch_weibos((ref.url for ref in favorites), concurrency=concurrency, detail_url=server.detail_url)
+    return favorites, results, list_seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步/异步爬虫离线对比')
+    parser.add_argument('--fixtures', default=None, help='夹具目录，默认生成合成夹具')
+    parser.add_argument('--pages', type=int, default=10, help='收藏页数（合成夹具）和最大爬取页数')
+    parser.add_argument('--latency', type=float, default=0.05, help='桩服务器每个请求的模拟延迟（秒）')
+    parser.add_argument('--concurrency', type=int, default=8, help='异步引擎的详情页并发数')
+    parser.add_argument('--prefetch-pages', type=int, default=3, help='异步引擎同时请求的收藏页数')
+    args = parser.parse_args()
+
+    # 本地服务器不需要限速
+    configure_host_limits('cdn', rate=10000, max_rate=10000)
+    configure_http(pool_maxsize=args.concurrency + args.prefetch_pages)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fixtures_dir = args.fixtures
+        if fixtures_dir is None:
+            fixtures_dir = os.path.join(temp_dir, 'fixtures')
+            make_synthetic_fixtures(fixtures_dir, pages=args.pages)
+        setting_path = os.path.join(temp_dir, 'setting.json')
+        with open(setting_path, 'w', encoding='utf-8') as f:
+            json.dump({'cookie': ''}, f)
+
+        with StubServer(fixtures_dir, latency=args.latency) as server:
+            sync_favorites, sync_results, sync_list, sync_detail = run_sync(server, args.pages, setting_path)
+            async_favorites, async_results, async_list, async_detail = run_async(
+                server, args.pages, args.concurrency, args.prefetch_pages)
+
+    favorites_match = [FavoriteRef.to_csv_row(ref) for ref in sync_favorites] == \
+                      [FavoriteRef.to_csv_row(ref) for ref in async_favorites]
+    # ParsedWeibo 是数据类，按字段比较
+    mismatches = [url for url in sync_results if sync_results[url] != async_results.get(url)]
+
+    report = {
+        'favorites': len(sync_favorites),
+        'details': len(sync_results),
+        'fetched': sum(1 for weibo in async_results.values() if weibo),
+        'latency_seconds': args.latency,
+        'concurrency': args.concurrency,
+        'prefetch_pages': args.prefetch_pages,
+        'sync': {'list_seconds': round(sync_list, 3), 'detail_seconds': round(sync_detail, 3)},
+        'async': {'list_seconds': round(async_list, 3), 'detail_seconds': round(async_detail, 3)},
+        'list_speedup': round(sync_list / async_list, 2) if async_list else None,
+        'detail_speedup': round(sync_detail / async_detail, 2) if async_detail else None,
+        'favorites_match': favorites_match,
+        'detail_mismatch': len(mismatches)
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if favorites_match and async_results and not mismatches else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+# corpus.py - 基准测试共用的语料读取
+#
+# 语料为 --debug-capture 保存的 debug/capture_*.jsonl.gz 归档，以及旧版本保存的 debug/*_data.json
+
+import os
+import sys
+import glob
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.debug_capture import iter_captures
+
+
+def iter_weibo_payloads(debug_dir):
+    """依次返回调试归档和旧版JSON文件中的原始微博数据"""
+    for record in iter_captures(debug_dir, kind='weibo'):
+        yield record['data']
+    for file_path in sorted(glob.glob(os.path.join(debug_dir, '*_data.json'))):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                yield json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
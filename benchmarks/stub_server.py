@@ -0,0 +1,286 @@
+# stub_server.py - 离线测试用的本地微博接口桩服务器
+#
+# 用法（在项目根目录下）:
+#   python -m benchmarks.stub_server --fixtures DIR [--port 8765] [--latency 0.05] [--bandwidth-kb 2048]
+#   python -m benchmarks.stub_server --fixtures DIR --record [--debug-dir DEBUG]   # 从调试采集归档生成夹具
+#   python -m benchmarks.stub_server --fixtures DIR --synthetic [--pages 10]       # 生成合成夹具
+#
+# 夹具目录结构:
+#   all_fav/page{N}.json   收藏接口第N页返回的JSON
+#   detail/{bid}.html      详情页HTML（包含 $render_data）
+#   media/{文件名}          图片/视频内容，文件名为媒体URL中的文件名（LivePhoto取 livephoto 参数中的文件名）
+#
+# 服务器提供 /ajax/favorites/all_fav?page=N 和 /detail/{bid}，不存在的页返回空收藏列表，不存在的详情页返回404；
+# 其他路径都视为媒体，没有对应夹具时返回指定大小的合成内容，支持 Range 请求。
+# 配合 lib.http_client.set_host_rewrite 使用时，所有域名的请求都由本服务器响应
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAVORITES_PATH = '/ajax/favorites/all_fav'
+DETAIL_PREFIX = '/detail/'
+EMPTY_PAGE = json.dumps({'ok': 1, 'data': []}).encode('utf-8')
+VIDEO_MARKERS = ('.mp4', '.mov', 'livephoto', 'video')
+SEND_CHUNK = 64 * 1024
+
+
+def media_name(parts):
+    """媒体URL中的文件名，LivePhoto播放链接取 livephoto 参数中的文件名"""
+    livephoto = parse_qs(parts.query).get('livephoto')
+    path = livephoto[0].split('?')[0] if livephoto else parts.path
+    return os.path.basename(path)
+
+
+def render_detail_html(status):
+    """把微博数据包装成详情页HTML"""
+    render_data = json.dumps({'status': status}, ensure_ascii=False)
+    return (f'<html><head><script>\nvar $render_data = [{render_data}][0] || {{}};\n'
+            f'var config = {{}};\n</script></head><body></body></html>')
+
+
+def write_page(fixtures_dir, page, data):
+    os.makedirs(os.path.join(fixtures_dir, 'all_fav'), exist_ok=True)
+    with open(os.path.join(fixtures_dir, 'all_fav', f'page{page}.json'), 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def write_detail(fixtures_dir, bid, status):
+    os.makedirs(os.path.join(fixtures_dir, 'detail'), exist_ok=True)
+    with open(os.path.join(fixtures_dir, 'detail', f'{bid}.html'), 'w', encoding='utf-8') as f:
+        f.write(render_detail_html(status))
+
+
+def record_fixtures(fixtures_dir, debug_dir=None):
+    """
+    从 --debug-capture 保存的归档生成夹具
+
+    Returns:
+        tuple: (收藏页数, 详情页数)
+    """
+    from lib.debug_capture import iter_captures
+
+    pages = details = 0
+    for record in iter_captures(debug_dir, kind='favorites_page'):
+        page = record['key'].replace('page', '')
+        if page.isdigit():
+            write_page(fixtures_dir, int(page), record['data'])
+            pages += 1
+    for record in iter_captures(debug_dir, kind='weibo'):
+        write_detail(fixtures_dir, record['key'], record['data'])
+        details += 1
+    return pages, details
+
+
+def make_synthetic_fixtures(fixtures_dir, pages=10, page_size=20, seed=0):
+    """
+    生成合成夹具：pages 页收藏，每条收藏都有对应的详情页
+
+    Returns:
+        list: 所有收藏微博的URL
+    """
+    from benchmarks.bench_media_extractor import make_synthetic_payloads
+
+    payloads = make_synthetic_payloads(pages * page_size, seed)
+    urls = []
+    for page in range(1, pages + 1):
+        items = []
+        for n in range((page - 1) * page_size, page * page_size):
+            user_id = 1000000000 + n
+            status = payloads[n]
+            status.update({'id': str(n), 'user': {'id': user_id, 'screen_name': f'user{n}'},
+                           'text': f'第{n}条 <a href="https://weibo.com/">链接</a> #话题{n % 7}#',
+                           'created_at': 'Sat Oct 12 10:00:00 +0800 2024'})
+            write_detail(fixtures_dir, status['bid'], status)
+            items.append({'mblogid': status['bid'], 'user': {'id': user_id},
+                          'created_at': 'Sat Oct 12 10:00:00 +0800 2024'})
+            urls.append(f"https://weibo.com/{user_id}/{status['bid']}")
+        write_page(fixtures_dir, page, {'ok': 1, 'data': items})
+    return urls
+
+
+class StubServer:
+    """
+    在后台线程中运行的桩服务器
+
+    latency 为每个请求的模拟延迟（秒），bandwidth 为每个响应的发送速率上限（字节/秒，None为不限），
+    image_size / video_size 为没有夹具时合成媒体内容的大小（字节）
+    """
+
+    def __init__(self, fixtures_dir, host='127.0.0.1', port=0, latency=0.0, bandwidth=None,
+                 image_size=200 * 1024, video_size=2 * 1024 * 1024):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.image_size = image_size
+        self.video_size = video_size
+        self.requests = 0
+        self.connections = 0
+        self.bytes_sent = 0
+        self._count_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def favorites_url(self):
+        return self.base_url + FAVORITES_PATH
+
+    @property
+    def detail_url(self):
+        return self.base_url + DETAIL_PREFIX + '{weibo_id}'
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 与真实服务器一样关闭Nagle算法，否则复用的连接上分块写出的响应会被延迟确认拖慢约40毫秒
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                # 每个TCP连接创建一个处理器，用于统计连接复用情况
+                super().setup()
+                with stub._count_lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                with stub._count_lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                parts = urlsplit(self.path)
+                if parts.path == FAVORITES_PATH:
+                    page = parse_qs(parts.query).get('page', ['1'])[0]
+                    body = stub._read(os.path.join('all_fav', f'page{page}.json')) or EMPTY_PAGE
+                    self._reply(200, body, 'application/json; charset=utf-8')
+                elif parts.path.startswith(DETAIL_PREFIX):
+                    bid = os.path.basename(parts.path[len(DETAIL_PREFIX):])
+                    body = stub._read(os.path.join('detail', f'{bid}.html'))
+                    if body is None:
+                        self._reply(404, b'not found', 'text/plain')
+                    else:
+                        self._reply(200, body, 'text/html; charset=utf-8')
+                else:
+                    self._reply_media(parts)
+
+            def _reply_media(self, parts):
+                name = media_name(parts)
+                is_video = any(marker in self.path for marker in VIDEO_MARKERS)
+                body = stub._read(os.path.join('media', name)) if name else None
+                if body is None:
+                    # 合成内容以文件名开头，不同文件的内容不同
+                    size = stub.video_size if is_video else stub.image_size
+                    body = name.encode('utf-8')[:size].ljust(size, b'\0')
+                content_type = 'video/mp4' if is_video else 'image/jpeg'
+
+                range_header = self.headers.get('Range', '')
+                if range_header.startswith('bytes=') and range_header.endswith('-'):
+                    start = int(range_header[len('bytes='):-1] or 0)
+                    if start >= len(body) and start > 0:
+                        self._reply(416, b'', content_type, {'Content-Range': f'bytes */{len(body)}'})
+                        return
+                    content_range = f'bytes {start}-{len(body) - 1}/{len(body)}'
+                    self._reply(206, body[start:], content_type, {'Content-Range': content_range})
+                    return
+                self._reply(200, body, content_type)
+
+            def _reply(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+
+                # 按带宽上限分块发送
+                view = memoryview(body)
+                for offset in range(0, len(body), SEND_CHUNK):
+                    chunk = view[offset:offset + SEND_CHUNK]
+                    self.wfile.write(chunk)
+                    if stub.bandwidth:
+                        time.sleep(len(chunk) / stub.bandwidth)
+                with stub._count_lock:
+                    stub.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _read(self, relative_path):
+        try:
+            with open(os.path.join(self.fixtures_dir, relative_path), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """在当前线程中运行，直到被中断"""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线测试用的微博接口桩服务器')
+    parser.add_argument('--fixtures', required=True, help='夹具目录')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的模拟延迟（秒）')
+    parser.add_argument('--bandwidth-kb', type=float, default=None, help='每个响应的发送速率上限（KB/s）')
+    parser.add_argument('--record', action='store_true', help='从调试采集归档生成夹具后退出')
+    parser.add_argument('--debug-dir', default=None, help='调试采集归档目录，默认为下载目录下的 debug')
+    parser.add_argument('--synthetic', action='store_true', help='生成合成夹具后退出')
+    parser.add_argument('--pages', type=int, default=10, help='合成夹具的收藏页数')
+    args = parser.parse_args()
+
+    if args.record:
+        pages, details = record_fixtures(args.fixtures, args.debug_dir)
+        print(f'已生成 {pages} 页收藏、{details} 个详情页')
+        return 0
+    if args.synthetic:
+        urls = make_synthetic_fixtures(args.fixtures, pages=args.pages)
+        print(f'已生成 {args.pages} 页收藏、{len(urls)} 个详情页')
+        return 0
+
+    bandwidth = args.bandwidth_kb * 1024 if args.bandwidth_kb else None
+    server = StubServer(args.fixtures, port=args.port, latency=args.latency, bandwidth=bandwidth)
+    print(f'桩服务器已启动: {server.base_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
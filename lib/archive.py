@@ -0,0 +1,542 @@
+import os
+import re
+import csv
+import sqlite3
+import threading
+from datetime import datetime
+
+from .fulltext import tokenize, build_match_query, query_terms, make_snippet
+from .models import ParsedWeibo
+from .path_manager import get_download_paths
+from .weibo_parser import format_created_at
+from .logger import setup_logger
+logger = setup_logger()
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS users ('
+    'user_id TEXT PRIMARY KEY, '
+    "screen_name TEXT NOT NULL DEFAULT '')",
+    'CREATE INDEX IF NOT EXISTS idx_users_screen_name ON users(screen_name)',
+
+    # bid 为原微博的BID，转发微博保存的是被转发的原微博
+    'CREATE TABLE IF NOT EXISTS posts ('
+    'bid TEXT PRIMARY KEY, '
+    "weibo_id TEXT NOT NULL DEFAULT '', "
+    "user_id TEXT NOT NULL DEFAULT '', "
+    "text TEXT NOT NULL DEFAULT '', "
+    "article_url TEXT NOT NULL DEFAULT '', "
+    "source_url TEXT NOT NULL DEFAULT '', "
+    'created_at TEXT, '
+    'favorited_at TEXT, '
+    'archived_at TEXT NOT NULL, '
+    'media_expected INTEGER)',
+    'CREATE INDEX IF NOT EXISTS idx_posts_source_url ON posts(source_url)',
+    'CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_posts_favorited_at ON posts(favorited_at)',
+
+    'CREATE TABLE IF NOT EXISTS media ('
+    'bid TEXT NOT NULL REFERENCES posts(bid) ON DELETE CASCADE, '
+    'kind TEXT NOT NULL, '
+    'position INTEGER NOT NULL, '
+    'local_path TEXT NOT NULL, '
+    'PRIMARY KEY (bid, kind, position)) WITHOUT ROWID',
+
+    'CREATE TABLE IF NOT EXISTS topics ('
+    'topic_id INTEGER PRIMARY KEY, '
+    'name TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS post_topics ('
+    'bid TEXT NOT NULL REFERENCES posts(bid) ON DELETE CASCADE, '
+    'topic_id INTEGER NOT NULL REFERENCES topics(topic_id), '
+    'PRIMARY KEY (bid, topic_id)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS idx_post_topics_topic ON post_topics(topic_id)',
+
+    # 同一条原微博可能经由多条不同的转发被收藏，每条转发单独保留
+    'CREATE TABLE IF NOT EXISTS retweets ('
+    'bid TEXT NOT NULL REFERENCES posts(bid) ON DELETE CASCADE, '
+    'retweet_source_url TEXT NOT NULL, '
+    "retweet_id TEXT NOT NULL DEFAULT '', "
+    "retweet_user_id TEXT NOT NULL DEFAULT '', "
+    "retweet_text TEXT NOT NULL DEFAULT '', "
+    'PRIMARY KEY (bid, retweet_source_url)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS idx_retweets_source_url ON retweets(retweet_source_url)',
+
+    # LLM分类结果，text_hash 为分类时正文的规范文本摘要，正文变化后可以据此重新分类
+    'CREATE TABLE IF NOT EXISTS post_categories ('
+    'bid TEXT PRIMARY KEY REFERENCES posts(bid) ON DELETE CASCADE, '
+    'category TEXT NOT NULL, '
+    'text_hash TEXT NOT NULL, '
+    'classified_at TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS idx_post_categories_category ON post_categories(category)',
+
+    # 全文索引，rowid与posts表一致，保存的是 fulltext.tokenize 切分后的词元
+    'CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5('
+    "text, retweet_text, topics, screen_name, tokenize = 'unicode61')",
+]
+
+# bm25 各列权重：正文、转发内容、话题、昵称
+FTS_WEIGHTS = (3.0, 1.0, 2.0, 2.0)
+
+
+class WeiboArchive:
+    """微博存档数据库，保存微博、用户、媒体、话题和转发关系"""
+
+    def __init__(self, db_path=None):
+        """
+        打开（必要时创建）存档数据库
+
+        Args:
+            db_path: 数据库路径，为None时使用下载目录下的 weibo.db
+        """
+        self.db_path = db_path or os.path.join(get_download_paths()['base'], 'weibo.db')
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        has_fts = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'"
+        ).fetchone() is not None
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+            # 旧的存档没有记录应有的媒体数量
+            columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(posts)')}
+            if 'media_expected' not in columns:
+                self._conn.execute('ALTER TABLE posts ADD COLUMN media_expected INTEGER')
+
+        # 旧的存档没有全文索引，首次打开时补建
+        if not has_fts:
+            self.rebuild_search_index()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _upsert_user(self, user_id, screen_name):
+        """写入或更新用户"""
+        if not user_id:
+            return
+        self._conn.execute(
+            'INSERT INTO users (user_id, screen_name) VALUES (?, ?) '
+            'ON CONFLICT(user_id) DO UPDATE SET screen_name = excluded.screen_name '
+            "WHERE excluded.screen_name != ''",
+            (str(user_id), screen_name or '')
+        )
+
+    def _save_post(self, weibo, archived_at, media_expected=None):
+        """
+        在当前事务中保存一条微博及其关联数据
+
+        media_expected 为解析时得到的媒体数量，与实际保存的媒体数量一起用于判断微博是否已完整下载；
+        从CSV导入时不知道应有的数量，为None
+        """
+        bid = weibo.bid
+        if not bid:
+            return False
+
+        user_id = str(weibo.user_id or '')
+        self._upsert_user(user_id, weibo.screen_name)
+        self._conn.execute(
+            'INSERT INTO posts (bid, weibo_id, user_id, text, article_url, source_url, created_at, archived_at, '
+            'media_expected) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(bid) DO UPDATE SET weibo_id = excluded.weibo_id, user_id = excluded.user_id, '
+            'text = excluded.text, article_url = excluded.article_url, source_url = excluded.source_url, '
+            'created_at = COALESCE(excluded.created_at, posts.created_at), archived_at = excluded.archived_at, '
+            'media_expected = COALESCE(excluded.media_expected, posts.media_expected)',
+            (bid, str(weibo.id or ''), user_id, weibo.text, weibo.article_url,
+             weibo.source_url, weibo.created_at or None, archived_at, media_expected)
+        )
+
+        self._conn.execute('DELETE FROM media WHERE bid = ?', (bid,))
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO media (bid, kind, position, local_path) VALUES (?, ?, ?, ?)',
+            [(bid, kind, position, path)
+             for kind, paths in (('image', weibo.pics), ('video', weibo.videos))
+             for position, path in enumerate(paths, 1)]
+        )
+
+        self._conn.execute('DELETE FROM post_topics WHERE bid = ?', (bid,))
+        for name in dict.fromkeys(weibo.topics):
+            self._conn.execute('INSERT OR IGNORE INTO topics (name) VALUES (?)', (name,))
+            self._conn.execute(
+                'INSERT OR IGNORE INTO post_topics (bid, topic_id) '
+                'SELECT ?, topic_id FROM topics WHERE name = ?',
+                (bid, name)
+            )
+
+        retweet_source_url = weibo.retweet_source_url
+        if retweet_source_url:
+            retweet_user_id = str(weibo.retweet_user_id or '')
+            self._upsert_user(retweet_user_id, weibo.retweet_screen_name)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO retweets (bid, retweet_source_url, retweet_id, retweet_user_id, retweet_text) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (bid, retweet_source_url, str(weibo.retweet_id or ''), retweet_user_id,
+                 weibo.retweet_text)
+            )
+
+        self._index_post(bid)
+        return True
+
+    def _index_post(self, bid):
+        """在当前事务中更新一条微博的全文索引"""
+        row = self._conn.execute(
+            'SELECT posts.rowid, posts.text, users.screen_name FROM posts LEFT JOIN users ON posts.user_id = users.user_id '
+            'WHERE posts.bid = ?', (bid,)
+        ).fetchone()
+        retweet_texts = [r[0] for r in self._conn.execute('SELECT retweet_text FROM retweets WHERE bid = ?', (bid,))]
+        topics = [r[0] for r in self._conn.execute(
+            'SELECT topics.name FROM post_topics JOIN topics ON post_topics.topic_id = topics.topic_id '
+            'WHERE post_topics.bid = ?', (bid,)
+        )]
+
+        self._conn.execute('DELETE FROM posts_fts WHERE rowid = ?', (row['rowid'],))
+        self._conn.execute(
+            'INSERT INTO posts_fts (rowid, text, retweet_text, topics, screen_name) VALUES (?, ?, ?, ?, ?)',
+            (row['rowid'], tokenize(row['text']), tokenize(' '.join(retweet_texts)), tokenize(' '.join(topics)),
+             tokenize(row['screen_name']))
+        )
+
+    def rebuild_search_index(self):
+        """
+        重建全文索引
+
+        Returns:
+            int: 建立索引的微博条数
+        """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM posts_fts')
+            bids = [row[0] for row in self._conn.execute('SELECT bid FROM posts')]
+            for bid in bids:
+                self._index_post(bid)
+        if bids:
+            logger.info(f"已重建全文索引: {len(bids)} 条微博")
+        return len(bids)
+
+    def search(self, query, limit=20, offset=0):
+        """
+        全文搜索微博正文、转发内容、话题和昵称，按相关度排序
+
+        Args:
+            query: 关键词，多个关键词用空格分隔，需全部匹配
+            limit: 每页条数
+            offset: 跳过条数
+
+        Returns:
+            dict: {'total': 匹配总数, 'results': [{'bid', 'screen_name', 'source_url', 'created_at', 'snippet', 'score'}]}
+        """
+        match = build_match_query(query)
+        if not match:
+            return {'total': 0, 'results': []}
+
+        weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+        with self._lock:
+            total = self._conn.execute(
+                'SELECT COUNT(*) FROM posts_fts WHERE posts_fts MATCH ?', (match,)
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f'SELECT posts.bid, users.screen_name, posts.source_url, posts.created_at, posts.text, '
+                f'bm25(posts_fts, {weights}) AS score '
+                'FROM posts_fts JOIN posts ON posts.rowid = posts_fts.rowid '
+                'LEFT JOIN users ON posts.user_id = users.user_id '
+                'WHERE posts_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?',
+                (match, limit, offset)
+            ).fetchall()
+
+            terms = query_terms(query)
+            results = []
+            for row in rows:
+                snippet = make_snippet(row['text'], terms)
+                if snippet is None:
+                    retweet_texts = [r[0] for r in self._conn.execute(
+                        'SELECT retweet_text FROM retweets WHERE bid = ?', (row['bid'],)
+                    )]
+                    snippet = make_snippet(' '.join(retweet_texts), terms) or row['text'][:60]
+                results.append({
+                    'bid': row['bid'],
+                    'screen_name': row['screen_name'],
+                    'source_url': row['source_url'],
+                    'created_at': row['created_at'],
+                    'snippet': snippet,
+                    'score': -row['score']
+                })
+
+        return {'total': total, 'results': results}
+
+    def save_post(self, weibo):
+        """
+        保存一条解析后的微博，已存在时更新
+
+        Args:
+            weibo: parse_weibo_data 返回的微博数据（ParsedWeibo）
+
+        Returns:
+            bool: 保存是否成功
+        """
+        try:
+            with self._lock, self._conn:
+                return self._save_post(weibo, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                       media_expected=len(weibo.media_jobs))
+        except Exception as e:
+            logger.error(f"保存微博到存档失败: {e}")
+            return False
+
+    def has_bid(self, bid):
+        """判断微博是否已存档"""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM posts WHERE bid = ?', (bid,)).fetchone() is not None
+
+    def has_url(self, url):
+        """判断微博链接（原微博或收藏的转发微博）是否已存档"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM posts WHERE source_url = ? '
+                'UNION ALL SELECT 1 FROM retweets WHERE retweet_source_url = ? LIMIT 1',
+                (url, url)
+            ).fetchone()
+        return row is not None
+
+    def load_manifest(self):
+        """
+        读取全部已存档微博的链接和媒体文件，用于在请求网络之前判断任务是否已完成
+
+        Returns:
+            tuple: (links, media)
+                links: {链接中的BID: 存档中的BID}，转发微博的链接指向被转发的原微博
+                media: {存档中的BID: (应有的媒体数量或None, [媒体相对路径])}
+        """
+        links = {}
+        media = {}
+        with self._lock:
+            for row in self._conn.execute('SELECT bid, source_url, media_expected FROM posts'):
+                media[row['bid']] = (row['media_expected'], [])
+                if row['source_url']:
+                    links[row['source_url'].rstrip('/').rsplit('/', 1)[-1]] = row['bid']
+            for row in self._conn.execute('SELECT bid, retweet_source_url FROM retweets'):
+                links[row['retweet_source_url'].rstrip('/').rsplit('/', 1)[-1]] = row['bid']
+            for row in self._conn.execute('SELECT bid, local_path FROM media'):
+                if row['bid'] in media:
+                    media[row['bid']][1].append(row['local_path'])
+        return links, media
+
+    def iter_post_texts(self, batch_size=1000):
+        """
+        按BID顺序分批读取全部微博的正文，用于分类等批量处理
+
+        Args:
+            batch_size: 每批条数
+
+        Yields:
+            list: [(bid, 正文)]
+        """
+        last_bid = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT bid, text FROM posts WHERE bid > ? ORDER BY bid LIMIT ?', (last_bid, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_bid = rows[-1]['bid']
+            yield [(row['bid'], row['text']) for row in rows]
+
+    def save_categories(self, results):
+        """
+        保存分类结果
+
+        Args:
+            results: {bid: (类别, 文本摘要)}
+
+        Returns:
+            int: 保存的条数
+        """
+        classified_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO post_categories (bid, category, text_hash, classified_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(bid) DO UPDATE SET category = excluded.category, text_hash = excluded.text_hash, '
+                'classified_at = excluded.classified_at',
+                [(bid, category, text_hash, classified_at) for bid, (category, text_hash) in results.items()]
+            )
+        return len(results)
+
+    def get_categories(self):
+        """
+        全部分类结果
+
+        Returns:
+            dict: bid -> 类别
+        """
+        with self._lock:
+            return dict(self._conn.execute('SELECT bid, category FROM post_categories').fetchall())
+
+    def category_counts(self):
+        """
+        各类别的微博数量
+
+        Returns:
+            dict: 类别 -> 数量，按数量降序
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT category, COUNT(*) FROM post_categories GROUP BY category ORDER BY COUNT(*) DESC'
+            ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def _query_posts(self, where='', params=(), order_by='created_at', limit=None, offset=0):
+        """按条件查询微博，附带用户昵称、媒体和话题"""
+        if order_by not in ('created_at', 'favorited_at', 'archived_at'):
+            raise ValueError(f"不支持的排序字段: {order_by}")
+
+        sql = ('SELECT posts.bid, posts.weibo_id, posts.user_id, users.screen_name, posts.text, posts.article_url, '
+               'posts.source_url, posts.created_at, posts.favorited_at, posts.archived_at '
+               'FROM posts LEFT JOIN users ON posts.user_id = users.user_id '
+               f'{where} ORDER BY posts.{order_by} DESC')
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params = tuple(params) + (limit, offset)
+
+        with self._lock:
+            posts = [dict(row) for row in self._conn.execute(sql, params)]
+            for post in posts:
+                media = self._conn.execute(
+                    'SELECT kind, local_path FROM media WHERE bid = ? ORDER BY kind, position', (post['bid'],)
+                ).fetchall()
+                post['pics'] = [row['local_path'] for row in media if row['kind'] == 'image']
+                post['videos'] = [row['local_path'] for row in media if row['kind'] == 'video']
+                post['topics'] = [row[0] for row in self._conn.execute(
+                    'SELECT topics.name FROM post_topics JOIN topics ON post_topics.topic_id = topics.topic_id '
+                    'WHERE post_topics.bid = ?', (post['bid'],)
+                )]
+        return posts
+
+    def get_post(self, bid):
+        """
+        按BID获取微博
+
+        Returns:
+            dict: 微博数据，不存在时返回None
+        """
+        posts = self._query_posts('WHERE posts.bid = ?', (bid,))
+        return posts[0] if posts else None
+
+    def get_posts_by_screen_name(self, screen_name, limit=100, offset=0):
+        """获取某个用户的全部存档微博，按发布时间倒序"""
+        return self._query_posts(
+            'WHERE posts.user_id IN (SELECT user_id FROM users WHERE screen_name = ?)',
+            (screen_name,), limit=limit, offset=offset
+        )
+
+    def get_posts_by_topic(self, topic, limit=100, offset=0):
+        """获取某个话题下的存档微博，按发布时间倒序"""
+        return self._query_posts(
+            'WHERE posts.bid IN (SELECT post_topics.bid FROM post_topics JOIN topics '
+            'ON post_topics.topic_id = topics.topic_id WHERE topics.name = ?)',
+            (topic,), limit=limit, offset=offset
+        )
+
+    def get_posts_by_category(self, category, limit=100, offset=0):
+        """获取某个分类下的存档微博，按发布时间倒序"""
+        return self._query_posts(
+            'WHERE posts.bid IN (SELECT bid FROM post_categories WHERE category = ?)',
+            (category,), limit=limit, offset=offset
+        )
+
+    def get_posts_between(self, start=None, end=None, field='created_at', limit=100, offset=0):
+        """
+        按时间范围获取微博
+
+        Args:
+            start: 起始时间（含），'YYYY-MM-DD HH:MM:SS' 格式，None表示不限
+            end: 结束时间（不含），None表示不限
+            field: 'created_at'（发布时间）、'favorited_at'（收藏时间）或 'archived_at'（存档时间）
+            limit: 返回条数
+            offset: 跳过条数
+        """
+        conditions, params = [], []
+        if start:
+            conditions.append(f'posts.{field} >= ?')
+            params.append(start)
+        if end:
+            conditions.append(f'posts.{field} < ?')
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return self._query_posts(where, params, order_by=field, limit=limit, offset=offset)
+
+    def set_favorited_time(self, url, favorited_at):
+        """
+        记录收藏时间，url可以是原微博链接或收藏的转发微博链接
+
+        Returns:
+            bool: 是否找到对应的微博
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'UPDATE posts SET favorited_at = ? WHERE source_url = ? '
+                'OR bid IN (SELECT bid FROM retweets WHERE retweet_source_url = ?)',
+                (favorited_at, url, url)
+            )
+        return cursor.rowcount > 0
+
+    def import_csv_dir(self, weibo_dir=None, batch_size=1000):
+        """
+        将 weibo 目录下的每日CSV（YYYYMMDD.csv）逐行导入存档，每 batch_size 条提交一次
+
+        Args:
+            weibo_dir: CSV所在目录，为None时使用下载目录下的 weibo 目录
+            batch_size: 每个事务导入的条数
+
+        Returns:
+            int: 导入的微博条数
+        """
+        weibo_dir = weibo_dir or get_download_paths()['weibo']
+        file_names = sorted(name for name in os.listdir(weibo_dir) if re.fullmatch(r'\d{8}\.csv', name))
+
+        total = 0
+        for file_name in file_names:
+            archived_at = datetime.strptime(file_name[:8], '%Y%m%d').strftime('%Y-%m-%d %H:%M:%S')
+            count = 0
+            with open(os.path.join(weibo_dir, file_name), 'r', encoding='utf-8-sig', newline='') as f:
+                reader = csv.DictReader(f)
+                while True:
+                    with self._lock, self._conn:
+                        imported = 0
+                        for row in reader:
+                            if self._save_post(ParsedWeibo.from_csv_row(row), archived_at):
+                                count += 1
+                            imported += 1
+                            if imported >= batch_size:
+                                break
+                    if imported < batch_size:
+                        break
+            logger.info(f"已导入 {file_name}: {count} 条微博")
+            total += count
+
+        logger.info(f"存档导入完成，共 {total} 条微博")
+        return total
+
+    def import_favorites_csv(self, file_path):
+        """
+        从收藏列表CSV（favorites_*.csv）导入收藏时间
+
+        Returns:
+            int: 更新的微博条数
+        """
+        updated = 0
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                if row.get('url') and row.get('favorited_time'):
+                    updated += self.set_favorited_time(row['url'], format_created_at(row['favorited_time']))
+        logger.info(f"已从 {file_path} 更新 {updated} 条微博的收藏时间")
+        return updated
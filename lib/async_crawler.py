@@ -0,0 +1,262 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .http_client import http_get
+from .favorites_crawler import FAVORITES_URL, FavoritesCrawler, unwrap_favorites
+from .weibo_api import DETAIL_URL, extract_ids_from_url, get_single_weibo
+from .weibo_parser import parse_weibo_data
+from .debug_capture import capture_debug
+from .metrics import span
+from .logger import setup_logger
+logger = setup_logger()
+
+
+def _fetch_favorites_page(url, page, count, timeout):
+    """在线程池中请求一页收藏并解码JSON，返回 (状态码, 数据)"""
+    response = http_get(url, params={'page': page, 'count': count}, timeout=timeout)
+    if response.status_code != 200:
+        return response.status_code, None
+    return response.status_code, response.json()
+
+
+class AsyncWeiboCrawler:
+    """
+    基于asyncio的收藏列表和详情页爬取引擎，接口与 FavoritesCrawler / get_single_weibo 对应
+
+    请求仍通过共享的HTTP客户端发送，连接池、cookie和按host限速都与同步代码相同；
+    阻塞的请求和解码放在线程池中执行。处理当前页收藏时后面 prefetch_pages - 1 页已经在请求，
+    详情页由信号量限制同时进行的请求数，返回的数据直接交给 parse_weibo_data 解析为 ParsedWeibo
+    """
+
+    def __init__(self, concurrency=8, favorites_url=FAVORITES_URL, detail_url=DETAIL_URL, page_size=20,
+                 timeout=10, prefetch_pages=3):
+        """
+        Args:
+            concurrency: 同时进行的详情页请求数
+            favorites_url: 收藏接口地址
+            detail_url: 详情页地址模板，包含 {weibo_id}
+            page_size: 每页收藏数
+            timeout: 单个请求的超时秒数
+            prefetch_pages: 同时在请求的收藏页数，到达末尾时最多多请求 prefetch_pages - 1 页
+        """
+        self.concurrency = max(concurrency, 1)
+        self.favorites_url = favorites_url
+        self.detail_url = detail_url
+        self.page_size = page_size
+        self.timeout = timeout
+        self.prefetch_pages = max(prefetch_pages, 1)
+        self._executor = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """关闭线程池，未开始的请求被取消"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
+
+    async def _run(self, func, *args, **kwargs):
+        """在线程池中执行阻塞函数"""
+        if self._executor is None:
+            # 详情页并发数之外再留出收藏列表预取的线程
+            self._executor = ThreadPoolExecutor(self.concurrency + self.prefetch_pages,
+                                                thread_name_prefix='async_crawler')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def get_favorites(self, page=1, count=None):
+        """
+        获取一页收藏微博
+
+        Args:
+            page: 页码
+            count: 每页条数，为None时使用 page_size
+
+        Returns:
+            list: 接口返回的收藏项列表，请求失败时返回None，与真正的空页区分
+        """
+        try:
+            with span('favorites_page'):
+                status_code, data = await self._run(_fetch_favorites_page, self.favorites_url, page,
+                                                    count or self.page_size, self.timeout)
+        except Exception as e:
+            logger.error(f"获取收藏微博时发生错误: {e}")
+            return None
+
+        if data is None:
+            logger.error(f"获取收藏微博失败，状态码: {status_code}")
+            return None
+        # 启用调试采集时保存API返回的数据结构
+        capture_debug('favorites_page', f"page{page}", data)
+        return unwrap_favorites(data)
+
+    async def get_all_favorites(self, max_pages=5):
+        """
+        获取所有收藏微博的URL，处理当前页时后面几页的请求已经发出
+
+        Args:
+            max_pages: 最大爬取页数
+
+        Returns:
+            list: FavoriteRef 列表
+        """
+        all_favorites = []
+        pending = deque()
+        next_page = 1
+
+        try:
+            for page in range(1, max_pages + 1):
+                # 保持 prefetch_pages 页在请求中，收藏列表按页码访问，各页互不依赖
+                while len(pending) < self.prefetch_pages and next_page <= max_pages:
+                    pending.append(asyncio.ensure_future(self.get_favorites(page=next_page)))
+                    next_page += 1
+
+                logger.info(f"正在获取第 {page} 页收藏微博...")
+                favorites = await pending.popleft()
+
+                if favorites is None:
+                    logger.warning(f"第 {page} 页获取失败，停止获取")
+                    break
+                if not favorites:
+                    logger.warning(f"第 {page} 页没有收藏微博数据，停止获取")
+                    break
+
+                parsed_data = FavoritesCrawler.parse_favorites(favorites)
+                if parsed_data:
+                    all_favorites.extend(parsed_data)
+                    logger.info(f"成功解析第 {page} 页，获取到 {len(parsed_data)} 条收藏微博")
+                else:
+                    logger.warning(f"第 {page} 页解析结果为空")
+        finally:
+            # 已经到达末尾时，预取的后面几页不再需要
+            for future in pending:
+                future.cancel()
+
+        logger.info(f"总共获取到 {len(all_favorites)} 条收藏微博")
+        return all_favorites
+
+    async def get_single_weibo(self, user_id, weibo_id):
+        """
+        获取单条微博的原始数据，同时进行的请求数不超过 concurrency
+
+        Args:
+            user_id: 用户ID
+            weibo_id: 微博BID
+
+        Returns:
+            dict: 微博数据，失败时返回None
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await self._run(get_single_weibo, user_id, weibo_id, detail_url=self.detail_url)
+
+    async def get_weibo(self, url, overwrite_pics=False, overwrite_videos=False):
+        """
+        获取并解析微博链接对应的微博
+
+        Args:
+            url: 微博链接
+            overwrite_pics: 是否覆盖已下载的图片
+            overwrite_videos: 是否覆盖已下载的视频
+
+        Returns:
+            ParsedWeibo: 解析后的微博数据，获取或解析失败时返回None
+        """
+        user_id, weibo_id = extract_ids_from_url(url)
+        if not user_id or not weibo_id:
+            logger.error(f"无法从URL中提取用户ID和微博ID: {url}")
+            return None
+        weibo_data = await self.get_single_weibo(user_id, weibo_id)
+        if not weibo_data:
+            return None
+        return parse_weibo_data(weibo_data, user_id, overwrite_pics=overwrite_pics,
+                                overwrite_videos=overwrite_videos)
+
+    async def iter_weibos(self, urls, **parse_kwargs):
+        """
+        并发获取并解析多条微博，按完成顺序产出结果
+
+        同时创建的请求不超过 concurrency 的两倍，urls 可以是很长的迭代器
+
+        Args:
+            urls: 微博链接的可迭代对象
+            **parse_kwargs: 传给 get_weibo 的 overwrite_pics / overwrite_videos
+
+        Yields:
+            tuple: (url, ParsedWeibo)，失败时为None
+        """
+        urls = iter(urls)
+        pending = set()
+
+        async def fetch(url):
+            return url, await self.get_weibo(url, **parse_kwargs)
+
+        def fill():
+            for url in urls:
+                pending.add(asyncio.ensure_future(fetch(url)))
+                if len(pending) >= self.concurrency * 2:
+                    return
+
+        fill()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                fill()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def fetch_all_favorites(max_pages=5, **kwargs):
+    """
+    同步调用入口：用 AsyncWeiboCrawler 获取所有收藏微博的URL
+
+    Args:
+        max_pages: 最大爬取页数
+        **kwargs: 传给 AsyncWeiboCrawler 的参数
+
+    Returns:
+        list: FavoriteRef 列表
+    """
+    async def run():
+        async with AsyncWeiboCrawler(**kwargs) as crawler:
+            return await crawler.get_all_favorites(max_pages=max_pages)
+    return asyncio.run(run())
+
+
+def fetch_weibos(urls, overwrite_pics=False, overwrite_videos=False, **kwargs):
+    """
+    同步调用入口：并发获取并解析多条微博
+
+    Args:
+        urls: 微博链接的可迭代对象
+        overwrite_pics: 是否覆盖已下载的图片
+        overwrite_videos: 是否覆盖已下载的视频
+        **kwargs: 传给 AsyncWeiboCrawler 的参数
+
+    Returns:
+        dict: url -> ParsedWeibo（失败时为None），顺序与 urls 相同
+    """
+    urls = list(urls)
+
+    async def run():
+        results = {}
+        async with AsyncWeiboCrawler(**kwargs) as crawler:
+            async for url, weibo in crawler.iter_weibos(urls, overwrite_pics=overwrite_pics,
+                                                        overwrite_videos=overwrite_videos):
+                results[url] = weibo
+        return results
+
+    results = asyncio.run(run())
+    return {url: results.get(url) for url in urls}
@@ -0,0 +1,425 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .http_client import http_post
+from .path_manager import get_download_paths
+from .text_normalizer import canonical_text
+from .metrics import inc, span
+from .logger import setup_logger
+logger = setup_logger()
+
+DEFAULT_CATEGORIES = ['新闻时事', '科技数码', '知识学习', '生活日常', '娱乐八卦', '美食旅行', '体育', '财经', '其他']
+
+# 修改提示词模板后需要递增，旧的缓存结果随之失效
+PROMPT_VERSION = 1
+
+PROMPT_TEMPLATE = """请将下面每条微博归入以下类别之一：{categories}
+
+只输出一个JSON对象，键为微博编号，值为类别名称，例如 {{"1": "{example}"}}，不要输出其他内容。
+
+{posts}"""
+
+# 估算token数：中日韩文字约每字一个token，其他字符约每4个一个
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+_JSON_OBJECT_PATTERN = re.compile(r'\{.*\}', re.DOTALL)
+
+# 每条微博在提示词中的编号、换行，以及输出中的键、类别名称和标点
+ITEM_PROMPT_OVERHEAD = 4
+ITEM_OUTPUT_TOKENS = 10
+
+
+def estimate_tokens(text):
+    """
+    粗略估算文本的token数，用于按预算打包，不依赖具体模型的分词器
+
+    Args:
+        text: 文本
+
+    Returns:
+        int: 估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ClassificationProvider:
+    """
+    分类服务的接口：一次请求对多条文本分类
+
+    子类实现 classify_batch，返回与输入等长的类别列表；请求失败或返回格式不对时抛出异常，
+    由 BatchClassifier 拆分批次重试
+    """
+
+    name = 'base'
+
+    @property
+    def cache_key(self):
+        """区分不同服务/模型的缓存键，结果不同的配置不能共用缓存"""
+        return self.name
+
+    def classify_batch(self, texts, categories):
+        """
+        Args:
+            texts: 待分类的文本列表
+            categories: 可选类别列表
+
+        Returns:
+            list: 每条文本的类别
+        """
+        raise NotImplementedError
+
+
+class FakeProvider(ClassificationProvider):
+    """
+    本地的确定性分类，用于离线测试和基准测试
+
+    文本中出现类别名称时归入该类别，否则按规范文本的摘要选择，相同内容的结果总是相同；可以模拟每次请求的延迟
+    """
+
+    name = 'fake'
+
+    def __init__(self, delay=0.0, per_item_delay=0.0):
+        """
+        Args:
+            delay: 每次请求的固定延迟（秒）
+            per_item_delay: 每条文本增加的延迟（秒）
+        """
+        self.delay = delay
+        self.per_item_delay = per_item_delay
+        self.requests = 0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def classify_batch(self, texts, categories):
+        with self._lock:
+            self.requests += 1
+            self.items += len(texts)
+        if self.delay or self.per_item_delay:
+            time.sleep(self.delay + self.per_item_delay * len(texts))
+
+        labels = []
+        for text in texts:
+            label = next((category for category in categories if category in text), None)
+            if label is None:
+                digest = hashlib.sha1(canonical_text(text).encode('utf-8')).digest()
+                label = categories[int.from_bytes(digest[:4], 'big') % len(categories)]
+            labels.append(label)
+        return labels
+
+
+class OpenAICompatibleProvider(ClassificationProvider):
+    """
+    OpenAI兼容的 chat/completions 接口（OpenAI、DeepSeek、通义千问兼容模式、本地的 vLLM/Ollama 等）
+
+    请求经共享HTTP客户端发送，按host限速，429/5xx时自动降速
+    """
+
+    name = 'openai'
+
+    def __init__(self, base_url=None, api_key=None, model=None, timeout=60, temperature=0):
+        """
+        Args:
+            base_url: 接口地址，如 https://api.openai.com/v1，为None时读取环境变量 LLM_BASE_URL
+            api_key: API密钥，为None时读取环境变量 LLM_API_KEY
+            model: 模型名称，为None时读取环境变量 LLM_MODEL
+            timeout: 单次请求的超时秒数
+            temperature: 采样温度，分类时使用0以便结果稳定
+        """
+        self.base_url = (base_url or os.environ.get('LLM_BASE_URL') or 'https://api.openai.com/v1').rstrip('/')
+        self.api_key = api_key or os.environ.get('LLM_API_KEY', '')
+        self.model = model or os.environ.get('LLM_MODEL') or 'gpt-4o-mini'
+        self.timeout = timeout
+        self.temperature = temperature
+
+    @property
+    def cache_key(self):
+        return f"{self.name}:{self.model}"
+
+    def classify_batch(self, texts, categories):
+        prompt = build_prompt(texts, categories)
+        headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+        response = http_post(f"{self.base_url}/chat/completions", headers=headers, timeout=self.timeout, json={
+            'model': self.model,
+            'temperature': self.temperature,
+            'messages': [{'role': 'user', 'content': prompt}]
+        })
+        response.raise_for_status()
+        content = response.json()['choices'][0]['message']['content']
+        return parse_labels(content, len(texts))
+
+
+PROVIDERS = {
+    'fake': FakeProvider,
+    'openai': OpenAICompatibleProvider,
+}
+
+
+def register_provider(name, provider_class):
+    """
+    注册分类服务，之后可以用 make_provider(name) 创建
+
+    Args:
+        name: 名称
+        provider_class: ClassificationProvider 的子类
+    """
+    PROVIDERS[name] = provider_class
+
+
+def make_provider(name, **kwargs):
+    """
+    按名称创建分类服务
+
+    Args:
+        name: 已注册的名称
+        **kwargs: 传给服务构造函数的参数
+
+    Returns:
+        ClassificationProvider: 分类服务
+    """
+    if name not in PROVIDERS:
+        raise ValueError(f"不支持的分类服务: {name}，可选: {', '.join(PROVIDERS)}")
+    return PROVIDERS[name](**kwargs)
+
+
+def build_prompt(texts, categories):
+    """把多条文本按编号打包进一个提示词"""
+    posts = '\n'.join(f"{i}. {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+    return PROMPT_TEMPLATE.format(categories='、'.join(categories), example=categories[0], posts=posts)
+
+
+def parse_labels(content, count):
+    """
+    解析模型返回的 {"编号": "类别"} 对象
+
+    Args:
+        content: 模型输出的文本，允许JSON前后有说明文字或代码块标记
+        count: 应有的条数
+
+    Returns:
+        list: 按编号排列的类别，缺少的编号为None
+    """
+    match = _JSON_OBJECT_PATTERN.search(content or '')
+    if not match:
+        raise ValueError("模型输出中没有JSON对象")
+    data = json.loads(match.group(0))
+    if not isinstance(data, dict):
+        raise ValueError("模型输出的JSON不是对象")
+    return [data.get(str(i)) for i in range(1, count + 1)]
+
+
+class ClassificationCache:
+    """分类结果缓存，以规范文本的摘要和分类方案为键，转发和重复运行不再请求"""
+
+    def __init__(self, db_path=None):
+        """
+        Args:
+            db_path: 数据库路径，为None时使用下载目录下的 classify_cache.db
+        """
+        self.db_path = db_path or os.path.join(get_download_paths()['base'], 'classify_cache.db')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS labels ('
+                'text_hash TEXT NOT NULL, '
+                'scheme TEXT NOT NULL, '
+                'label TEXT NOT NULL, '
+                'created_at TEXT NOT NULL, '
+                'PRIMARY KEY (text_hash, scheme)) WITHOUT ROWID'
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_many(self, hashes, scheme, chunk_size=500):
+        """
+        批量查询缓存
+
+        Args:
+            hashes: 文本摘要列表
+            scheme: 分类方案
+            chunk_size: 每条查询语句的参数个数
+
+        Returns:
+            dict: 摘要 -> 类别，只包含命中的摘要
+        """
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), chunk_size):
+                chunk = hashes[i:i + chunk_size]
+                placeholders = ', '.join('?' * len(chunk))
+                found.update(self._conn.execute(
+                    f'SELECT text_hash, label FROM labels WHERE scheme = ? AND text_hash IN ({placeholders})',
+                    [scheme] + chunk
+                ).fetchall())
+        return found
+
+    def put_many(self, labels, scheme):
+        """
+        写入分类结果
+
+        Args:
+            labels: 摘要 -> 类别
+            scheme: 分类方案
+        """
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO labels (text_hash, scheme, label, created_at) VALUES (?, ?, ?, ?)',
+                [(text_hash, scheme, label, created_at) for text_hash, label in labels.items()]
+            )
+
+
+class BatchClassifier:
+    """
+    批量分类：相同内容只分类一次，已缓存的不再请求，其余按token预算打包成批次并发请求
+
+    批次失败（请求出错、返回条数或类别不对）时拆成两半重试，单条仍失败的跳过，不影响其他批次
+    """
+
+    def __init__(self, provider, categories=None, cache=None, token_budget=3000, max_batch=50,
+                 concurrency=4, max_item_chars=500):
+        """
+        Args:
+            provider: ClassificationProvider
+            categories: 类别列表，为None时使用 DEFAULT_CATEGORIES
+            cache: ClassificationCache，为None时不缓存
+            token_budget: 每个请求（提示词加输出）的估算token上限
+            max_batch: 每个请求最多包含的文本数
+            concurrency: 同时进行的请求数
+            max_item_chars: 每条文本截取的最大字符数，分类不需要长文的全部内容
+        """
+        self.provider = provider
+        self.categories = list(categories or DEFAULT_CATEGORIES)
+        self.cache = cache
+        self.token_budget = token_budget
+        self.max_batch = max(max_batch, 1)
+        self.concurrency = max(concurrency, 1)
+        self.max_item_chars = max_item_chars
+        self._category_set = set(self.categories)
+        self._base_tokens = estimate_tokens(build_prompt([], self.categories))
+        self.scheme = hashlib.sha1(json.dumps(
+            [provider.cache_key, PROMPT_VERSION, self.categories], ensure_ascii=False
+        ).encode('utf-8')).hexdigest()[:16]
+
+    def make_batches(self, texts):
+        """
+        按token预算和条数上限把文本打包成批次，超出预算的单条文本单独成批
+
+        Args:
+            texts: [(文本摘要, 截取后的文本)]
+
+        Returns:
+            list: 批次列表，每个批次为 [(文本摘要, 文本)]
+        """
+        batches = []
+        batch, used = [], self._base_tokens
+        for text_hash, text in texts:
+            cost = estimate_tokens(text) + ITEM_PROMPT_OVERHEAD + ITEM_OUTPUT_TOKENS
+            if batch and (used + cost > self.token_budget or len(batch) >= self.max_batch):
+                batches.append(batch)
+                batch, used = [], self._base_tokens
+            batch.append((text_hash, text))
+            used += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _classify_batch(self, batch):
+        """请求一个批次，失败时拆分重试，返回 摘要 -> 类别"""
+        try:
+            with span('classify_batch'):
+                labels = self.provider.classify_batch([text for _, text in batch], self.categories)
+            inc('classify_requests')
+            if len(labels) != len(batch):
+                raise ValueError(f"返回 {len(labels)} 条结果，应为 {len(batch)} 条")
+            results = {text_hash: label for (text_hash, _), label in zip(batch, labels) if label in self._category_set}
+            if len(results) == len(batch):
+                return results
+            if len(batch) == 1:
+                raise ValueError(f"返回了不在类别列表中的结果: {labels[0]}")
+            # 部分结果无效时只重试无效的部分
+            retry = [item for item in batch if item[0] not in results]
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"分类失败，已跳过: {e}")
+                inc('classify_failed')
+                return {}
+            logger.warning(f"{len(batch)} 条的批次分类失败，拆分后重试: {e}")
+            results, retry = {}, batch
+
+        middle = (len(retry) + 1) // 2
+        for part in (retry[:middle], retry[middle:]):
+            if part:
+                results.update(self._classify_batch(part))
+        return results
+
+    def classify(self, items):
+        """
+        对多条微博分类
+
+        Args:
+            items: (键, 文本) 的可迭代对象，键通常为微博BID
+
+        Returns:
+            dict: 键 -> (类别, 文本摘要)，分类失败或文本为空的键不在其中
+        """
+        keys_by_hash = {}
+        texts = {}
+        for key, text in items:
+            normalized = canonical_text(text)
+            if not normalized:
+                continue
+            text_hash = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+            keys_by_hash.setdefault(text_hash, []).append(key)
+            if text_hash not in texts:
+                texts[text_hash] = text[:self.max_item_chars]
+
+        labels = self.cache.get_many(keys_by_hash, self.scheme) if self.cache else {}
+        inc('classify_cache_hits', len(labels))
+        pending = [(text_hash, text) for text_hash, text in texts.items() if text_hash not in labels]
+        batches = self.make_batches(pending)
+        if pending:
+            logger.info(f"分类: {len(keys_by_hash)} 条不同内容，缓存命中 {len(labels)} 条，"
+                        f"{len(pending)} 条分 {len(batches)} 个请求")
+
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='classifier') as executor:
+            running = set()
+            batches = iter(batches)
+            while True:
+                for batch in batches:
+                    running.add(executor.submit(self._classify_batch, batch))
+                    if len(running) >= self.concurrency:
+                        break
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results = future.result()
+                    # 每个批次完成后立即写入缓存，中断后重新运行不会重复请求
+                    if results and self.cache:
+                        self.cache.put_many(results, self.scheme)
+                    labels.update(results)
+
+        return {key: (labels[text_hash], text_hash)
+                for text_hash, keys in keys_by_hash.items() if text_hash in labels
+                for key in keys}
@@ -1,17 +1,194 @@
 import os
 import csv
+import time
+import threading
 from datetime import datetime
 
-from .path_manager import get_download_path, create_download_directories
+from .path_manager import get_download_paths
 from .logger import setup_logger
 logger = setup_logger()
 
+WEIBO_CSV_HEADERS = [
+    'id',                    # 微博ID（数字格式）
+    'bid',                   # 微博BID（字符串格式，用于URL）
+    'user_id',               # 用户ID（数字格式）
+    'screen_name',           # 用户昵称
+    'text',                  # 微博正文内容
+    'article_url',           # 文章链接（如果有的话）
+    'topics',                # 话题标签（用逗号分隔）
+    'pics',                  # 图片本地路径（用逗号分隔）
+    'videos',                # 视频本地路径（用逗号分隔）
+    'source_url',            # 微博源链接
+    'retweet_id',            # 转发微博ID
+    'retweet_text',          # 转发微博内容
+    'retweet_screen_name',   # 转发微博用户昵称
+    'retweet_user_id',       # 转发微博用户ID
+    'retweet_source_url'     # 转发微博源链接
+]
+
+
+class WeiboCsvWriter:
+    """
+    批量写入微博数据的CSV写入器
+
+    整个运行期间保持当天的CSV文件打开，数据先放入缓冲区，
+    达到条数或时间阈值、以及关闭时统一写入并fsync。
+    每条数据可以附带回调，在数据确实落盘后才执行（例如标记任务完成），
+    程序崩溃时未落盘的数据对应的任务不会被标记为完成
+    """
+
+    def __init__(self, file_dir=None, batch_size=50, flush_interval=5.0):
+        """
+        初始化写入器
+
+        Args:
+            file_dir: CSV文件目录，为None时使用下载目录下的 weibo 目录
+            batch_size: 缓冲区达到该条数时写入
+            flush_interval: 距上次写入超过该秒数时写入
+        """
+        self.file_dir = file_dir or get_download_paths()['weibo']
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._file = None
+        self._writer = None
+        self._file_date = None
+        self._last_flush = time.monotonic()
+
+        self._closed = threading.Event()
+        self._timer = None
+        if flush_interval and flush_interval > 0:
+            self._timer = threading.Thread(target=self._flush_periodically, name='csv-writer', daemon=True)
+            self._timer.start()
+
+    def _flush_periodically(self):
+        """后台定时写入，避免数据在缓冲区中停留过久"""
+        while not self._closed.wait(self.flush_interval):
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                # 异常不能让定时线程退出，否则之后的数据只能等到缓冲区满或关闭时才写入
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"定时写入微博数据出错: {e}")
+
+    def _open_for_today(self):
+        """打开当天的CSV文件，日期变化时切换到新文件"""
+        today = datetime.now().strftime('%Y%m%d')
+        if self._file is not None and self._file_date == today:
+            return
+
+        if self._file is not None:
+            file, self._file = self._file, None
+            file.close()
+
+        file_path = os.path.join(self.file_dir, f"{today}.csv")
+        self._file = open(file_path, 'a', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._file_date = today
+        if self._file.tell() == 0:
+            self._writer.writerow(WEIBO_CSV_HEADERS)
+        logger.debug(f"已打开微博数据文件: {file_path}")
+
+    def write(self, weibo, on_flush=None):
+        """
+        写入一条微博数据
+
+        Args:
+            weibo: 解析后的微博数据（ParsedWeibo）
+            on_flush: 数据落盘后调用的回调函数
+
+        Returns:
+            bool: 数据有效并已放入缓冲区时返回True
+        """
+        if not weibo:
+            return False
+
+        row = weibo.to_csv_row(WEIBO_CSV_HEADERS)
+        with self._lock:
+            self._buffer.append((row, on_flush))
+            should_flush = len(self._buffer) >= self.batch_size
+
+        if should_flush:
+            self.flush()
+        return True
+
+    def _write_batch(self, batch):
+        """写入一批数据并fsync，失败时截掉写入了一部分的数据并关闭文件，下次重新打开"""
+        self._open_for_today()
+        position = self._file.tell()
+        try:
+            self._writer.writerows(row for row, _ in batch)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception:
+            file, self._file = self._file, None
+            try:
+                file.truncate(position)
+                file.close()
+            except Exception as e:
+                logger.warning(f"回滚未写完的微博数据失败: {e}")
+            raise
+
+    def flush(self):
+        """
+        将缓冲区写入文件并fsync，然后执行这批数据的回调
+
+        写入失败时（例如当天的CSV文件被Excel占用）这批数据放回缓冲区头部，回调不执行，
+        下次写入时重试
+
+        Returns:
+            bool: 缓冲区已全部落盘时返回True
+        """
+        with self._lock:
+            if not self._buffer:
+                self._last_flush = time.monotonic()
+                return True
+            batch, self._buffer = self._buffer, []
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self._buffer[:0] = batch
+                logger.error(f"写入微博数据失败，{len(batch)} 条数据保留在缓冲区等待重试: {e}")
+                return False
+            self._last_flush = time.monotonic()
+
+        logger.info(f"已写入 {len(batch)} 条微博到 {self._file_date}.csv")
+        for _, callback in batch:
+            if callback is not None:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"执行写入回调失败: {e}")
+        return True
+
+    def close(self):
+        """写入剩余数据并关闭文件"""
+        self._closed.set()
+        if self._timer is not None:
+            self._timer.join()
+        if not self.flush():
+            logger.error(f"关闭时仍有 {len(self._buffer)} 条微博未能写入，对应任务保持处理中状态，之后会重新处理")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def save_to_csv(weibo):
     """
-    保存微博数据到CSV文件
+    保存单条微博数据到CSV文件，批量保存请使用 WeiboCsvWriter
 
     Args:
-        weibo: 解析后的微博数据字典
+        weibo: 解析后的微博数据（ParsedWeibo）
 
     Returns:
         bool: 保存成功返回True，否则返回False
@@ -19,41 +196,5 @@ def save_to_csv(weibo):
     if not weibo:
         return False
 
-    # 获取下载路径
-    download_paths = create_download_directories(get_download_path())
-    file_dir = download_paths['weibo']
-
-    # 使用当天日期作为文件名
-    today = datetime.now().strftime('%Y%m%d')
-    file_path = os.path.join(file_dir, f"{today}.csv")
-
-    headers = [
-        'id',                    # 微博ID（数字格式）
-        'bid',                   # 微博BID（字符串格式，用于URL）
-        'user_id',               # 用户ID（数字格式）
-        'screen_name',           # 用户昵称
-        'text',                  # 微博正文内容
-        'article_url',           # 文章链接（如果有的话）
-        'topics',                # 话题标签（用逗号分隔）
-        'pics',                  # 图片本地路径（用逗号分隔）
-        'videos',                # 视频本地路径（用逗号分隔）
-        'source_url',            # 微博源链接
-        'retweet_id',            # 转发微博ID
-        'retweet_text',          # 转发微博内容
-        'retweet_screen_name',   # 转发微博用户昵称
-        'retweet_user_id',       # 转发微博用户ID
-        'retweet_source_url'     # 转发微博源链接
-    ]
-
-    is_file_exist = os.path.isfile(file_path)
-
-    with open(file_path, 'a', encoding='utf-8-sig', newline='') as f:
-        writer = csv.writer(f)
-        if not is_file_exist:
-            writer.writerow(headers)
-
-        row = [weibo.get(key, '') for key in headers]
-        writer.writerow(row)
-
-    logger.info(f"微博已保存到 {file_path}")
-    return True 
\ No newline at end of file
+    with WeiboCsvWriter(batch_size=1, flush_interval=0) as writer:
+        return writer.write(weibo) and writer.flush()
@@ -0,0 +1,203 @@
+import os
+import glob
+import gzip
+import json
+import zlib
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+from .path_manager import get_download_paths
+from .logger import setup_logger
+logger = setup_logger()
+
+CAPTURE_PATTERN = 'capture_*.jsonl.gz'
+
+
+class DebugCapture:
+    """
+    调试数据采集器
+
+    接口返回的原始数据以紧凑JSON每行一条的格式，由后台线程追加写入gzip压缩的归档文件，
+    单个文件超过大小上限后切换到新文件。采集时只把数据放入队列，不在处理流程中做任何磁盘操作
+    """
+
+    def __init__(self, debug_dir=None, sample_rate=1.0, max_bytes=64 * 1024 * 1024, queue_size=1000):
+        """
+        初始化采集器
+
+        Args:
+            debug_dir: 归档目录，为None时使用下载目录下的 debug 目录
+            sample_rate: 采样比例（0~1），按key取样，同一条微博要么总被采集要么从不采集
+            max_bytes: 单个归档文件的最大未压缩字节数
+            queue_size: 等待写入的最大记录数，队列满时丢弃新记录
+        """
+        self.debug_dir = debug_dir or os.path.join(get_download_paths()['base'], 'debug')
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        os.makedirs(self.debug_dir, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._file_path = None
+        self._written = 0
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._write_loop, name='debug-capture', daemon=True)
+        self._thread.start()
+
+    def _sampled(self, key):
+        """判断该key是否被采样"""
+        if self.sample_rate >= 1:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        return zlib.crc32(str(key).encode('utf-8')) / 0xFFFFFFFF < self.sample_rate
+
+    def capture(self, kind, key, data):
+        """
+        提交一条调试数据
+
+        Args:
+            kind: 数据类型，如 weibo、favorites_page
+            key: 查找用的键，微博数据为bid
+            data: 原始数据
+        """
+        if not self._sampled(key):
+            return
+        record = {'kind': kind, 'key': str(key), 'time': datetime.now().isoformat(timespec='seconds'), 'data': data}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
+
+    def _open_new_file(self):
+        """打开一个新的归档文件"""
+        if self._file is not None:
+            self._file.close()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self._file_path = os.path.join(self.debug_dir, f"capture_{timestamp}.jsonl.gz")
+        self._file = gzip.open(self._file_path, 'ab')
+        self._written = 0
+        logger.debug(f"已创建调试数据归档: {self._file_path}")
+
+    def _write_loop(self):
+        """后台线程：从队列取出记录写入归档文件"""
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            try:
+                line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                if self._file is None or self._written + len(line) > self.max_bytes:
+                    self._open_new_file()
+                self._file.write(line)
+                self._written += len(line)
+                if self._queue.empty():
+                    # 队列空闲时刷新压缩流，使已写入的记录可以被读取
+                    self._file.flush()
+            except Exception as e:
+                logger.warning(f"保存调试数据失败: {e}")
+
+    def close(self):
+        """写完队列中剩余的数据并关闭归档文件"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._dropped:
+            logger.warning(f"调试数据队列已满，丢弃了 {self._dropped} 条记录")
+
+
+_debug_capture = None
+
+def enable_debug_capture(sample_rate=1.0, debug_dir=None):
+    """
+    启用调试数据采集，默认不启用
+
+    Args:
+        sample_rate: 采样比例（0~1）
+        debug_dir: 归档目录
+
+    Returns:
+        DebugCapture: 采集器实例
+    """
+    global _debug_capture
+    if _debug_capture is None:
+        _debug_capture = DebugCapture(debug_dir=debug_dir, sample_rate=sample_rate)
+        atexit.register(close_debug_capture)
+        logger.info(f"已启用调试数据采集，采样比例: {sample_rate}，保存到: {_debug_capture.debug_dir}")
+    return _debug_capture
+
+def close_debug_capture():
+    """关闭调试数据采集"""
+    global _debug_capture
+    if _debug_capture is not None:
+        _debug_capture.close()
+        _debug_capture = None
+
+def capture_debug(kind, key, data):
+    """
+    提交一条调试数据，未启用采集时直接返回
+
+    Args:
+        kind: 数据类型
+        key: 查找用的键
+        data: 原始数据
+    """
+    if _debug_capture is not None:
+        _debug_capture.capture(kind, key, data)
+
+
+def iter_captures(debug_dir=None, kind=None, key=None):
+    """
+    按写入顺序遍历归档中的调试数据
+
+    正在写入的归档末尾可能不完整，读到不完整的部分时跳过该文件的剩余内容
+
+    Args:
+        debug_dir: 归档目录，为None时使用下载目录下的 debug 目录
+        kind: 只返回该类型的数据
+        key: 只返回该键的数据
+
+    Yields:
+        dict: 包含 kind、key、time、data 的记录
+    """
+    debug_dir = debug_dir or os.path.join(get_download_paths()['base'], 'debug')
+    for file_path in sorted(glob.glob(os.path.join(debug_dir, CAPTURE_PATTERN))):
+        try:
+            with gzip.open(file_path, 'rb') as f:
+                for line in f:
+                    # 先用字符串匹配过滤，避免解析无关的记录
+                    if key is not None and f'"key":{json.dumps(str(key), ensure_ascii=False)}'.encode('utf-8') not in line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if kind is not None and record.get('kind') != kind:
+                        continue
+                    if key is not None and record.get('key') != str(key):
+                        continue
+                    yield record
+        except (EOFError, OSError, zlib.error) as e:
+            logger.debug(f"读取调试数据归档 {file_path} 时中断: {e}")
+
+def find_weibo_capture(bid, debug_dir=None):
+    """
+    查找某条微博最近一次采集的原始数据
+
+    Args:
+        bid: 微博BID
+        debug_dir: 归档目录
+
+    Returns:
+        dict: 原始微博数据，未找到时返回None
+    """
+    found = None
+    for record in iter_captures(debug_dir, kind='weibo', key=bid):
+        found = record['data']
+    return found
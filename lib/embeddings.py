@@ -0,0 +1,431 @@
+import os
+import json
+import math
+import zlib
+import hashlib
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .fulltext import tokenize
+from .path_manager import get_download_paths
+from .text_normalizer import canonical_text
+from .metrics import span
+from .logger import setup_logger
+logger = setup_logger()
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("向量索引需要 numpy，请先安装: pip install numpy")
+
+
+def _normalize_rows(matrix):
+    """按行归一化为单位向量，内积即余弦相似度；全零行保持为零"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    matrix /= norms
+    return matrix
+
+
+@lru_cache(maxsize=1 << 18)
+def _hash_slot(token, dim):
+    """词元对应的维度和符号，符号用于抵消哈希冲突带来的偏差"""
+    h = zlib.crc32(token.encode('utf-8'))
+    return h % dim, 1.0 if h & 0x80000000 else -1.0
+
+
+class Embedder:
+    """
+    文本向量模型的接口
+
+    子类实现 embed，返回 (条数, dim) 的 float32 单位向量矩阵
+    """
+
+    name = 'base'
+    dim = 0
+
+    @property
+    def cache_key(self):
+        """区分不同模型的键，模型或维度变化后已有的向量需要重建"""
+        return f"{self.name}:{self.dim}"
+
+    def embed(self, texts):
+        """
+        Args:
+            texts: 文本列表
+
+        Returns:
+            numpy.ndarray: (len(texts), dim) 的 float32 矩阵，每行为单位向量
+        """
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    不需要模型文件的哈希向量：中文二元词元和其他语言单词（与全文索引的切分相同）按词频哈希到固定维度
+
+    只反映字面重合程度，适合找近似重复；语义相似度需要使用本地模型
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dim=256):
+        """
+        Args:
+            dim: 向量维度
+        """
+        _require_numpy()
+        self.dim = dim
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        rows, cols, values = [], [], []
+        for i, text in enumerate(texts):
+            for token, count in Counter(tokenize(canonical_text(text)).split()).items():
+                index, sign = _hash_slot(token, self.dim)
+                rows.append(i)
+                cols.append(index)
+                values.append(sign * (1 + math.log(count)))
+        if rows:
+            np.add.at(matrix, (rows, cols), values)
+        return _normalize_rows(matrix)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    sentence-transformers 加载的本地模型，默认使用中文的 bge-small
+
+    需要安装 sentence-transformers，首次使用时下载模型
+    """
+
+    name = 'sentence-transformers'
+
+    def __init__(self, model_name='BAAI/bge-small-zh-v1.5', batch_size=64, device=None):
+        """
+        Args:
+            model_name: 模型名称或本地路径
+            batch_size: 模型每次计算的条数
+            device: 运行设备（cpu / cuda），为None时自动选择
+        """
+        _require_numpy()
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    @property
+    def cache_key(self):
+        return f"{self.name}:{self.model_name}:{self.dim}"
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+EMBEDDERS = {
+    'hashing': HashingEmbedder,
+    'sentence-transformers': SentenceTransformerEmbedder,
+}
+
+
+def register_embedder(name, embedder_class):
+    """
+    注册向量模型，之后可以用 make_embedder(name) 创建
+
+    Args:
+        name: 名称
+        embedder_class: Embedder 的子类
+    """
+    EMBEDDERS[name] = embedder_class
+
+
+def make_embedder(name, **kwargs):
+    """
+    按名称创建向量模型
+
+    Args:
+        name: 已注册的名称
+        **kwargs: 传给模型构造函数的参数
+
+    Returns:
+        Embedder: 向量模型
+    """
+    if name not in EMBEDDERS:
+        raise ValueError(f"不支持的向量模型: {name}，可选: {', '.join(EMBEDDERS)}")
+    return EMBEDDERS[name](**kwargs)
+
+
+def _top_k(scores, k):
+    """得分最高的k个下标，按得分降序"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+class EmbeddingIndex:
+    """
+    微博正文的向量索引
+
+    向量按行连续保存在 {path}.f32（float32，行数 x 维度），以内存映射方式读取；
+    {path}.json 保存模型、维度和每行对应的BID及正文摘要。正文未变化的微博不重新计算，
+    新微博追加到文件末尾
+    """
+
+    def __init__(self, path=None, embedder=None):
+        """
+        Args:
+            path: 不含扩展名的文件路径，为None时使用下载目录下的 weibo_embeddings（与存档数据库相邻）
+            embedder: 向量模型，为None时使用 HashingEmbedder
+        """
+        _require_numpy()
+        self.path = path or os.path.join(get_download_paths()['base'], 'weibo_embeddings')
+        self.matrix_path = self.path + '.f32'
+        self.meta_path = self.path + '.json'
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self.bids = []
+        self.hashes = []
+        self._rows = {}
+        self._matrix = None
+        self._load()
+
+    def __len__(self):
+        return len(self.bids)
+
+    def _load(self):
+        """读取元数据并映射向量文件，模型变化或文件不完整时从空索引开始"""
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"无法读取向量索引元数据，将重建: {e}")
+            return
+
+        if meta.get('embedder') != self.embedder.cache_key or meta.get('dim') != self.dim:
+            logger.warning(f"向量模型已变化（{meta.get('embedder')} -> {self.embedder.cache_key}），将重建向量索引")
+            return
+        count = len(meta['bids'])
+        size = os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+        if size < count * self.dim * 4:
+            logger.warning("向量文件不完整，将重建向量索引")
+            return
+
+        self.bids = meta['bids']
+        self.hashes = meta['hashes']
+        self._rows = {bid: row for row, bid in enumerate(self.bids)}
+        self._map()
+
+    def _map(self):
+        """以只读内存映射方式打开向量文件"""
+        self._matrix = None
+        if self.bids:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(len(self.bids), self.dim))
+
+    @property
+    def matrix(self):
+        """(行数, 维度) 的向量矩阵，空索引时为None"""
+        return self._matrix
+
+    def _save_meta(self):
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'embedder': self.embedder.cache_key, 'dim': self.dim,
+                       'bids': self.bids, 'hashes': self.hashes}, f)
+        os.replace(temp_path, self.meta_path)
+
+    def update(self, items, batch_size=256, checkpoint=10000):
+        """
+        计算新增或正文变化的微博的向量并写入文件
+
+        Args:
+            items: (bid, 正文) 的可迭代对象，可以是很长的迭代器
+            batch_size: 每次交给模型计算的条数
+            checkpoint: 每新增多少条保存一次元数据，中断后已保存的部分不再计算
+
+        Returns:
+            int: 计算了向量的条数
+        """
+        # 上次中断时可能追加了元数据中没有记录的行
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(len(self.bids) * self.dim * 4)
+        self._matrix = None
+
+        updated = 0
+        since_checkpoint = 0
+        with open(self.matrix_path, 'r+b') as f:
+            batch = []
+
+            def flush():
+                nonlocal updated, since_checkpoint
+                with span('embed_batch'):
+                    vectors = self.embedder.embed([text for _, text, _ in batch])
+                for (bid, _, text_hash), vector in zip(batch, vectors):
+                    row = self._rows.get(bid)
+                    if row is None:
+                        row = self._rows[bid] = len(self.bids)
+                        self.bids.append(bid)
+                        self.hashes.append(text_hash)
+                    else:
+                        self.hashes[row] = text_hash
+                    f.seek(row * self.dim * 4)
+                    f.write(vector.tobytes())
+                updated += len(batch)
+                since_checkpoint += len(batch)
+                batch.clear()
+                if since_checkpoint >= checkpoint:
+                    f.flush()
+                    self._save_meta()
+                    since_checkpoint = 0
+
+            for bid, text in items:
+                normalized = canonical_text(text)
+                if not normalized:
+                    continue
+                text_hash = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+                row = self._rows.get(bid)
+                if row is not None and self.hashes[row] == text_hash:
+                    continue
+                batch.append((bid, text, text_hash))
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+
+        if updated:
+            self._save_meta()
+        self._map()
+        return updated
+
+    def update_from_archive(self, archive, batch_size=256):
+        """
+        用存档中全部微博的正文更新索引
+
+        Args:
+            archive: WeiboArchive
+            batch_size: 每次交给模型计算的条数
+
+        Returns:
+            int: 计算了向量的条数
+        """
+        items = (post for posts in archive.iter_post_texts() for post in posts)
+        updated = self.update(items, batch_size=batch_size)
+        logger.info(f"向量索引共 {len(self)} 条微博，本次计算 {updated} 条")
+        return updated
+
+    def vector(self, bid):
+        """某条微博的向量，不在索引中时返回None"""
+        row = self._rows.get(bid)
+        return None if row is None else np.array(self._matrix[row])
+
+    def search(self, vector, k=10, exclude=None):
+        """
+        与给定向量最相似的微博
+
+        Args:
+            vector: 单位向量
+            k: 返回条数
+            exclude: 不返回的BID
+
+        Returns:
+            list: [(bid, 相似度)]，按相似度降序
+        """
+        if self._matrix is None:
+            return []
+        scores = self._matrix @ np.asarray(vector, dtype=np.float32)
+        row = self._rows.get(exclude)
+        if row is not None:
+            scores[row] = -np.inf
+        return [(self.bids[i], float(scores[i])) for i in _top_k(scores, k) if np.isfinite(scores[i])]
+
+    def most_similar(self, bid, k=10):
+        """
+        与某条微博最相似的其他微博
+
+        Returns:
+            list: [(bid, 相似度)]，微博不在索引中时返回空列表
+        """
+        vector = self.vector(bid)
+        return [] if vector is None else self.search(vector, k, exclude=bid)
+
+    def similar_to_text(self, text, k=10):
+        """与一段文本最相似的微博"""
+        return self.search(self.embedder.embed([text])[0], k)
+
+    def suggest_categories(self, bid, labels, k=20):
+        """
+        按最相似的已分类微博投票，推荐某条微博的类别
+
+        Args:
+            bid: 微博BID
+            labels: 已有的分类结果 {bid: 类别}
+            k: 参与投票的相似微博数
+
+        Returns:
+            list: [(类别, 得分)]，得分为相似度之和，按得分降序
+        """
+        votes = defaultdict(float)
+        for other, score in self.most_similar(bid, k):
+            if other in labels and score > 0:
+                votes[labels[other]] += score
+        return sorted(votes.items(), key=lambda item: item[1], reverse=True)
+
+    def near_duplicates(self, threshold=0.9, block_size=1024):
+        """
+        将相似度不低于 threshold 的微博分组
+
+        正文相同的微博直接归为一组，只对不同内容按 block_size x block_size 分块计算内积矩阵的上三角，
+        相连的微博合并为一组
+
+        Args:
+            threshold: 相似度阈值
+            block_size: 分块的边长，每块内积矩阵占用 block_size x block_size x 4 字节，与条数无关
+
+        Returns:
+            list: 每组微博的BID列表（至少两条），按组大小降序
+        """
+        if self._matrix is None:
+            return []
+
+        rows_by_hash = defaultdict(list)
+        for row, text_hash in enumerate(self.hashes):
+            rows_by_hash[text_hash].append(row)
+        groups = list(rows_by_hash.values())
+        unique = np.array(self._matrix[[rows[0] for rows in groups]])
+
+        parent = list(range(len(groups)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        with span('near_duplicates'):
+            for start in range(0, len(unique), block_size):
+                end = min(start + block_size, len(unique))
+                for col_start in range(start, len(unique), block_size):
+                    col_end = min(col_start + block_size, len(unique))
+                    scores = unique[start:end] @ unique[col_start:col_end].T
+                    if col_start == start:
+                        # 对角块只保留上三角（不含对角线），每对只比较一次
+                        scores[np.tril_indices(end - start)] = -np.inf
+                    for i, j in zip(*np.nonzero(scores >= threshold)):
+                        a, b = find(start + int(i)), find(col_start + int(j))
+                        if a != b:
+                            parent[b] = a
+
+        clusters = defaultdict(list)
+        for index, rows in enumerate(groups):
+            clusters[find(index)].extend(self.bids[row] for row in rows)
+        return sorted((bids for bids in clusters.values() if len(bids) > 1), key=len, reverse=True)
@@ -1,76 +1,89 @@
+import os
 import csv
 import json
-import time
-import requests
 from datetime import datetime
 from pathlib import Path
 
+from .http_client import http_get, set_cookie
+from .debug_capture import capture_debug
+from .metrics import timed
+from .models import FavoriteRef
 from .logger import setup_logger
 logger = setup_logger()
 
-class FavoritesCrawler:
-    def __init__(self, cookie_path='setting.json'):
-        # 加载cookie
-        with open(cookie_path, 'r', encoding='utf-8') as f:
-            self.cookie = json.load(f)
+# 收藏微博API
+FAVORITES_URL = 'https://weibo.com/ajax/favorites/all_fav'
 
-        # 设置请求头
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Cookie': '; '.join([f'{k}={v}' for k, v in self.cookie.items()])
-        }
+def unwrap_favorites(data):
+    """
+    从收藏接口返回的JSON中取出收藏列表，兼容接口的几种数据结构
 
-        # 收藏微博API
-        self.favorites_url = 'https://weibo.com/ajax/favorites/all_fav'
+    Args:
+        data: 接口返回的JSON数据
 
-        # 创建debug文件夹（如果不存在）
-        self.debug_dir = Path('debug')
-        self.debug_dir.mkdir(exist_ok=True)
+    Returns:
+        list: 收藏项列表，无法识别时返回空列表
+    """
+    if isinstance(data, dict):
+        if data.get('ok') == 1 and isinstance(data.get('data'), list):
+            return data['data']
+        elif 'data' in data and isinstance(data['data'], dict):
+            return data['data'].get('favorites', [])
+    elif isinstance(data, list):
+        return data
+    else:
+        logger.error(f"未知的数据结构: {type(data)}")
+    return []
 
-    def save_debug_json(self, data, prefix='api_response'):
-        """保存调试数据到JSON文件"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = self.debug_dir / f"{prefix}_{timestamp}.json"
+class FavoritesCrawler:
+    def __init__(self, cookie_path='setting.json'):
+        # 加载cookie，统一交给共享的HTTP客户端
+        with open(cookie_path, 'r', encoding='utf-8') as f:
+            self.cookie = json.load(f).get('cookie', '')
+        set_cookie(self.cookie)
 
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 收藏微博API
+        self.favorites_url = FAVORITES_URL
 
-        return filename
+        # 增量同步的高水位记录
+        self.sync_state_path = Path('weibo') / 'favorites_sync.json'
 
+    @timed('favorites_page')
     def get_favorites(self, page=1, count=20):
-        """获取收藏的微博列表"""
+        """
+        获取收藏的微博列表
+
+        Returns:
+            list: 收藏项列表，请求失败（非200状态码或异常）时返回None，与真正的空页区分
+        """
         params = {
             'page': page,
             'count': count
         }
 
         try:
-            response = requests.get(self.favorites_url, headers=self.headers, params=params)
+            response = http_get(self.favorites_url, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
-                # 保存API返回的数据结构到debug文件夹
-                debug_file = self.save_debug_json(data)
-                logger.info(f"API返回数据已保存到: {debug_file}")
+                # 启用调试采集时保存API返回的数据结构
+                capture_debug('favorites_page', f"page{page}", data)
                 # 检查数据结构并返回正确的数据
-                if isinstance(data, dict):
-                    if data.get('ok') == 1 and isinstance(data.get('data'), list):
-                        return data['data']
-                    elif 'data' in data and isinstance(data['data'], dict):
-                        return data['data'].get('favorites', [])
-                elif isinstance(data, list):
-                    return data
-                else:
-                    logger.error(f"未知的数据结构: {type(data)}")
-                    return []
+                return unwrap_favorites(data)
             else:
                 logger.error(f"获取收藏微博失败，状态码: {response.status_code}")
-                return []
+                return None
         except Exception as e:
             logger.error(f"获取收藏微博时发生错误: {e}")
-            return []
+            return None
 
-    def parse_favorites(self, favorites):
-        """解析收藏微博数据，只提取URL"""
+    @staticmethod
+    def parse_favorites(favorites):
+        """
+        解析收藏微博数据，只提取URL和收藏时间
+
+        Returns:
+            list: FavoriteRef 列表
+        """
         result = []
 
         # 检查favorites是否为列表
@@ -92,10 +105,7 @@ class FavoritesCrawler:
 
                 if user_id and mblogid:
                     url = f"https://weibo.com/{user_id}/{mblogid}"
-                    result.append({
-                        'url': url,
-                        'favorited_time': created_at
-                    })
+                    result.append(FavoriteRef(url, created_at))
             except Exception as e:
                 logger.error(f"解析收藏项时出错: {e}")
                 continue
@@ -110,6 +120,9 @@ class FavoritesCrawler:
             logger.info(f"正在获取第 {page} 页收藏微博...")
             favorites = self.get_favorites(page=page)
 
+            if favorites is None:
+                logger.warning(f"第 {page} 页获取失败，停止获取")
+                break
             if not favorites:
                 logger.warning(f"第 {page} 页没有收藏微博数据，停止获取")
                 break
@@ -121,13 +134,136 @@ class FavoritesCrawler:
             else:
                 logger.warning(f"第 {page} 页解析结果为空")
 
-            # 防止请求过快
-            time.sleep(2)
-
         logger.info(f"总共获取到 {len(all_favorites)} 条收藏微博")
         return all_favorites
 
-    def save_to_csv(self, data: list[str], filename=None):
+    def load_sync_state(self):
+        """读取上次增量同步的状态，不存在或损坏时返回空字典"""
+        try:
+            with open(self.sync_state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_sync_state(self, state):
+        """保存增量同步状态"""
+        os.makedirs(self.sync_state_path.parent, exist_ok=True)
+        temp_path = self.sync_state_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, self.sync_state_path)
+
+    def get_new_favorites(self, max_pages=5, is_known=None, on_new=None):
+        """
+        增量获取收藏微博：遇到上次同步的最新一条，或整页都是已知微博时停止
+
+        收藏列表按收藏时间倒序返回，上次同步时的第一条（高水位）之后都已处理过。
+        达到 max_pages 仍没有遇到高水位时，同步状态中记录下一次从哪一页继续（resume_page），
+        以及本轮开始时的第一条（pending_mblogid）；下次从该页继续向后获取，直到遇到旧的高水位，
+        再把高水位推进到 pending_mblogid。继续获取时只在遇到高水位时停止，
+        避免把上次没取到的部分当成已知跳过。某一页请求失败（例如被限流）时同样记为未完成，
+        下次从失败的页继续，不会把失败当成列表末尾而推进高水位
+
+        Args:
+            max_pages: 本次最多爬取的页数
+            is_known: 判断URL是否已知的函数，例如查询任务队列
+            on_new: 保存同步状态之前调用的函数，参数为新收藏微博列表，例如加入任务队列；
+                抛出异常时不保存同步状态，下次重新获取这些微博
+
+        Returns:
+            list: 新收藏微博的 FavoriteRef 列表，顺序与收藏列表相同
+        """
+        state = self.load_sync_state()
+        last_mblogid = state.get('last_mblogid')
+        resume_page = state.get('resume_page') if not state.get('complete', True) else None
+        if resume_page:
+            # 上次之后新增的收藏会让后面的微博整体后移，往前多取一页避免遗漏
+            start_page = max(resume_page - 1, 1)
+            head_mblogid = state.get('pending_mblogid')
+            head_time = state.get('pending_favorited_time')
+            logger.info(f"上次同步未完成，从第 {start_page} 页继续获取")
+        else:
+            start_page = 1
+            head_mblogid = head_time = None
+        stop_on_known = not resume_page
+
+        new_favorites = []
+        complete = False
+        failed = False
+        page = start_page
+
+        for page in range(start_page, start_page + max_pages):
+            logger.info(f"正在增量获取第 {page} 页收藏微博...")
+            favorites = self.get_favorites(page=page)
+
+            if favorites is None:
+                logger.warning(f"第 {page} 页获取失败，停止获取")
+                failed = True
+                break
+            if not favorites:
+                logger.info(f"第 {page} 页没有收藏微博数据，已到达收藏列表末尾")
+                complete = True
+                break
+
+            parsed_data = self.parse_favorites(favorites)
+            if parsed_data and head_mblogid is None:
+                head_mblogid = parsed_data[0].mblogid
+                head_time = parsed_data[0].favorited_time
+
+            page_new = []
+            reached_mark = False
+            for item in parsed_data:
+                if last_mblogid and item.mblogid == last_mblogid:
+                    reached_mark = True
+                    break
+                if is_known and is_known(item.url):
+                    continue
+                page_new.append(item)
+
+            new_favorites.extend(page_new)
+            logger.info(f"第 {page} 页新增 {len(page_new)} 条收藏微博")
+
+            if reached_mark:
+                logger.info("已到达上次同步的位置，停止获取")
+                complete = True
+                break
+            if stop_on_known and parsed_data and not page_new:
+                logger.info(f"第 {page} 页全部为已知微博，停止获取")
+                complete = True
+                break
+
+        if on_new is not None and new_favorites:
+            on_new(new_favorites)
+
+        # 请求失败时从失败的页继续，达到最大页数时从下一页继续
+        next_page = page if failed else page + 1
+        if head_mblogid is not None:
+            if complete:
+                new_state = {
+                    'last_mblogid': head_mblogid,
+                    'last_favorited_time': head_time,
+                    'complete': True
+                }
+            else:
+                new_state = {
+                    'last_mblogid': last_mblogid,
+                    'last_favorited_time': state.get('last_favorited_time'),
+                    'complete': False,
+                    'resume_page': next_page,
+                    'pending_mblogid': head_mblogid,
+                    'pending_favorited_time': head_time
+                }
+            new_state['synced_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.save_sync_state(new_state)
+            if failed:
+                logger.warning(f"同步未完成，下次将从第 {next_page} 页继续获取")
+            elif not complete:
+                logger.warning(f"已达到最大页数 {max_pages}，同步未完成，下次将从第 {next_page} 页继续获取")
+
+        logger.info(f"增量同步共获取到 {len(new_favorites)} 条新收藏微博")
+        return new_favorites
+
+    def save_to_csv(self, data: list[FavoriteRef], filename=None):
         """保存收藏微博URL到CSV文件"""
         if not data:
             logger.warning("没有收藏微博数据可保存")
@@ -143,6 +279,6 @@ class FavoritesCrawler:
             writer.writerow(['url', 'favorited_time'])  # 假如只存 URL，可以自行修改标题
             # 写入数据行
             for row in data:
-                writer.writerow([row['url'], row['favorited_time']])
+                writer.writerow(row.to_csv_row())
 
         return filename 
\ No newline at end of file
@@ -0,0 +1,97 @@
+import re
+
+# 中日韩文字连续片段，以及其他语言的单词
+_CJK = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_PATTERN = re.compile(rf'([{_CJK}]+)|([^\W{_CJK}]+)')
+
+
+def _cjk_bigrams(run):
+    """
+    将一段连续的中文切成相邻两字的词元，末尾单字也保留，便于单字前缀查询
+
+    '微博收藏' -> ['微博', '博收', '收藏', '藏']
+    """
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)] + [run[-1]]
+
+
+def tokenize(text):
+    """
+    将文本转换为空格分隔的词元，中文按二元切分，其他语言按单词切分并转小写
+
+    FTS5 自带的 unicode61 分词器会把整段中文当成一个词，预先切分后再交给它建索引
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        str: 空格分隔的词元
+    """
+    tokens = []
+    for cjk, word in _TOKEN_PATTERN.findall(text or ''):
+        if cjk:
+            tokens.extend(_cjk_bigrams(cjk))
+        else:
+            tokens.append(word.lower())
+    return ' '.join(tokens)
+
+
+def build_match_query(query):
+    """
+    将用户输入的关键词转换为 FTS5 MATCH 表达式，多个关键词之间为 AND 关系
+
+    中文关键词切分后作为短语匹配（二元词元必须相邻），单个汉字使用前缀匹配
+
+    Args:
+        query: 用户输入的关键词，空格分隔
+
+    Returns:
+        str: MATCH 表达式，没有有效关键词时返回空字符串
+    """
+    terms = []
+    for cjk, word in _TOKEN_PATTERN.findall(query or ''):
+        if cjk and len(cjk) == 1:
+            terms.append(f'"{cjk}"*')
+        elif cjk:
+            bigrams = [cjk[i:i + 2] for i in range(len(cjk) - 1)]
+            terms.append('"' + ' '.join(bigrams) + '"')
+        else:
+            terms.append('"' + word.lower().replace('"', '""') + '"')
+    return ' AND '.join(terms)
+
+
+def query_terms(query):
+    """获取关键词列表，用于生成摘要"""
+    return [cjk or word for cjk, word in _TOKEN_PATTERN.findall(query or '')]
+
+
+def make_snippet(text, terms, width=60):
+    """
+    截取关键词附近的文字作为摘要，关键词用【】标出
+
+    Args:
+        text: 原始文本
+        terms: 关键词列表
+        width: 摘要长度
+
+    Returns:
+        str: 摘要，文本中不含关键词时返回None
+    """
+    if not text:
+        return None
+
+    lower = text.lower()
+    positions = [(lower.find(term.lower()), term) for term in terms]
+    positions = [(pos, term) for pos, term in positions if pos >= 0]
+    if not positions:
+        return None
+
+    first = min(pos for pos, _ in positions)
+    start = max(0, first - width // 3)
+    end = min(len(text), start + width)
+    snippet = text[start:end]
+    for term in sorted({term for _, term in positions}, key=len, reverse=True):
+        snippet = re.sub(re.escape(term), lambda m: f'【{m.group(0)}】', snippet, flags=re.IGNORECASE)
+
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
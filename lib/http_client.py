@@ -0,0 +1,181 @@
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .rate_limiter import get_host_limiter
+from .logger import setup_logger
+logger = setup_logger()
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36"
+}
+
+# 只有发往这些域名的请求才会带上cookie，图片/视频CDN不需要登录信息
+COOKIE_DOMAINS = ('weibo.com', 'weibo.cn')
+
+_lock = threading.Lock()
+_session = None
+_cookie = ''
+_pool_connections = 10
+_pool_maxsize = 20
+_rewrite_base = None
+_response_hooks = []
+
+
+def _build_session():
+    """创建带连接池的Session，每个host保持长连接"""
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=_pool_connections, pool_maxsize=_pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def configure_http(pool_connections=None, pool_maxsize=None):
+    """
+    设置连接池大小，已有的Session会被关闭并按新配置重建
+
+    Args:
+        pool_connections: 缓存连接池的host数量
+        pool_maxsize: 每个host保持的最大连接数，并发下载时应不小于线程数
+    """
+    global _session, _pool_connections, _pool_maxsize
+
+    with _lock:
+        if pool_connections:
+            _pool_connections = pool_connections
+        if pool_maxsize:
+            _pool_maxsize = pool_maxsize
+        if _session is not None:
+            _session.close()
+            _session = None
+
+    logger.debug(f"连接池设置: pool_connections={_pool_connections}, pool_maxsize={_pool_maxsize}")
+
+
+def set_cookie(cookie):
+    """
+    设置发往微博域名的请求使用的cookie
+
+    Args:
+        cookie: cookie字符串
+    """
+    global _cookie
+    _cookie = cookie or ''
+
+
+def get_session():
+    """
+    获取共享的Session
+
+    Returns:
+        requests.Session: 共享Session
+    """
+    global _session
+
+    with _lock:
+        if _session is None:
+            _session = _build_session()
+        return _session
+
+
+def set_host_rewrite(base_url):
+    """
+    把所有请求改发到 base_url，原始host放在 X-Original-Host 请求头中，用于离线基准测试
+
+    cookie和限速仍按原始URL的host判断，传入None恢复正常请求
+
+    Args:
+        base_url: 本地服务器地址，如 http://127.0.0.1:8765
+    """
+    global _rewrite_base
+    _rewrite_base = base_url.rstrip('/') if base_url else None
+
+
+def add_response_hook(hook):
+    """
+    注册收到响应后的回调，hook(url, status_code, latency) 在请求线程中调用
+
+    Args:
+        hook: 回调函数，url为原始URL，latency为收到响应头所用的秒数
+    """
+    _response_hooks.append(hook)
+
+
+def remove_response_hook(hook):
+    """取消注册的响应回调"""
+    if hook in _response_hooks:
+        _response_hooks.remove(hook)
+
+
+def _rewrite(url, headers):
+    """把URL改写到 _rewrite_base，保留路径和查询参数"""
+    parts = urlsplit(url)
+    headers['X-Original-Host'] = parts.hostname or ''
+    return _rewrite_base + parts.path + ('?' + parts.query if parts.query else '')
+
+
+def _needs_cookie(url):
+    """判断请求是否需要携带cookie"""
+    host = urlsplit(url).hostname or ''
+    return any(host == domain or host.endswith('.' + domain) for domain in COOKIE_DOMAINS)
+
+
+def _request(method, url, headers=None, **kwargs):
+    """按host限速后用共享Session发送请求，收到响应后把状态码和延迟反馈给限速器和回调"""
+    request_headers = dict(headers) if headers else {}
+    if _cookie and 'Cookie' not in request_headers and _needs_cookie(url):
+        request_headers['Cookie'] = _cookie
+
+    limiter = get_host_limiter(urlsplit(url).hostname or '')
+    limiter.acquire()
+
+    target = _rewrite(url, request_headers) if _rewrite_base else url
+    start = time.monotonic()
+    try:
+        response = get_session().request(method, target, headers=request_headers, **kwargs)
+    except requests.exceptions.RequestException:
+        limiter.on_error()
+        raise
+
+    latency = time.monotonic() - start
+    limiter.on_response(response.status_code, latency, response.headers.get('Retry-After'))
+    for hook in _response_hooks:
+        hook(url, response.status_code, latency)
+    return response
+
+
+def http_get(url, headers=None, **kwargs):
+    """
+    使用共享Session发送GET请求
+
+    请求前按host限速，收到响应后把状态码和延迟反馈给限速器
+
+    Args:
+        url: 请求URL
+        headers: 额外的请求头，会覆盖默认请求头
+        **kwargs: 传给 requests.Session.get 的其他参数
+
+    Returns:
+        requests.Response: 响应对象
+    """
+    return _request('GET', url, headers=headers, **kwargs)
+
+
+def http_post(url, headers=None, **kwargs):
+    """
+    使用共享Session发送POST请求，限速和回调与 http_get 相同
+
+    Args:
+        url: 请求URL
+        headers: 额外的请求头，会覆盖默认请求头
+        **kwargs: 传给 requests.Session.post 的其他参数（json、data、timeout等）
+
+    Returns:
+        requests.Response: 响应对象
+    """
+    return _request('POST', url, headers=headers, **kwargs)
@@ -1,56 +1,122 @@
 import os
 import sys
+import time
+import queue
+import atexit
 import logging
 import logging.config
-import inspect
+import logging.handlers
+import threading
+
+_config_lock = threading.Lock()
+_listener = None
+
+def configure_logging():
+    """
+    配置日志，只在第一次调用时生效
+
+    根logger只挂一个QueueHandler，业务线程写日志时只把记录放入队列；
+    写文件和输出到终端的处理器由QueueListener在后台线程中执行，程序退出时写完剩余日志
+    """
+    global _listener
+    with _config_lock:
+        if _listener is not None:
+            return
+
+        os.makedirs("log", exist_ok=True)
+        root = logging.getLogger()
+        logging_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + "logging.conf"
+        if os.path.exists(logging_path):
+            logging.config.fileConfig(logging_path, disable_existing_loggers=False)
+        else:
+            # 默认日志级别为INFO，这样DEBUG级别的日志就不会显示
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            # 文件处理器记录所有日志，控制台处理器只显示INFO及以上级别的日志
+            file_handler = logging.FileHandler(os.path.join("log", "weibo.log"), encoding='utf-8')
+            file_handler.setLevel(logging.DEBUG)
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setLevel(logging.INFO)
+            for handler in (file_handler, console_handler):
+                handler.setFormatter(formatter)
+                root.addHandler(handler)
+            root.setLevel(logging.INFO)
+
+        handlers = root.handlers[:]
+        for handler in handlers:
+            root.removeHandler(handler)
+
+        log_queue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
 
 # 设置日志
 def setup_logger(name: str = None):
     """
-    设置logger，如果name为None，则自动获取调用模块的文件名作为logger名称
-    
+    获取logger，如果name为None，则自动获取调用模块的文件名作为logger名称
+
+    第一次调用时完成日志配置，之后只返回对应名称的logger
+
     Args:
         name: logger名称，如果为None则自动获取调用模块的文件名
-        
+
     Returns:
         logging.Logger: 配置好的logger实例
     """
     # 如果name为None，自动获取调用模块的文件名
     if name is None:
-        # 获取调用栈，找到调用setup_logger的文件
-        frame = inspect.currentframe()
-        try:
-            caller_frame = frame.f_back
-            caller_filename = caller_frame.f_code.co_filename
-            # 获取不带扩展名的文件名
-            name = os.path.splitext(os.path.basename(caller_filename))[0]
-        finally:
-            del frame
-    
-    if not os.path.isdir("log/"):
-        os.makedirs("log/")
-    logging_path = os.path.split(os.path.realpath(__file__))[0] + os.sep + "logging.conf"
-    if os.path.exists(logging_path):
-        logging.config.fileConfig(logging_path)
-    else:
-        # 修改默认日志级别为INFO，这样DEBUG级别的日志就不会显示
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                # 添加文件处理器，将所有日志（包括DEBUG）写入文件
-                logging.FileHandler(os.path.join("log", "weibo.log"), encoding='utf-8'),
-                # 添加控制台处理器，只显示INFO及以上级别的日志
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
-    logger = logging.getLogger(name)
-
-    # 可以单独设置文件处理器的日志级别为DEBUG，这样DEBUG日志仍会写入文件但不会显示在终端
-    for handler in logger.handlers:
-        if isinstance(handler, logging.FileHandler):
-            handler.setLevel(logging.DEBUG)
-        elif isinstance(handler, logging.StreamHandler):
-            handler.setLevel(logging.INFO)  # 控制台只显示INFO及以上级别
-
-    return logger
\ No newline at end of file
+        caller_filename = sys._getframe(1).f_code.co_filename
+        # 获取不带扩展名的文件名
+        name = os.path.splitext(os.path.basename(caller_filename))[0]
+
+    configure_logging()
+    return logging.getLogger(name)
+
+
+class ThrottledLogger:
+    """
+    限制高频日志的输出频率
+
+    同一类日志在一个时间窗口内只输出第一条，被省略的条数附加在下一条输出的日志后面，
+    用于下载时每个文件都会产生一条日志的场景
+    """
+
+    def __init__(self, logger, interval=5.0):
+        """
+        Args:
+            logger: 实际输出日志的logger
+            interval: 同一类日志的最短输出间隔（秒）
+        """
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def log(self, key, level, msg):
+        """
+        输出一条日志，同一key在时间窗口内的后续日志只计数不输出
+
+        Args:
+            key: 日志类别
+            level: 日志级别
+            msg: 日志内容
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._state.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._state[key] = (last, suppressed + 1)
+                return
+            self._state[key] = (now, 0)
+
+        if suppressed:
+            msg = f"{msg}（期间省略了 {suppressed} 条同类日志）"
+        self.logger.log(level, msg)
+
+    def info(self, key, msg):
+        """输出INFO级别的日志"""
+        self.log(key, logging.INFO, msg)
@@ -1,15 +1,90 @@
 import os
+import re
+import time
+import random
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import requests
 
-from .path_manager import get_download_path, create_download_directories
-from .logger import setup_logger
+from .http_client import http_get
+from .media_store import MediaStore
+from .models import MediaItem
+from .path_manager import get_download_paths
+from .metrics import timed, inc
+from .logger import setup_logger, ThrottledLogger
 logger = setup_logger()
+# 每个文件一条的日志，批量下载时限制输出频率
+file_logger = ThrottledLogger(logger)
 
+# 不同任务可能转发同一条原微博，并发下载时按目标文件加锁，避免同时写同一个文件
+# 目标文件 -> [锁, 正在使用该锁的线程数]，没有线程使用时删除，长时间运行时不随文件数增长
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+@contextmanager
+def _path_lock(file_path):
+    """持有目标文件对应的锁"""
+    with _path_locks_guard:
+        entry = _path_locks.get(file_path)
+        if entry is None:
+            entry = _path_locks[file_path] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _path_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _path_locks[file_path]
+
+# 可选的按内容哈希存储，启用后相同URL/相同内容的媒体只下载、保存一次
+_media_store = None
+
+def enable_media_store():
+    """
+    启用按内容哈希存储的媒体库
+
+    Returns:
+        MediaStore: 媒体库实例
+    """
+    global _media_store
+    if _media_store is None:
+        _media_store = MediaStore(get_download_paths()['media'])
+        logger.info("已启用媒体去重存储")
+    return _media_store
+
+def _reuse_stored_media(url, file_path, key):
+    """
+    下载前按URL查找媒体库，命中时直接把旧文件名链接到已存储的文件
+
+    Returns:
+        bool: 是否命中
+    """
+    if _media_store is None:
+        return False
+    blob_path = _media_store.lookup_url(url)
+    if not blob_path:
+        return False
+    _media_store.link(blob_path, file_path)
+    _media_store.record_name(url, key)
+    return True
+
+def _finalize_download(temp_path, file_path, url, key):
+    """下载完成后将临时文件放到最终位置，启用媒体库时存为哈希文件并链接"""
+    if _media_store is None:
+        os.replace(temp_path, file_path)
+        return
+    blob_path = _media_store.ingest(temp_path, os.path.splitext(file_path)[1], url=url, key=key)
+    _media_store.link(blob_path, file_path)
+
+@timed('download_image')
 def download_image(url, user_id, bid, index, overwrite=False):
     """下载图片并保存到本地"""
     try:
         # 获取下载路径
-        download_paths = create_download_directories(get_download_path())
+        download_paths = get_download_paths()
         media_dir = download_paths['media']
 
         file_ext = os.path.splitext(url.split('/')[-1])[1]
@@ -20,35 +95,95 @@ def download_image(url, user_id, bid, index, overwrite=False):
         file_path = os.path.join(media_dir, filename)
         relative_path = os.path.join('media', filename)
 
-        if os.path.exists(file_path) and not overwrite:
-            logger.info(f"图片已存在，跳过下载: {file_path}")
-            return relative_path
+        with _path_lock(file_path):
+            if os.path.exists(file_path) and not overwrite:
+                file_logger.info('image_exists', f"图片已存在，跳过下载: {file_path}")
+                inc('media_skipped')
+                return relative_path
+
+            if not overwrite and _reuse_stored_media(url, file_path, (user_id, bid, index)):
+                file_logger.info('image_stored', f"图片已在媒体库中，跳过下载: {file_path}")
+                return relative_path
+
+            headers = {
+                "Referer": "https://weibo.com/",
+                "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+            }
 
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36",
-            "Referer": "https://weibo.com/",
-            "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
-        }
+            # 先写临时文件再替换，避免覆盖时写穿指向媒体库的硬链接
+            temp_file_path = file_path + ".tmp"
+            existed = os.path.exists(file_path)
 
-        response = requests.get(url, headers=headers, timeout=30, stream=True)
-        response.raise_for_status()
+            # 用with保证连接读完或出错后都能归还连接池
+            with http_get(url, headers=headers, timeout=30, stream=True) as response:
+                response.raise_for_status()
 
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+                with open(temp_file_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
+                    inc('media_bytes', f.tell())
 
-        logger.info(f"图片{'覆盖' if overwrite and os.path.exists(file_path) else ''}下载: {file_path}")
-        return relative_path
+            _finalize_download(temp_file_path, file_path, url, (user_id, bid, index))
+            file_logger.info('image_download', f"图片{'覆盖' if overwrite and existed else ''}下载: {file_path}")
+            return relative_path
     except Exception as e:
         logger.error(f"下载图片失败: {e}, URL: {url}")
         return None
 
+def _backoff_delay(attempt, base=1.0, cap=30.0):
+    """
+    计算指数退避的等待时间（带随机抖动）
+
+    Args:
+        attempt: 已失败的次数，从1开始
+        base: 首次重试的基础等待秒数
+        cap: 等待时间上限
+
+    Returns:
+        float: 等待秒数
+    """
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _parse_content_range(value):
+    """
+    解析 Content-Range 响应头
+
+    Args:
+        value: 形如 'bytes 100-999/1000' 的字符串
+
+    Returns:
+        tuple: (起始字节, 文件总大小)，总大小未知时为None；无法解析时返回 (None, None)
+    """
+    match = re.match(r'bytes\s+(\d+)-\d+/(\d+|\*)', value or '')
+    if not match:
+        return None, None
+    total = match.group(2)
+    return int(match.group(1)), (int(total) if total != '*' else None)
+
+@timed('download_video')
 def download_video(url, user_id, bid, index, overwrite=False, max_retries=3):
-    """下载视频并保存到本地"""
+    """
+    下载视频并保存到本地
+
+    下载中断时保留 .tmp 文件，重试时用 Range 从已下载的位置继续；
+    取得新数据的重试不计入 max_retries，没有进展的重试按指数退避等待
+
+    Args:
+        url: 视频URL
+        user_id: 文件名中使用的用户ID
+        bid: 文件名中使用的微博BID
+        index: 视频序号
+        overwrite: 是否覆盖已下载的视频
+        max_retries: 连续没有进展的最大重试次数
+
+    Returns:
+        str: 下载成功返回相对路径，失败返回None
+    """
     try:
         # 获取下载路径
-        download_paths = create_download_directories(get_download_path())
+        download_paths = get_download_paths()
         media_dir = download_paths['media']
 
         file_ext = os.path.splitext(url.split('/')[-1].split('?')[0])[1]
@@ -58,85 +193,180 @@ def download_video(url, user_id, bid, index, overwrite=False, max_retries=3):
         filename = f"{user_id}_{bid}_{index}{file_ext}"
         file_path = os.path.join(media_dir, filename)
         relative_path = os.path.join('media', filename)
+        temp_file_path = file_path + ".tmp"
 
-        if os.path.exists(file_path) and not overwrite:
-            logger.info(f"视频已存在，跳过下载: {file_path}")
-            return relative_path
+        with _path_lock(file_path):
+            if os.path.exists(file_path) and not overwrite:
+                file_logger.info('video_exists', f"视频已存在，跳过下载: {file_path}")
+                inc('media_skipped')
+                return relative_path
+
+            if not overwrite and _reuse_stored_media(url, file_path, (user_id, bid, index)):
+                file_logger.info('video_stored', f"视频已在媒体库中，跳过下载: {file_path}")
+                return relative_path
+
+            retry_count = 0
+            while retry_count < max_retries:
+                offset = os.path.getsize(temp_file_path) if os.path.exists(temp_file_path) else 0
+                headers = {
+                    "Referer": "https://weibo.com/",
+                    "Accept": "*/*",
+                    "Range": f"bytes={offset}-"
+                }
+
+                resumable = False
+                try:
+                    with http_get(url, headers=headers, timeout=60, stream=True) as response:
+                        # 已下载的部分超出了文件大小，说明临时文件无效，从头下载
+                        if response.status_code == 416 and offset > 0:
+                            logger.warning(f"断点位置无效，重新下载: {file_path}")
+                            os.remove(temp_file_path)
+                            continue
+                        response.raise_for_status()
+
+                        if response.status_code == 206:
+                            start, total_size = _parse_content_range(response.headers.get('content-range'))
+                            resumable = start is not None
+                            if start != offset:
+                                # 服务器返回的区间和请求的不一致，不能续传
+                                logger.warning(f"Content-Range与请求不一致({start} != {offset})，重新下载: {file_path}")
+                                if start != 0:
+                                    if os.path.exists(temp_file_path):
+                                        os.remove(temp_file_path)
+                                    retry_count += 1
+                                    continue
+                                offset = 0
+                        else:
+                            # 服务器不支持Range，返回完整文件
+                            if offset > 0:
+                                logger.debug(f"服务器未返回206，从头下载: {file_path}")
+                            offset = 0
+                            total_size = int(response.headers.get('content-length', 0)) or None
+
+                        with open(temp_file_path, 'ab' if offset > 0 else 'wb') as f:
+                            downloaded = offset
+                            last_progress = 0
+                            for chunk in response.iter_content(chunk_size=8192):
+                                if chunk:
+                                    f.write(chunk)
+                                    downloaded += len(chunk)
+                                    if total_size:
+                                        progress = int(downloaded / total_size * 100)
+                                        if progress >= last_progress + 20 or progress == 100:
+                                            downloaded_mb = downloaded / 1024 / 1024
+                                            total_mb = total_size / 1024 / 1024
+                                            logger.debug(f"视频下载进度: {progress}%, {downloaded_mb:.2f}MB/{total_mb:.2f}MB")
+                                            last_progress = progress - (progress % 20)
+                            inc('media_bytes', downloaded - offset)
 
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36",
-            "Referer": "https://weibo.com/",
-            "Accept": "*/*",
-            "Range": "bytes=0-"
-        }
-
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                with requests.get(url, headers=headers, timeout=60, stream=True) as response:
-                    response.raise_for_status()
-
-                    total_size = int(response.headers.get('content-length', 0))
-                    temp_file_path = file_path + ".tmp"
-
-                    with open(temp_file_path, 'wb') as f:
-                        downloaded = 0
-                        last_progress = 0
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                                downloaded += len(chunk)
-                                if total_size > 0:
-                                    progress = int(downloaded / total_size * 100)
-                                    if progress >= last_progress + 20 or progress == 100:
-                                        downloaded_mb = downloaded / 1024 / 1024
-                                        total_mb = total_size / 1024 / 1024
-                                        logger.debug(f"视频下载进度: {progress}%, {downloaded_mb:.2f}MB/{total_mb:.2f}MB")
-                                        last_progress = progress - (progress % 20)
-
-                    if os.path.getsize(temp_file_path) == total_size or total_size == 0:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                        os.rename(temp_file_path, file_path)
-                        logger.info(f"视频{'覆盖' if overwrite and os.path.exists(file_path) else ''}下载: {file_path}")
+                    current_size = os.path.getsize(temp_file_path)
+                    if total_size is None or current_size == total_size:
+                        existed = os.path.exists(file_path)
+                        _finalize_download(temp_file_path, file_path, url, (user_id, bid, index))
+                        file_logger.info('video_download', f"视频{'覆盖' if overwrite and existed else ''}下载: {file_path}")
                         return relative_path
-                    else:
+
+                    if current_size > total_size:
                         os.remove(temp_file_path)
-                        logger.warning(f"视频下载不完整，将重试 ({retry_count+1}/{max_retries})")
+                        logger.warning(f"视频文件大小超出预期，将重新下载: {file_path}")
                         retry_count += 1
-                        import time
-                        time.sleep(2)
+                    elif resumable and current_size > offset:
+                        # 支持续传且有进展的中断直接续传，不计入重试次数
+                        logger.warning(f"视频下载中断，将从 {current_size}/{total_size} 字节处续传")
                         continue
+                    else:
+                        retry_count += 1
+                        logger.warning(f"视频下载不完整，将重试 ({retry_count}/{max_retries})")
 
-                break
-
-            except requests.exceptions.SSLError as ssl_err:
-                logger.warning(f"SSL错误，将重试 ({retry_count+1}/{max_retries}): {ssl_err}")
-                retry_count += 1
-                if retry_count >= max_retries:
-                    raise
-                import time
-                time.sleep(2)
-
-            except requests.exceptions.RequestException as req_err:
-                logger.warning(f"请求错误，将重试 ({retry_count+1}/{max_retries}): {req_err}")
-                retry_count += 1
-                if retry_count >= max_retries:
-                    raise
-                import time
-                time.sleep(2)
-
-        if retry_count >= max_retries:
-            logger.error(f"视频下载失败，已达到最大重试次数: {max_retries}")
-            return None
+                except requests.exceptions.RequestException as req_err:
+                    if resumable and os.path.exists(temp_file_path) and os.path.getsize(temp_file_path) > offset:
+                        logger.warning(f"视频下载中断，将续传: {req_err}")
+                        continue
+                    retry_count += 1
+                    logger.warning(f"请求错误，将重试 ({retry_count}/{max_retries}): {req_err}")
+
+                if retry_count < max_retries:
+                    time.sleep(_backoff_delay(retry_count))
 
-        return relative_path
+            logger.error(f"视频下载失败，已达到最大重试次数: {max_retries}，已保留临时文件以便续传")
+            return None
     except Exception as e:
         logger.error(f"下载视频失败: {e}, URL: {url}")
-        temp_file_path = file_path + ".tmp"
-        if os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-            except:
-                pass
-        return None 
\ No newline at end of file
+        return None
+
+def make_media_job(kind, url, user_id, bid, index, overwrite=False):
+    """
+    创建媒体下载任务
+
+    Args:
+        kind: 媒体类型，'image'、'livephoto' 或 'video'
+        url: 媒体URL
+        user_id: 文件名中使用的用户ID
+        bid: 文件名中使用的微博BID
+        index: 媒体序号
+        overwrite: 是否覆盖已下载的文件
+
+    Returns:
+        MediaItem: 媒体下载任务
+    """
+    return MediaItem(kind, url, index, user_id=user_id, bid=bid, overwrite=overwrite)
+
+def run_media_job(job):
+    """
+    执行单个媒体下载任务
+
+    Args:
+        job: 填写了 user_id、bid 的 MediaItem
+
+    Returns:
+        str: 下载成功返回相对路径，失败返回None
+    """
+    download = download_video if job.is_video else download_image
+    return download(job.url, job.user_id, job.bid, job.index, overwrite=job.overwrite)
+
+class MediaDownloadStage:
+    """媒体下载阶段，使用独立线程池并发执行媒体下载任务"""
+
+    def __init__(self, max_workers=4):
+        """
+        初始化媒体下载阶段
+
+        Args:
+            max_workers: 同时进行的媒体下载数
+        """
+        self.max_workers = max(max_workers, 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='media')
+
+    def submit(self, jobs):
+        """
+        提交一组媒体下载任务
+
+        Args:
+            jobs: 媒体下载任务列表
+
+        Returns:
+            list: 与任务一一对应的 Future 列表
+        """
+        return [self._executor.submit(run_media_job, job) for job in jobs]
+
+    def run(self, jobs):
+        """
+        执行一组媒体下载任务并等待全部完成
+
+        Args:
+            jobs: 媒体下载任务列表
+
+        Returns:
+            list: 与任务一一对应的本地路径列表，下载失败的为None
+        """
+        return [future.result() for future in self.submit(jobs)]
+
+    def shutdown(self, wait=True):
+        """关闭线程池"""
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
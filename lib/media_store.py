@@ -0,0 +1,222 @@
+import os
+import shutil
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlsplit
+
+from .logger import setup_logger
+logger = setup_logger()
+
+
+def normalize_media_url(url):
+    """
+    生成用于去重的媒体URL键
+
+    sinaimg 的 wx1~wx4 等镜像域名指向同一份文件，只取路径部分；其他URL保持原样
+
+    Args:
+        url: 媒体URL
+
+    Returns:
+        str: 去重用的URL键
+    """
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if host.endswith('sinaimg.cn'):
+        return f"sinaimg:{parts.path}"
+    return url
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    计算文件的sha256
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        str: 十六进制的sha256摘要
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaStore:
+    """按内容哈希存储媒体文件，旧的 {user_id}_{bid}_{index}{ext} 文件名通过硬链接指向同一份数据"""
+
+    def __init__(self, media_dir):
+        """
+        初始化媒体存储
+
+        Args:
+            media_dir: 媒体目录，哈希文件保存在其下的 blobs 子目录
+        """
+        self.media_dir = media_dir
+        self.blob_dir = os.path.join(media_dir, 'blobs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(media_dir, 'media_index.db'), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'hash TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS urls ('
+                'url TEXT PRIMARY KEY, hash TEXT NOT NULL REFERENCES blobs(hash))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS names ('
+                'user_id TEXT NOT NULL, bid TEXT NOT NULL, idx INTEGER NOT NULL, '
+                'hash TEXT NOT NULL REFERENCES blobs(hash), '
+                'PRIMARY KEY (user_id, bid, idx)) WITHOUT ROWID'
+            )
+
+    def blob_path(self, digest, ext):
+        """获取哈希文件路径，按摘要前两位分目录"""
+        return os.path.join(self.blob_dir, digest[:2], digest + ext)
+
+    def lookup_url(self, url):
+        """
+        按URL查找已存储的文件
+
+        Args:
+            url: 媒体URL
+
+        Returns:
+            str: 哈希文件路径，未找到或文件已丢失时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT blobs.hash, blobs.ext FROM urls JOIN blobs ON urls.hash = blobs.hash WHERE urls.url = ?',
+                (normalize_media_url(url),)
+            ).fetchone()
+
+        if row:
+            path = self.blob_path(row[0], row[1])
+            if os.path.exists(path):
+                return path
+        return None
+
+    def ingest(self, temp_path, ext, url=None, key=None, digest=None):
+        """
+        将下载好的临时文件放入存储，相同内容只保留一份
+
+        Args:
+            temp_path: 下载完成的临时文件，调用后会被移动或删除
+            ext: 文件扩展名
+            url: 媒体URL，记录后同一URL不再下载
+            key: (user_id, bid, index) 旧文件名对应的键
+            digest: 已计算好的sha256，为None时读取文件计算
+
+        Returns:
+            str: 哈希文件路径
+        """
+        if digest is None:
+            digest = hash_file(temp_path)
+        path = self.blob_path(digest, ext)
+
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO blobs (hash, ext, size) VALUES (?, ?, ?)',
+                    (digest, ext, os.path.getsize(path))
+                )
+                if url:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO urls (url, hash) VALUES (?, ?)',
+                        (normalize_media_url(url), digest)
+                    )
+                if key:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO names (user_id, bid, idx, hash) VALUES (?, ?, ?, ?)',
+                        (str(key[0]), str(key[1]), int(key[2]), digest)
+                    )
+
+        return path
+
+    def record_name(self, url, key):
+        """URL命中已有文件时，补充记录旧文件名对应的键"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT hash FROM urls WHERE url = ?', (normalize_media_url(url),)
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO names (user_id, bid, idx, hash) VALUES (?, ?, ?, ?)',
+                    (str(key[0]), str(key[1]), int(key[2]), row[0])
+                )
+
+    def link(self, blob_path, file_path):
+        """
+        让旧文件名指向哈希文件，优先使用硬链接，不支持时退回复制
+
+        先链接到临时文件名再替换，不会写穿到已有的硬链接上
+
+        Args:
+            blob_path: 哈希文件路径
+            file_path: 旧文件名对应的完整路径
+        """
+        if os.path.exists(file_path) and os.path.samefile(blob_path, file_path):
+            return
+
+        temp_link = file_path + '.link'
+        if os.path.exists(temp_link):
+            os.remove(temp_link)
+        try:
+            os.link(blob_path, temp_link)
+        except OSError as e:
+            logger.debug(f"无法创建硬链接，改为复制: {e}")
+            shutil.copyfile(blob_path, temp_link)
+        os.replace(temp_link, file_path)
+
+    def dedupe_existing(self):
+        """
+        整理媒体目录中已有的文件：移入哈希存储，原文件名替换为硬链接
+
+        Returns:
+            int: 节省的字节数
+        """
+        saved = 0
+        with os.scandir(self.media_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith(('.tmp', '.link', '.db', '.db-journal')):
+                    continue
+                if entry.stat().st_nlink > 1:
+                    continue
+
+                stem, ext = os.path.splitext(entry.name)
+                parts = stem.rsplit('_', 2)
+                key = (parts[0], parts[1], int(parts[2])) if len(parts) == 3 and parts[2].isdigit() else None
+
+                digest = hash_file(entry.path)
+                existed = os.path.exists(self.blob_path(digest, ext))
+                size = entry.stat().st_size
+
+                # 新内容直接把原文件硬链接进存储，不复制数据
+                temp_path = entry.path + '.tmp'
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                try:
+                    os.link(entry.path, temp_path)
+                except OSError:
+                    shutil.copyfile(entry.path, temp_path)
+                blob = self.ingest(temp_path, ext, key=key, digest=digest)
+                self.link(blob, entry.path)
+                if existed:
+                    saved += size
+
+        logger.info(f"已整理媒体目录，节省 {saved / 1024 / 1024:.2f}MB")
+        return saved
@@ -0,0 +1,315 @@
+import os
+import time
+import json
+import atexit
+import bisect
+import functools
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+
+from .http_client import add_response_hook, remove_response_hook
+from .rate_limiter import API_DOMAINS
+from .logger import setup_logger
+logger = setup_logger()
+
+# 直方图的桶上限（秒），0.1ms 到约 100 秒按2倍递增
+BUCKETS = tuple(0.0001 * 2 ** i for i in range(21))
+
+# 未启用时 span() 返回的空上下文，不做任何事
+_NULL_SPAN = nullcontext()
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class Histogram:
+    """固定桶的耗时直方图，记录次数、总和、最值，百分位数按桶上限估算"""
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p):
+        """估算第p百分位数：所在桶的上限，不超过最大值"""
+        if not self.count:
+            return None
+        rank = max(p / 100 * self.count, 1)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99)
+        }
+
+
+class _Span:
+    """计时上下文，退出时把耗时记入直方图，出现异常时另外计数"""
+
+    __slots__ = ('registry', 'name', 'start')
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.registry.inc(f'{self.name}_errors')
+        return False
+
+
+class MetricsRegistry:
+    """一次运行的计数器和耗时直方图"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def snapshot(self):
+        """
+        当前指标的快照
+
+        Returns:
+            dict: 包含开始时间、运行秒数、计数器和各直方图摘要的字典
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {name: h.summary() for name, h in sorted(self.histograms.items())}
+        return {
+            'started_at': datetime.fromtimestamp(self.started).strftime('%Y-%m-%d %H:%M:%S'),
+            'elapsed_seconds': round(time.time() - self.started, 3),
+            'counters': dict(sorted(counters.items())),
+            'histograms': histograms
+        }
+
+    def summary_line(self):
+        """一行文字摘要：计数器，以及每个阶段的次数、平均和p99耗时"""
+        snapshot = self.snapshot()
+        parts = [f"{name}={value}" for name, value in snapshot['counters'].items()]
+        for name, h in snapshot['histograms'].items():
+            parts.append(f"{name} n={h['count']} avg={h['avg'] * 1000:.1f}ms p99={h['p99'] * 1000:.1f}ms")
+        return f"[{snapshot['elapsed_seconds']:.0f}s] " + (' | '.join(parts) or '暂无数据')
+
+    def to_prometheus(self, prefix='weibo'):
+        """
+        转换为Prometheus文本格式，计数器为 {prefix}_{name}_total，直方图为 {prefix}_{name}_seconds
+
+        Returns:
+            str: Prometheus文本格式的指标
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = [(name, list(h.counts), h.count, h.sum) for name, h in sorted(self.histograms.items())]
+
+        lines = []
+        for name, value in counters:
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, counts, count, total in histograms:
+            metric = f"{prefix}_{_metric_name(name)}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+            lines += [f"{metric}_sum {total:.6f}", f"{metric}_count {count}"]
+        return '\n'.join(lines) + '\n'
+
+
+def _metric_name(name):
+    """Prometheus指标名只能包含字母、数字和下划线"""
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def _record_http(url, status_code, latency):
+    """http_client的响应回调：按接口/媒体分别记录请求次数和延迟"""
+    registry = _registry
+    if registry is None:
+        return
+    host = url.split('/')[2].split(':')[0] if '://' in url else ''
+    kind = 'http_api' if any(host == d or host.endswith('.' + d) for d in API_DOMAINS) else 'http_media'
+    registry.observe(kind, latency)
+    if status_code >= 400:
+        registry.inc(f'{kind}_status_{status_code}')
+
+
+class _Reporter:
+    """后台线程：定期输出摘要和Prometheus文件，结束时写JSON报告"""
+
+    def __init__(self, registry, interval, report_path, prometheus_path):
+        self.registry = registry
+        self.interval = interval
+        self.report_path = report_path
+        self.prometheus_path = prometheus_path
+        self._stop = threading.Event()
+        self._thread = None
+        if interval and interval > 0:
+            self._thread = threading.Thread(target=self._run, name='metrics_reporter', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        logger.info(f"指标: {self.registry.summary_line()}")
+        if self.prometheus_path:
+            try:
+                _write_atomic(self.prometheus_path, self.registry.to_prometheus())
+            except OSError as e:
+                logger.warning(f"写入Prometheus指标文件失败: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        if self.report_path:
+            try:
+                _write_atomic(self.report_path, json.dumps(self.registry.snapshot(), ensure_ascii=False, indent=2))
+                logger.info(f"指标报告已保存到: {self.report_path}")
+            except OSError as e:
+                logger.warning(f"写入指标报告失败: {e}")
+
+
+_reporter = None
+
+
+def enable_metrics(interval=30.0, report_path=None, prometheus_path=None):
+    """
+    启用指标收集，程序退出时（或调用 close_metrics）输出最终摘要并写报告
+
+    Args:
+        interval: 定期输出摘要的间隔（秒），0为只在结束时输出
+        report_path: 结束时写入的JSON报告路径，为None时不写
+        prometheus_path: Prometheus文本格式的指标文件，每次输出摘要时重写，为None时不写
+
+    Returns:
+        MetricsRegistry: 本次运行的指标
+    """
+    global _registry, _reporter
+    with _registry_lock:
+        if _registry is not None:
+            return _registry
+        _registry = MetricsRegistry()
+        _reporter = _Reporter(_registry, interval, report_path, prometheus_path)
+        add_response_hook(_record_http)
+        atexit.register(close_metrics)
+    logger.info("已启用指标收集")
+    return _registry
+
+
+def close_metrics():
+    """停止指标收集，输出最终摘要并写报告"""
+    global _registry, _reporter
+    with _registry_lock:
+        reporter, _registry, _reporter = _reporter, None, None
+        remove_response_hook(_record_http)
+    if reporter is not None:
+        reporter.close()
+
+
+def get_metrics():
+    """当前的指标，未启用时返回None"""
+    return _registry
+
+
+def inc(name, value=1):
+    """计数器加value，未启用时不做任何事"""
+    registry = _registry
+    if registry is not None:
+        registry.inc(name, value)
+
+
+def observe(name, seconds):
+    """记录一次耗时，未启用时不做任何事"""
+    registry = _registry
+    if registry is not None:
+        registry.observe(name, seconds)
+
+
+def span(name):
+    """
+    计时上下文：with span('stage'): ...
+
+    未启用时返回共享的空上下文
+    """
+    registry = _registry
+    if registry is None:
+        return _NULL_SPAN
+    return _Span(registry, name)
+
+
+def timed(name):
+    """
+    函数计时装饰器，未启用时直接调用原函数
+
+    Args:
+        name: 直方图名称
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            registry = _registry
+            if registry is None:
+                return func(*args, **kwargs)
+            with _Span(registry, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
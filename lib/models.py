@@ -0,0 +1,123 @@
+from dataclasses import dataclass, field, fields
+
+
+@dataclass(slots=True)
+class Task:
+    """下载任务，字段顺序与 tasks 表的列一致"""
+    url: str
+    status: str = 'pending'
+    notes: str = ''
+    created_at: str = ''
+    completed_at: str = ''
+    priority: int = 0
+
+    @classmethod
+    def from_row(cls, row):
+        """从按 TASK_COLUMNS 顺序查询的数据库行创建任务"""
+        return cls(*row)
+
+
+@dataclass(slots=True)
+class FavoriteRef:
+    """收藏列表中的一条微博"""
+    url: str
+    favorited_time: str = ''
+
+    @property
+    def mblogid(self):
+        """微博链接中的BID"""
+        return self.url.rsplit('/', 1)[-1]
+
+    def to_csv_row(self):
+        """转换为收藏列表CSV的一行"""
+        return [self.url, self.favorited_time]
+
+
+@dataclass(slots=True)
+class MediaItem:
+    """
+    微博中的一个媒体文件
+
+    extract_media 提取时只有类型、链接和序号；填写 user_id、bid 后即作为媒体下载任务，
+    文件名为 {user_id}_{bid}_{index}{扩展名}
+    """
+    kind: str                   # image / livephoto / video
+    url: str
+    index: int
+    resolution: int = 0         # 视频宽度，图片为0
+    user_id: str = ''
+    bid: str = ''
+    overwrite: bool = False
+
+    @property
+    def is_video(self):
+        """是否为视频（包括LivePhoto）"""
+        return self.kind != 'image'
+
+
+@dataclass(slots=True)
+class ParsedWeibo:
+    """
+    解析后的微博
+
+    图片、视频、话题等多值字段为列表，写入CSV时再用逗号连接（to_csv_row / from_csv_row）
+    """
+    id: str = ''
+    bid: str = ''
+    user_id: str = ''
+    screen_name: str = ''
+    text: str = ''
+    article_url: str = ''
+    topics: list = field(default_factory=list)
+    pics: list = field(default_factory=list)            # 图片本地路径
+    videos: list = field(default_factory=list)          # 视频本地路径
+    source_url: str = ''
+    retweet_id: str = ''
+    retweet_text: str = ''
+    retweet_screen_name: str = ''
+    retweet_user_id: str = ''
+    retweet_pics: list = field(default_factory=list)
+    retweet_videos: list = field(default_factory=list)
+    retweet_source_url: str = ''
+    created_at: str = ''
+    original_pics: list = field(default_factory=list)   # 图片原始URL
+    original_videos: list = field(default_factory=list) # 视频原始URL
+    media_jobs: list = field(default_factory=list)      # 待下载的 MediaItem
+    is_retweet: bool = False
+
+    def to_csv_row(self, headers):
+        """
+        按表头顺序转换为CSV的一行，列表字段用逗号连接
+
+        Args:
+            headers: CSV表头（字段名列表）
+
+        Returns:
+            list: CSV行
+        """
+        row = []
+        for key in headers:
+            value = getattr(self, key, '')
+            row.append(','.join(value) if isinstance(value, list) else value)
+        return row
+
+    @classmethod
+    def from_csv_row(cls, row):
+        """
+        从CSV读取的字典（csv.DictReader 的一行）创建微博，逗号连接的字段拆分为列表
+
+        Args:
+            row: CSV行字典
+
+        Returns:
+            ParsedWeibo: 微博数据
+        """
+        values = {}
+        for f in fields(cls):
+            if f.name not in row or f.name == 'media_jobs':
+                continue
+            value = row[f.name]
+            if f.type is list or f.type == 'list':
+                value = [item for item in (value or '').split(',') if item]
+            values[f.name] = value if value is not None else ''
+        return cls(**values)
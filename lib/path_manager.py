@@ -1,9 +1,42 @@
 import os
 import json
+import threading
 
 from .logger import setup_logger
 logger = setup_logger()
 
+# 解析后的下载目录在一次运行中只计算一次，setting.json变化时需调用 invalidate_download_paths
+_download_paths = None
+_download_paths_lock = threading.Lock()
+
+def get_download_paths():
+    """
+    获取下载目录（base/weibo/media），首次调用时读取设置并创建目录，之后直接返回缓存
+
+    Returns:
+        dict: 包含 base、weibo、media 三个目录的字典
+    """
+    global _download_paths
+
+    paths = _download_paths
+    if paths is not None:
+        return paths
+
+    # 读取设置（可能需要提示用户输入并保存）不能在持有锁时进行：
+    # save_download_path 会调用 invalidate_download_paths 再次获取同一把锁
+    paths = create_download_directories(get_download_path())
+    with _download_paths_lock:
+        if _download_paths is None:
+            _download_paths = paths
+        return _download_paths
+
+def invalidate_download_paths():
+    """清除下载目录缓存，下次调用 get_download_paths 时重新读取setting.json"""
+    global _download_paths
+
+    with _download_paths_lock:
+        _download_paths = None
+
 def get_download_path():
     """获取下载路径，如果不存在则提示用户输入"""
     saved_path = None
@@ -70,6 +103,7 @@ def save_download_path(download_path):
         with open('setting.json', 'w', encoding='utf-8') as f:
             json.dump(settings, f, ensure_ascii=False, indent=4)
 
+        invalidate_download_paths()
         return True
     except Exception as e:
         logger.error(f"保存设置时出错：{str(e)}")
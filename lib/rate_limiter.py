@@ -0,0 +1,181 @@
+import time
+import threading
+
+from .logger import setup_logger
+logger = setup_logger()
+
+
+class RateLimiter:
+    """线程安全的令牌桶限速器"""
+
+    def __init__(self, rate, burst=1):
+        """
+        初始化限速器
+
+        Args:
+            rate: 每秒允许的请求数，None或<=0表示不限速
+            burst: 令牌桶容量，允许的突发请求数
+        """
+        self.rate = rate if rate and rate > 0 else None
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        获取一个令牌，令牌不足时阻塞等待
+
+        Returns:
+            float: 本次等待的秒数
+        """
+        if self.rate is None:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """根据服务器响应自动调整速率的令牌桶（AIMD：成功时线性加速，限流/出错时成倍减速，其他4xx不调整）"""
+
+    # 这些状态码表示服务器在限流或过载
+    THROTTLE_STATUS = (418, 429)
+
+    def __init__(self, rate, min_rate, max_rate, increase, decrease=0.5, burst=1):
+        """
+        初始化自适应限速器
+
+        Args:
+            rate: 初始速率（每秒请求数）
+            min_rate: 速率下限
+            max_rate: 速率上限
+            increase: 每次成功响应增加的速率
+            decrease: 限流或出错时速率乘以的系数
+            burst: 令牌桶容量
+        """
+        super().__init__(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._latency_ewma = None
+        self._last_decrease = 0.0
+        self._blocked_until = 0.0
+
+    def acquire(self):
+        """获取一个令牌，服务器要求暂停（Retry-After）时先等待暂停结束"""
+        delay = self._blocked_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return super().acquire() + max(delay, 0.0)
+
+    def _slow_down(self, factor):
+        """成倍降低速率，一个请求间隔内只降低一次，避免并发失败时连续减速"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < 1 / self.rate:
+                return
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * factor)
+            self._tokens = min(self._tokens, 0.0)
+        logger.debug(f"请求速率下调为 {self.rate:.2f} 次/秒")
+
+    def on_response(self, status_code, latency, retry_after=None):
+        """
+        根据响应调整速率
+
+        Args:
+            status_code: HTTP状态码
+            latency: 收到响应头所用的秒数
+            retry_after: 响应中的 Retry-After 头
+        """
+        if status_code in self.THROTTLE_STATUS or status_code >= 500:
+            if retry_after:
+                try:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + float(retry_after))
+                except ValueError:
+                    pass
+            logger.warning(f"服务器返回 {status_code}，降低请求速率")
+            self._slow_down(self.decrease)
+            return
+        if status_code >= 400:
+            # 其他4xx（cookie过期、微博已删除等）不说明服务器的承受能力，既不加速也不减速
+            return
+
+        with self._lock:
+            # 延迟明显高于平时说明服务器变慢，停止加速并轻微减速
+            congested = self._latency_ewma is not None and latency > self._latency_ewma * 3
+            self._latency_ewma = latency if self._latency_ewma is None else self._latency_ewma * 0.8 + latency * 0.2
+            if not congested:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                return
+        self._slow_down(0.8)
+
+    def on_error(self):
+        """请求异常（超时、连接断开）时降低速率"""
+        self._slow_down(self.decrease)
+
+
+# 各类host的默认速率设置：接口请求保守，CDN可以快一些
+HOST_LIMITS = {
+    'api': {'rate': 0.5, 'min_rate': 0.1, 'max_rate': 2.0, 'increase': 0.05},
+    'cdn': {'rate': 5.0, 'min_rate': 0.5, 'max_rate': 50.0, 'increase': 0.5},
+}
+API_DOMAINS = ('weibo.com', 'weibo.cn')
+
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+
+def configure_host_limits(kind, **kwargs):
+    """
+    修改某类host的速率设置，已创建的限速器会被重建
+
+    Args:
+        kind: 'api' 或 'cdn'
+        **kwargs: rate、min_rate、max_rate、increase 等参数
+
+    Raises:
+        ValueError: min_rate 高于 max_rate
+    """
+    with _host_limiters_lock:
+        limits = dict(HOST_LIMITS[kind])
+        limits.update({k: v for k, v in kwargs.items() if v is not None})
+        # 下限高于上限时 _slow_down 会把速率推到上限之上
+        if limits['min_rate'] > limits['max_rate']:
+            raise ValueError(f"{kind} 的速率下限 {limits['min_rate']} 高于上限 {limits['max_rate']}")
+        HOST_LIMITS[kind] = limits
+        limits['rate'] = min(max(limits['rate'], limits['min_rate']), limits['max_rate'])
+        _host_limiters.clear()
+
+
+def get_host_limiter(host):
+    """
+    获取host对应的自适应限速器
+
+    Args:
+        host: 主机名
+
+    Returns:
+        AdaptiveRateLimiter: 该host共享的限速器
+    """
+    limiter = _host_limiters.get(host)
+    if limiter is not None:
+        return limiter
+
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            kind = 'api' if any(host == d or host.endswith('.' + d) for d in API_DOMAINS) else 'cdn'
+            _host_limiters[host] = AdaptiveRateLimiter(**HOST_LIMITS[kind])
+        return _host_limiters[host]
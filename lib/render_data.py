@@ -0,0 +1,154 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 详情页中 $render_data 的赋值语句：var $render_data = [{...}][0] || {};
+RENDER_DATA_MARKER = 'var $render_data = '
+# 数组之后的取下标和默认值，出现时才尝试解析
+RENDER_DATA_CLOSE = '][0] || {};'
+
+_raw_decoder = json.JSONDecoder()
+
+
+def _parse_candidate(data):
+    """
+    解析一个候选范围，只用一个解析器：安装了 orjson 时用它，否则用标准库
+
+    候选位于字符串内部时解析失败是正常情况，不再用另一个解析器重复解析；
+    orjson 不接受的少见输入由 finish 中标准库的 raw_decode 处理
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class RenderDataScanner:
+    """
+    增量提取详情页中的 $render_data
+
+    先查找赋值标记，再查找其后的 "][0] || {};"，只在出现该结束符时用JSON解析器验证一次：
+    结束符位于字符串内部时解析失败，继续等待下一个；第一个能完整解析的就是数组的结束位置。
+    查找和配对都在C实现中完成，不使用回溯的正则。
+
+    可以分块喂入流式响应（字节串或字符串）：找到标记之前只保留可能被截断的标记开头；
+    找到标记后从标记所在的块开始保留在片段列表中，只在验证候选时拼接。
+    每块只在新内容和上一块末尾中查找，总耗时与页面长度成线性，解析成功后即可停止读取
+    """
+
+    def __init__(self):
+        self.result = None
+        self.found = False
+        self._marker = None
+        self._close = None
+        self._empty = None
+        self._tail = None       # 上一块的末尾，用于查找被截断在两块之间的标记或结束符
+        self._start = None      # 数组在已保留内容中的起始位置
+        self._parts = []        # 从标记所在的块开始保留的内容
+        self._size = 0          # 已保留内容的长度
+
+    @property
+    def started(self):
+        """已经找到 $render_data 标记"""
+        return self._start is not None
+
+    def _append(self, chunk):
+        self._parts.append(chunk)
+        self._size += len(chunk)
+
+    def _content(self):
+        """已保留的全部内容，拼接后替换原来的片段，之后的候选不再重复拼接已有部分"""
+        if len(self._parts) > 1:
+            self._parts = [self._empty.join(self._parts)]
+        return self._parts[0] if self._parts else self._empty
+
+    def _window(self, chunk):
+        """上一块末尾加上新内容，没有末尾时直接使用新内容，不复制"""
+        return self._tail + chunk if self._tail else chunk
+
+    def feed(self, chunk):
+        """
+        喂入一段HTML
+
+        Args:
+            chunk: HTML片段，同一个扫描器中类型需一致（bytes 或 str）
+
+        Returns:
+            bool: 已解析出 $render_data 时返回True
+        """
+        if self.found:
+            return True
+        if self._marker is None:
+            is_bytes = isinstance(chunk, (bytes, bytearray))
+            self._marker = RENDER_DATA_MARKER.encode() if is_bytes else RENDER_DATA_MARKER
+            self._close = RENDER_DATA_CLOSE.encode() if is_bytes else RENDER_DATA_CLOSE
+            self._empty = b'' if is_bytes else ''
+        if isinstance(chunk, bytearray):
+            chunk = bytes(chunk)
+
+        window = self._window(chunk)
+        if self._start is None:
+            index = window.find(self._marker)
+            if index < 0:
+                self._tail = window[-(len(self._marker) - 1):]
+                return False
+            # 从标记所在的块开始保留，之前的块已经丢弃
+            self._append(window)
+            self._start = index + len(self._marker)
+            window_offset = 0
+            search = self._start
+        else:
+            window_offset = self._size - len(self._tail)
+            search = 0
+            self._append(chunk)
+        self._tail = window[-(len(self._close) - 1):]
+
+        close = window.find(self._close, search)
+        while close >= 0:
+            end = window_offset + close + 1
+            try:
+                self.result = _parse_candidate(self._content()[self._start:end])
+                self.found = True
+                self._parts = []
+                return True
+            except ValueError:
+                close = window.find(self._close, close + 1)
+        return False
+
+    def finish(self):
+        """
+        输入结束时调用：没有可解析的结束符时，用标准库从数组开头解析一个完整的JSON值
+
+        Returns:
+            bool: 已解析出 $render_data 时返回True
+        """
+        if self.found or self._start is None:
+            return self.found
+        text = self._content()[self._start:]
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', errors='replace')
+        try:
+            self.result = _raw_decoder.raw_decode(text.lstrip())[0]
+            self.found = True
+        except ValueError:
+            pass
+        self._parts = []
+        return self.found
+
+
+def extract_render_data(html):
+    """
+    从完整的详情页HTML中解析 $render_data 数组
+
+    Args:
+        html: 详情页HTML（str 或 UTF-8 bytes）
+
+    Returns:
+        list: $render_data 数组，没有找到或无法解析时返回None
+    """
+    scanner = RenderDataScanner()
+    if not scanner.feed(html):
+        scanner.finish()
+    return scanner.result if scanner.found else None
@@ -0,0 +1,87 @@
+import os
+import threading
+
+from .weibo_api import extract_ids_from_url
+from .path_manager import get_download_paths
+from .logger import setup_logger
+logger = setup_logger()
+
+
+class SkipIndex:
+    """
+    已完成微博的索引，用于在请求网络之前跳过已完整下载的任务
+
+    启动时读取一次存档数据库中的链接和媒体记录，并扫描一次媒体目录；
+    微博已存档、应有的媒体都已记录且文件都存在时视为已完成。运行期间完成的微博通过 add 加入索引
+    """
+
+    def __init__(self, archive, media_dir=None):
+        """
+        构建索引
+
+        Args:
+            archive: WeiboArchive 实例
+            media_dir: 媒体目录，为None时使用下载目录下的 media 目录
+        """
+        self.media_dir = media_dir or get_download_paths()['media']
+        self._lock = threading.Lock()
+        self._links, self._media = archive.load_manifest()
+        self._files = self._scan_files()
+        logger.info(f"已加载跳过索引: {len(self._media)} 条已存档微博, {len(self._files)} 个媒体文件")
+
+    def _scan_files(self):
+        """扫描一次媒体目录，返回已存在的媒体文件名集合"""
+        files = set()
+        try:
+            with os.scandir(self.media_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        files.add(entry.name)
+        except FileNotFoundError:
+            pass
+        return files
+
+    @staticmethod
+    def _file_name(path):
+        """媒体相对路径中的文件名，兼容不同系统的路径分隔符"""
+        return path.replace('\\', '/').rsplit('/', 1)[-1]
+
+    @staticmethod
+    def _link_key(url):
+        """任务链接中的BID"""
+        return extract_ids_from_url(url)[1]
+
+    def is_complete(self, url):
+        """
+        判断任务链接对应的微博是否已完整下载
+
+        Args:
+            url: 任务链接
+
+        Returns:
+            bool: 已存档且媒体文件齐全时返回True
+        """
+        key = self._link_key(url)
+        with self._lock:
+            bid = self._links.get(key)
+            if bid is None:
+                return False
+            expected, paths = self._media[bid]
+            # 从CSV导入的旧存档不知道应有的媒体数量，只检查已记录的文件
+            if expected is not None and len(paths) < expected:
+                return False
+            return all(self._file_name(path) in self._files for path in paths)
+
+    def add(self, url, weibo):
+        """
+        将运行中完成的微博加入索引
+
+        Args:
+            url: 任务链接
+            weibo: 已保存的 ParsedWeibo
+        """
+        paths = weibo.pics + weibo.videos
+        with self._lock:
+            self._links[self._link_key(url)] = weibo.bid
+            self._media[weibo.bid] = (len(weibo.media_jobs), paths)
+            self._files.update(self._file_name(path) for path in paths)
@@ -2,46 +2,187 @@
 
 import os
 import csv
-from datetime import datetime
+import sqlite3
+import threading
+from datetime import datetime, timedelta
 
 from .favorites_crawler import FavoritesCrawler
+from .async_crawler import fetch_all_favorites
+from .models import Task
+from .metrics import timed
 from .logger import setup_logger
 logger = setup_logger()
 
-def init_tasks_file():
-    """初始化任务文件，如果不存在则创建"""
-    file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'download_tasks.csv')
+TASK_COLUMNS = ['url', 'status', 'notes', 'created_at', 'completed_at', 'priority']
 
-    if not os.path.exists(file_path):
-        with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['url', 'status', 'notes', 'created_at', 'completed_at'])
-        logger.info(f"已创建任务文件: {file_path}")
+# 处理中的任务超过该时间（秒）仍未完成，视为上次运行中断遗留的任务
+STALE_PROCESSING_SECONDS = 600
 
-    return file_path
+_db_lock = threading.RLock()
+_connection = None
+_db_path = None
 
-def add_task(url, notes=''):
+def get_tasks_csv_path():
+    """获取旧版CSV任务文件路径"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'download_tasks.csv')
+
+def get_tasks_db_path():
+    """获取任务数据库路径，默认为模块目录下的 download_tasks.db"""
+    return _db_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'download_tasks.db')
+
+def set_tasks_db_path(path):
+    """
+    使用其他位置的任务数据库（如基准测试的临时目录），已打开的连接会被关闭
+
+    Args:
+        path: 数据库路径，为None时恢复默认路径
+    """
+    global _connection, _db_path
+
+    with _db_lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+        _db_path = path
+
+def init_tasks_db():
+    """
+    初始化任务数据库，如果不存在则创建表和索引
+
+    首次创建数据库时，如果存在旧版 download_tasks.csv，会自动导入一次
+
+    Returns:
+        sqlite3.Connection: 任务数据库连接
+    """
+    global _connection
+
+    with _db_lock:
+        if _connection is not None:
+            return _connection
+
+        file_path = get_tasks_db_path()
+        is_new = not os.path.exists(file_path)
+
+        conn = sqlite3.connect(file_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tasks ('
+                'url TEXT PRIMARY KEY, '
+                "status TEXT NOT NULL DEFAULT 'pending', "
+                "notes TEXT NOT NULL DEFAULT '', "
+                "created_at TEXT NOT NULL DEFAULT '', "
+                "completed_at TEXT NOT NULL DEFAULT '')"
+            )
+
+            # 旧的任务库没有优先级、领取时间和领取前的状态，补充列
+            existing = {row['name'] for row in conn.execute('PRAGMA table_info(tasks)')}
+            if 'priority' not in existing:
+                conn.execute('ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0')
+            if 'claimed_at' not in existing:
+                conn.execute("ALTER TABLE tasks ADD COLUMN claimed_at TEXT NOT NULL DEFAULT ''")
+            if 'claimed_from' not in existing:
+                conn.execute("ALTER TABLE tasks ADD COLUMN claimed_from TEXT NOT NULL DEFAULT ''")
+
+            # 按状态取任务时按优先级从高到低、同优先级按添加顺序，不需要额外排序
+            conn.execute('DROP INDEX IF EXISTS idx_tasks_status')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks(status, priority DESC)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks(priority DESC)')
+
+            # 忽略状态重新处理全部任务时的进度，中断后从这里继续
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS task_cursor ('
+                'name TEXT PRIMARY KEY, priority INTEGER NOT NULL, last_rowid INTEGER NOT NULL, '
+                'updated_at TEXT NOT NULL)'
+            )
+        _connection = conn
+
+        if is_new:
+            logger.info(f"已创建任务数据库: {file_path}")
+            # 只有默认位置的新数据库才导入旧版CSV
+            if _db_path is None and os.path.exists(get_tasks_csv_path()):
+                import_tasks_from_csv(get_tasks_csv_path())
+
+        return _connection
+
+def import_tasks_from_csv(csv_path=None):
+    """
+    将旧版CSV任务文件一次性导入任务数据库
+
+    同一URL在CSV中出现多次时，以最后一行为准
+
+    Args:
+        csv_path: CSV任务文件路径，为None时使用 lib/download_tasks.csv
+
+    Returns:
+        int: 导入的任务数量
+    """
+    if csv_path is None:
+        csv_path = get_tasks_csv_path()
+
+    if not os.path.exists(csv_path):
+        logger.warning(f"未找到CSV任务文件: {csv_path}")
+        return 0
+
+    try:
+        conn = init_tasks_db()
+        count = 0
+        with _db_lock, conn, open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                url = (row.get('url') or '').strip()
+                if not url:
+                    continue
+                conn.execute(
+                    'INSERT INTO tasks (url, status, notes, created_at, completed_at) '
+                    'VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT(url) DO UPDATE SET status = excluded.status, notes = excluded.notes, '
+                    'completed_at = excluded.completed_at',
+                    (url,
+                     (row.get('status') or 'pending').strip().lower(),
+                     row.get('notes') or '',
+                     row.get('created_at') or '',
+                     row.get('completed_at') or '')
+                )
+                count += 1
+
+        logger.info(f"已从 {csv_path} 导入 {count} 个任务")
+        return count
+    except Exception as e:
+        logger.error(f"导入CSV任务文件失败: {str(e)}")
+        return 0
+
+def add_task(url, notes='', priority=0):
     """
     添加新的下载任务
 
     Args:
         url: 任务URL
         notes: 任务备注
+        priority: 优先级，数值大的先处理
 
     Returns:
-        bool: 添加是否成功
+        bool: 添加是否成功，任务已存在时返回False
     """
     try:
-        file_path = init_tasks_file()
-
         if not url:
             logger.error("URL不能为空，任务添加取消")
             return False
 
-        with open(file_path, 'a', encoding='utf-8-sig', newline='') as f:
-            writer = csv.writer(f)
-            created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            writer.writerow([url, 'pending', notes, created_at, ''])
+        conn = init_tasks_db()
+        created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with _db_lock, conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO tasks (url, status, notes, created_at, completed_at, priority) '
+                "VALUES (?, 'pending', ?, ?, '', ?)",
+                (url, notes, created_at, priority)
+            )
+
+        if cursor.rowcount == 0:
+            logger.debug(f"任务已存在，跳过: {url}")
+            return False
 
         logger.info(f"已添加任务: {url}")
         return True
@@ -66,6 +207,7 @@ def add_task_interactive():
         logger.error(f"交互式添加任务失败: {str(e)}")
         return False
 
+@timed('update_task_status')
 def update_task_status(url, status='completed'):
     """
     更新任务状态
@@ -78,31 +220,18 @@ def update_task_status(url, status='completed'):
         bool: 更新是否成功
     """
     try:
-        file_path = init_tasks_file()
-        temp_file = file_path + '.temp'
-
-        found = False
-        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f_in, \
-             open(temp_file, 'w', encoding='utf-8-sig', newline='') as f_out:
-            reader = csv.reader(f_in)
-            writer = csv.writer(f_out)
-
-            header = next(reader)
-            writer.writerow(header)
-
-            for row in reader:
-                if row[0] == url:
-                    found = True
-                    row[1] = status
-                    if status == 'completed':
-                        row[4] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                writer.writerow(row)
-
+        conn = init_tasks_db()
+        completed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S') if status == 'completed' else None
+        with _db_lock, conn:
+            cursor = conn.execute(
+                'UPDATE tasks SET status = ?, completed_at = COALESCE(?, completed_at) WHERE url = ?',
+                (status, completed_at, url)
+            )
+
+        found = cursor.rowcount > 0
         if found:
-            os.replace(temp_file, file_path)
             logger.info(f"已更新任务状态: {url} -> {status}")
         else:
-            os.remove(temp_file)
             logger.warning(f"未找到任务: {url}")
 
         return found
@@ -110,62 +239,311 @@ def update_task_status(url, status='completed'):
         logger.error(f"更新任务状态失败: {str(e)}")
         return False
 
-def get_pending_tasks(ignore_status=False):
+@timed('complete_tasks')
+def complete_tasks(urls):
     """
-    获取待处理的任务
+    在一个事务中将多个任务标记为已完成，用于批量跳过已下载的任务
 
     Args:
-        ignore_status: 是否忽略状态，如果为True则返回所有任务
+        urls: 任务URL列表
 
     Returns:
-        任务列表
+        int: 更新的任务数量
     """
+    if not urls:
+        return 0
     try:
-        file_path = init_tasks_file()
+        conn = init_tasks_db()
+        completed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with _db_lock, conn:
+            cursor = conn.executemany(
+                "UPDATE tasks SET status = 'completed', completed_at = ? WHERE url = ?",
+                [(completed_at, url) for url in urls]
+            )
+        return cursor.rowcount
+    except Exception as e:
+        logger.error(f"批量更新任务状态失败: {str(e)}")
+        return 0
 
-        tasks = []
-        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # 如果ignore_status为True，则返回所有任务
-                # 否则只返回状态为pending的任务
-                if ignore_status or row.get('status', '').lower() == 'pending':
-                    tasks.append(row)
+def get_pending_tasks(ignore_status=False):
+    """
+    获取待处理的任务，按优先级从高到低排列
+
+    一次性读取全部任务，批量处理请使用 iter_tasks
+
+    Args:
+        ignore_status: 是否忽略状态，如果为True则返回所有任务
 
-        return tasks
+    Returns:
+        list: Task 列表
+    """
+    try:
+        conn = init_tasks_db()
+        columns = ', '.join(TASK_COLUMNS)
+
+        # 如果ignore_status为True，则返回所有任务
+        # 否则只返回状态为pending的任务（走status索引）
+        with _db_lock:
+            if ignore_status:
+                rows = conn.execute(f'SELECT {columns} FROM tasks ORDER BY priority DESC, rowid').fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM tasks WHERE status = 'pending' ORDER BY priority DESC, rowid"
+                ).fetchall()
+
+        return [Task.from_row(row) for row in rows]
     except Exception as e:
         logger.error(f"获取待处理任务失败: {str(e)}")
         return []
 
+def set_task_priority(url, priority):
+    """
+    设置任务优先级，数值大的先处理
+
+    Args:
+        url: 任务URL
+        priority: 优先级
+
+    Returns:
+        bool: 任务是否存在
+    """
+    try:
+        conn = init_tasks_db()
+        with _db_lock, conn:
+            cursor = conn.execute('UPDATE tasks SET priority = ? WHERE url = ?', (priority, url))
+        return cursor.rowcount > 0
+    except Exception as e:
+        logger.error(f"设置任务优先级失败: {str(e)}")
+        return False
+
+def recover_stale_tasks(stale_after=STALE_PROCESSING_SECONDS):
+    """
+    将上次运行中断后遗留的处理中任务恢复为领取前的状态
+
+    待处理的任务恢复为待处理；忽略状态遍历全部任务时领取的已完成或失败的任务恢复原状态，
+    之后正常运行时不会重新处理已经完成的任务
+
+    Args:
+        stale_after: 领取超过该秒数的任务视为遗留任务，为0时恢复全部处理中的任务
+
+    Returns:
+        int: 恢复的任务数量
+    """
+    try:
+        conn = init_tasks_db()
+        deadline = (datetime.now() - timedelta(seconds=stale_after)).strftime('%Y-%m-%d %H:%M:%S')
+        with _db_lock, conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = CASE WHEN claimed_from = '' THEN 'pending' ELSE claimed_from END, "
+                "claimed_at = '', claimed_from = '' "
+                "WHERE status = 'processing' AND claimed_at <= ?",
+                (deadline,)
+            )
+        if cursor.rowcount:
+            logger.info(f"已将 {cursor.rowcount} 个中断的处理中任务恢复为领取前的状态")
+        return cursor.rowcount
+    except Exception as e:
+        logger.error(f"恢复处理中任务失败: {str(e)}")
+        return 0
+
+def _claim(conn, where, params, limit):
+    """
+    在一条UPDATE语句中把一批任务标记为处理中并返回，多个进程同时领取时不会重复
+
+    领取前的状态记录在 claimed_from 中，中断后由 recover_stale_tasks 恢复
+
+    Returns:
+        list: (rowid, Task) 列表，按优先级从高到低、同优先级按添加顺序
+    """
+    columns = ', '.join(TASK_COLUMNS)
+    claimed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with _db_lock, conn:
+        rows = conn.execute(
+            "UPDATE tasks SET status = 'processing', claimed_at = ?, claimed_from = status "
+            f'WHERE rowid IN (SELECT rowid FROM tasks WHERE {where} ORDER BY priority DESC, rowid LIMIT ?) '
+            f'RETURNING rowid, {columns}',
+            (claimed_at, *params, limit)
+        ).fetchall()
+    rows.sort(key=lambda row: (-row['priority'], row['rowid']))
+    return [(row['rowid'], Task.from_row(tuple(row)[1:])) for row in rows]
+
+def _load_cursor(conn, name):
+    """读取遍历进度，没有时返回None"""
+    with _db_lock:
+        row = conn.execute('SELECT priority, last_rowid FROM task_cursor WHERE name = ?', (name,)).fetchone()
+    return (row['priority'], row['last_rowid']) if row else None
+
+def _save_cursor(conn, name, priority, last_rowid):
+    """保存遍历进度"""
+    with _db_lock, conn:
+        conn.execute(
+            'INSERT INTO task_cursor (name, priority, last_rowid, updated_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET priority = excluded.priority, last_rowid = excluded.last_rowid, '
+            'updated_at = excluded.updated_at',
+            (name, priority, last_rowid, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        )
+
+def reset_task_cursor():
+    """清除忽略状态处理全部任务时保存的进度，下次从头开始"""
+    conn = init_tasks_db()
+    with _db_lock, conn:
+        conn.execute("DELETE FROM task_cursor WHERE name = 'all'")
+
+def iter_tasks(ignore_status=False, batch_size=20):
+    """
+    逐批领取并返回待处理的任务，按优先级从高到低、同优先级按添加顺序
+
+    每批任务在返回前用一条UPDATE语句标记为处理中（pending -> processing），
+    处理完成后由 update_task_status 更新为 completed 或 failed。
+    程序中断时，处理中的任务由 recover_stale_tasks 恢复为领取前的状态，已完成的任务不会重复处理
+
+    ignore_status 为True时按顺序遍历全部任务（处理中的除外），进度保存在 task_cursor 表，
+    中断后再次运行从上次的位置继续，全部遍历完成后清除进度
+
+    Args:
+        ignore_status: 是否忽略状态，处理所有任务
+        batch_size: 每次领取的任务数
+
+    Yields:
+        Task: 已标记为处理中的任务
+    """
+    conn = init_tasks_db()
+
+    if ignore_status:
+        cursor = _load_cursor(conn, 'all')
+        if cursor:
+            logger.info(f"从上次中断的位置继续处理全部任务（优先级 {cursor[0]}，序号 {cursor[1]}）")
+        while True:
+            if cursor is None:
+                batch = _claim(conn, "status != 'processing'", (), batch_size)
+            else:
+                # 先取同一优先级中剩余的任务，取完后再取下一个优先级，两种查询都直接定位到索引中的位置
+                batch = _claim(conn, "priority = ? AND rowid > ? AND status != 'processing'", cursor, batch_size)
+                if not batch:
+                    batch = _claim(conn, "priority < ? AND status != 'processing'", (cursor[0],), batch_size)
+            if not batch:
+                break
+            last_rowid, last_task = batch[-1]
+            cursor = (last_task.priority, last_rowid)
+            _save_cursor(conn, 'all', *cursor)
+            for _, task in batch:
+                yield task
+
+    # 待处理的任务；忽略状态时为遍历期间新增或恢复的任务
+    while True:
+        batch = _claim(conn, "status = 'pending'", (), batch_size)
+        if not batch:
+            break
+        for _, task in batch:
+            yield task
+
+    if ignore_status:
+        reset_task_cursor()
+
 def get_all_tasks():
     """
     获取所有任务
 
     Returns:
-        所有任务的列表
+        list: 所有任务的 Task 列表
     """
     try:
-        file_path = init_tasks_file()
-
-        all_tasks = []
-        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                all_tasks.append(row)
+        conn = init_tasks_db()
+        columns = ', '.join(TASK_COLUMNS)
+        with _db_lock:
+            rows = conn.execute(f'SELECT {columns} FROM tasks ORDER BY rowid').fetchall()
 
-        return all_tasks
+        return [Task.from_row(row) for row in rows]
     except Exception as e:
         logger.error(f"获取所有任务失败: {str(e)}")
         return []
 
+def get_task(url):
+    """
+    按URL获取单个任务
+
+    Args:
+        url: 任务URL
+
+    Returns:
+        Task: 任务，不存在时返回None
+    """
+    try:
+        conn = init_tasks_db()
+        columns = ', '.join(TASK_COLUMNS)
+        with _db_lock:
+            row = conn.execute(f'SELECT {columns} FROM tasks WHERE url = ?', (url,)).fetchone()
+
+        return Task.from_row(row) if row else None
+    except Exception as e:
+        logger.error(f"获取任务失败: {str(e)}")
+        return None
+
+def task_exists(url):
+    """
+    判断任务是否已在任务队列中
+
+    Args:
+        url: 任务URL
+
+    Returns:
+        bool: 任务是否存在
+    """
+    try:
+        conn = init_tasks_db()
+        with _db_lock:
+            row = conn.execute('SELECT 1 FROM tasks WHERE url = ?', (url,)).fetchone()
+        return row is not None
+    except Exception as e:
+        logger.error(f"查询任务失败: {str(e)}")
+        return False
+
 class FavoritesTask:
     """收藏微博任务类"""
-    def __init__(self, max_pages=5):
+    def __init__(self, max_pages=5, incremental=False, use_async=False):
         self.max_pages = max_pages
+        self.incremental = incremental
+        self.use_async = use_async
 
     def run(self):
         crawler = FavoritesCrawler()
-        favorites = crawler.get_all_favorites(max_pages=self.max_pages)
+
+        if self.incremental:
+            added = []
+
+            def enqueue(new_favorites):
+                # 同步状态保存后这些微博不会再被获取，必须先加入任务队列
+                for favorite in new_favorites:
+                    if add_task(favorite.url, notes='从收藏微博自动添加'):
+                        added.append(favorite.url)
+
+            favorites = crawler.get_new_favorites(max_pages=self.max_pages, is_known=task_exists, on_new=enqueue)
+            if not favorites:
+                return {
+                    'status': 'success',
+                    'message': '没有新的收藏微博',
+                    'data': {
+                        'count': 0,
+                        'filename': None,
+                        'added': 0
+                    }
+                }
+            filename = crawler.save_to_csv(favorites, filename=f"weibo/favorites_{datetime.now().strftime('%Y%m%d_%H%M%S')}_new.csv")
+            return {
+                'status': 'success',
+                'message': f'增量同步获取 {len(favorites)} 条新收藏微博URL，已将 {len(added)} 条添加到下载任务',
+                'data': {
+                    'count': len(favorites),
+                    'filename': filename,
+                    'added': len(added)
+                }
+            }
+
+        if self.use_async:
+            # 异步引擎在解析当前页时预取下一页
+            favorites = fetch_all_favorites(max_pages=self.max_pages)
+        else:
+            favorites = crawler.get_all_favorites(max_pages=self.max_pages)
 
         if favorites:
             filename = crawler.save_to_csv(favorites)
@@ -190,7 +568,9 @@ def create_task(task_type, **kwargs):
     # 添加收藏微博任务类型
     if task_type == 'favorites':
         max_pages = kwargs.get('max_pages', 5)
-        return FavoritesTask(max_pages=max_pages)
+        incremental = kwargs.get('incremental', False)
+        use_async = kwargs.get('use_async', False)
+        return FavoritesTask(max_pages=max_pages, incremental=incremental, use_async=use_async)
 
     # ... 现有代码 ...
 
@@ -0,0 +1,82 @@
+import re
+import unicodedata
+from urllib.parse import unquote
+
+from .logger import setup_logger
+logger = setup_logger()
+
+# 预编译的正则，避免每条微博都重新查找/编译
+_LINK_PATTERN = re.compile(r'<a[^>]*href="([^"]*)"[^>]*>(.*?)</a>')
+_TAG_PATTERN = re.compile(r'<[^<]+?>')
+_TOPIC_PATTERN = re.compile(r'#(.*?)#')
+_URL_PATTERN = re.compile(r'https?://\S+')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def _convert_link(match):
+    """
+    将链接转换为Markdown格式
+
+    表情链接、站内链接（@用户等）和话题链接只保留文字，微博外链警告页还原为真实URL
+    """
+    url = match.group(1)
+    link_text = match.group(2)
+
+    if url.startswith('/') or 'emotion' in url or '#' in link_text:
+        return link_text
+
+    # 处理微博外链警告链接
+    if 'sinaurl?u=' in url:
+        real_url = url.split('sinaurl?u=', 1)[1]
+        # 解码百分比编码
+        try:
+            real_url = unquote(real_url)
+        except Exception as e:
+            logger.warning(f"解码URL失败: {e}")
+        url = real_url
+
+    return f"[{link_text}]({url})"
+
+
+def normalize_weibo_text(html):
+    """
+    将微博正文HTML转换为纯文本：链接转为Markdown、去掉其他标签和换行，同时提取话题
+
+    所有替换都由预编译的正则在C层完成；话题在去掉标签之后、去掉换行之前提取，
+    因此话题中不会残留HTML标签，也不会跨行
+
+    Args:
+        html: 微博接口返回的正文HTML
+
+    Returns:
+        tuple: (清理后的文本, 话题列表)
+    """
+    if not html:
+        return '', []
+
+    text = _LINK_PATTERN.sub(_convert_link, html)
+    if '<' in text:
+        text = _TAG_PATTERN.sub('', text)
+    topics = _TOPIC_PATTERN.findall(text) if '#' in text else []
+    return text.replace('\n', '').strip(), topics
+
+
+def canonical_text(text):
+    """
+    生成用于判断内容是否相同的规范文本：全角半角统一、转小写、去掉链接、合并空白
+
+    转发和重新抓取的同一内容只在链接（短链每次不同）和空白上有差异，规范化后相同
+
+    Args:
+        text: normalize_weibo_text 清理后的文本
+
+    Returns:
+        str: 规范文本
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).lower()
+    if '://' in text:
+        text = _URL_PATTERN.sub('', text)
+    return _SPACE_PATTERN.sub(' ', text).strip()
+
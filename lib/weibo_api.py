@@ -1,6 +1,8 @@
 import re
-import json
-import requests
+
+from .http_client import http_get
+from .render_data import RenderDataScanner
+from .metrics import timed
 
 from .logger import setup_logger
 logger = setup_logger()
@@ -15,39 +17,111 @@ def extract_ids_from_url(url):
         return user_id, weibo_id
     return None, None
 
-# 获取单条微博
-def get_single_weibo(user_id, weibo_id, cookie):
-    logger.debug("使用HTML解析方式获取微博数据")
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36",
-        "Cookie": cookie,
+# 微博详情页，页面中的 $render_data 包含完整的微博数据
+DETAIL_URL = "https://m.weibo.cn/detail/{weibo_id}"
+
+# 流式读取详情页时每次读取的大小
+DETAIL_CHUNK_SIZE = 16 * 1024
+
+# $render_data 之后剩余的内容不超过该大小时读完，使连接回到连接池复用；超过时直接关闭连接
+DETAIL_DRAIN_LIMIT = 64 * 1024
+
+def detail_headers(weibo_id):
+    """详情页请求需要的请求头"""
+    return {
         "X-Requested-With": "XMLHttpRequest",
         "Referer": f"https://m.weibo.cn/detail/{weibo_id}"
     }
 
-    # 使用微博详情页API
-    url = f"https://m.weibo.cn/detail/{weibo_id}"
+def _status_from_scanner(scanner):
+    """从扫描到的 $render_data 中取出微博数据"""
+    if scanner.found:
+        # $render_data = [{...}][0]
+        render_data = scanner.result
+        if isinstance(render_data, list) and render_data and isinstance(render_data[0], dict) \
+                and 'status' in render_data[0]:
+            logger.debug("成功从HTML中提取到微博数据")
+            return render_data[0]['status']
+    elif scanner.started:
+        logger.error("无法解析详情页中的JSON数据")
+    else:
+        logger.warning("未找到渲染数据，尝试其他方式提取")
+
+    logger.error("获取微博数据失败")
+    return None
+
+def parse_detail_html(html):
+    """
+    从详情页HTML中提取微博数据
+
+    Args:
+        html: 详情页HTML
+
+    Returns:
+        dict: 微博数据（$render_data 中的 status），提取失败时返回None
+    """
+    scanner = RenderDataScanner()
+    if not scanner.feed(html):
+        scanner.finish()
+    return _status_from_scanner(scanner)
+
+def _drain_response(response, chunks):
+    """
+    读完 $render_data 之后剩余的内容
+
+    未读完的响应在关闭时会连同连接一起丢弃，下一次请求要重新建立TCP/TLS连接；
+    详情页在 $render_data 之后只剩很短的一段，读完的代价远小于重新握手。
+    剩余内容超过 DETAIL_DRAIN_LIMIT 时放弃读取，由关闭响应断开连接
+
+    Args:
+        response: 流式响应
+        chunks: 该响应正在使用的 iter_content 迭代器
+    """
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) - response.raw.tell() > DETAIL_DRAIN_LIMIT:
+        return
+    drained = 0
+    for chunk in chunks:
+        drained += len(chunk)
+        if drained > DETAIL_DRAIN_LIMIT:
+            return
+
+def read_detail_response(response):
+    """
+    从流式的详情页响应中提取微博数据，$render_data 解析完成后只读完剩余的少量内容，不再解析
+
+    直接处理UTF-8字节，不对整个页面解码
+
+    Args:
+        response: 以 stream=True 发出的请求的响应
+
+    Returns:
+        dict: 微博数据，提取失败时返回None
+    """
+    scanner = RenderDataScanner()
+    chunks = response.iter_content(chunk_size=DETAIL_CHUNK_SIZE)
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            _drain_response(response, chunks)
+            break
+    else:
+        scanner.finish()
+    return _status_from_scanner(scanner)
+
+# 获取单条微博，cookie为None时使用 http_client.set_cookie 设置的cookie
+@timed('get_single_weibo')
+def get_single_weibo(user_id, weibo_id, cookie=None, detail_url=DETAIL_URL):
+    logger.debug("使用HTML解析方式获取微博数据")
+    headers = detail_headers(weibo_id)
+    if cookie:
+        headers["Cookie"] = cookie
+
+    # 使用微博详情页API，流式读取，找到 $render_data 后只读完剩余的少量内容
+    url = detail_url.format(weibo_id=weibo_id)
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        html = response.text
-        data_pattern = r'var \$render_data = \[(.*?)\]\[0\] \|\| \{\};'
-        match = re.search(data_pattern, html, re.DOTALL)
-
-        if match:
-            json_str = match.group(1)
-            try:
-                render_data = json.loads(json_str)
-                if 'status' in render_data:
-                    logger.debug("成功从HTML中提取到微博数据")
-                    return render_data['status']
-            except json.JSONDecodeError:
-                logger.error("无法解析详情页中的JSON数据")
-        else:
-            logger.warning("未找到渲染数据，尝试其他方式提取")
-
-        logger.error("获取微博数据失败")
-        return None
+        with http_get(url, headers=headers, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            return read_detail_response(response)
     except Exception as e:
         logger.error(f"获取微博数据出错: {e}")
-        return None 
\ No newline at end of file
+        return None
@@ -8,81 +8,277 @@ os.environ["NUMEXPR_MAX_THREADS"] = str(cpu_count)
 import argparse
 import sys
 import csv
+import glob
+import json
+from datetime import datetime
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 from lib.config import ConfigManager  # 从config.py导入配置函数
 from lib.weibo_api import extract_ids_from_url, get_single_weibo  # 从weibo_api.py导入函数
-from lib.weibo_parser import parse_weibo_data  # 从新的weibo_parser.py导入函数
-from lib.data_storage import save_to_csv  # 从新的data_storage.py导入函数
-from lib.task_manager import get_pending_tasks, update_task_status, create_task, add_task  # 从新的task_manager.py导入函数
-from lib.path_manager import get_download_path, create_download_directories  # 导入路径管理函数
+from lib.weibo_parser import parse_weibo_data, attach_media_paths  # 从新的weibo_parser.py导入函数
+from lib.data_storage import WeiboCsvWriter  # 从新的data_storage.py导入函数
+from lib.archive import WeiboArchive
+from lib.classifier import BatchClassifier, ClassificationCache, make_provider
+from lib.embeddings import EmbeddingIndex, make_embedder
+from lib.skip_index import SkipIndex
+from lib.async_crawler import fetch_weibos
+from lib.task_manager import iter_tasks, recover_stale_tasks, reset_task_cursor, update_task_status, complete_tasks, create_task, add_task, import_tasks_from_csv  # 从新的task_manager.py导入函数
+from lib.path_manager import get_download_paths  # 导入路径管理函数
+from lib.rate_limiter import RateLimiter, configure_host_limits, HOST_LIMITS
+from lib.http_client import set_cookie, configure_http
+from lib.media_downloader import MediaDownloadStage, enable_media_store
+from lib.debug_capture import enable_debug_capture, find_weibo_capture
+from lib.metrics import enable_metrics, inc, observe, span
 from lib.logger import setup_logger
 logger = setup_logger('weibo')
 
 
-def main(ignore_status=False, overwrite_pics=False, overwrite_videos=False):
-    # 获取下载路径
-    download_paths = create_download_directories(get_download_path())
-    logger.info(f"下载路径设置为: {download_paths['base']}")
-
-    # 从任务文件获取待处理任务
-    tasks = get_pending_tasks(ignore_status)
-    if not tasks:
-        logger.info("没有待处理的任务")
-        return
-
-    logger.info(f"找到 {len(tasks)} 个待处理任务")
+def process_task(task, media_stage, writer, archive, overwrite_pics=False, overwrite_videos=False, skip_index=None,
+                 weibo=None):
+    """
+    处理单个下载任务：获取、解析、下载媒体并保存
 
-    # 获取配置
-    config = ConfigManager()
-    cookie = config.get_cookie()
+    Args:
+        task: 下载任务（Task）
+        media_stage: 媒体下载阶段
+        writer: 微博数据写入器
+        archive: 微博存档数据库
+        overwrite_pics: 是否覆盖已下载的图片
+        overwrite_videos: 是否覆盖已下载的视频
+        skip_index: 已完成微博的索引，保存成功后加入索引
+        weibo: 异步引擎已经获取并解析的微博，为None时在这里获取（异步获取失败的任务在这里重试一次）
 
-    # 处理每个任务
-    for task in tasks:
-        url = task['url']
-        logger.info(f"开始处理任务: {url}")
+    Returns:
+        bool: 任务是否成功
+    """
+    url = task.url
+    logger.info(f"开始处理任务: {url}")
 
+    if weibo is None:
         # 获取用户ID和微博ID
         user_id, weibo_id = extract_ids_from_url(url)
         if not user_id or not weibo_id:
             logger.error(f"无法从URL中提取用户ID和微博ID: {url}")
             update_task_status(url, 'failed')
-            continue
+            return False
 
         # 获取微博数据
-        weibo_data = get_single_weibo(user_id, weibo_id, cookie)
+        weibo_data = get_single_weibo(user_id, weibo_id)
         if not weibo_data:
             logger.error("获取微博数据失败")
             update_task_status(url, 'failed')
-            continue
+            return False
 
         # 解析微博数据
         weibo = parse_weibo_data(weibo_data, user_id, overwrite_pics=overwrite_pics, overwrite_videos=overwrite_videos)
         if not weibo:
             logger.error("解析微博数据失败")
             update_task_status(url, 'failed')
-            continue
+            return False
+
+    # 下载图片和视频
+    with span('media_stage'):
+        media_paths = media_stage.run(weibo.media_jobs)
+    attach_media_paths(weibo, media_paths)
+
+    # 保存到存档数据库
+    with span('archive_save'):
+        saved = archive.save_post(weibo)
+    if not saved:
+        update_task_status(url, 'failed')
+        return False
+    if skip_index is not None:
+        skip_index.add(url, weibo)
+
+    # 保存到CSV，数据落盘后再标记任务完成
+    with span('csv_write'):
+        written = writer.write(weibo, on_flush=lambda: update_task_status(url, 'completed'))
+    if written:
+        logger.info(f"微博爬取成功：{weibo.text[:30]}...")
+        return True
+    else:
+        logger.error("保存微博数据失败")
+        update_task_status(url, 'failed')
+        return False
+
+def skip_completed_tasks(tasks, skip_index, batch_size=500):
+    """
+    跳过已完整下载的任务，不请求网络，跳过的任务批量标记为已完成
+
+    Args:
+        tasks: 任务迭代器
+        skip_index: 已完成微博的索引
+        batch_size: 每批标记的任务数
+
+    Yields:
+        Task: 需要处理的任务
+    """
+    skipped = []
+    count = 0
+    try:
+        for task in tasks:
+            if not skip_index.is_complete(task.url):
+                yield task
+                continue
+            skipped.append(task.url)
+            count += 1
+            if len(skipped) >= batch_size:
+                complete_tasks(skipped)
+                skipped = []
+    finally:
+        complete_tasks(skipped)
+        inc('tasks_skipped', count)
+        if count:
+            logger.info(f"已跳过 {count} 个已完整下载的任务")
+
+def prefetch_weibos(tasks, concurrency, overwrite_pics=False, overwrite_videos=False):
+    """
+    用异步引擎按批并发获取并解析任务对应的微博，处理当前一批时下一批已经在获取
+
+    Args:
+        tasks: 任务迭代器
+        concurrency: 同时进行的详情页请求数
+        overwrite_pics: 是否覆盖已下载的图片
+        overwrite_videos: 是否覆盖已下载的视频
+
+    Yields:
+        tuple: (任务, ParsedWeibo)，获取失败时为None
+    """
+    batch_size = concurrency * 4
+
+    def fetch(batch):
+        return batch, fetch_weibos((task.url for task in batch), overwrite_pics=overwrite_pics,
+                                   overwrite_videos=overwrite_videos, concurrency=concurrency)
+
+    # 领取任务在当前线程进行，获取详情页在后台线程的事件循环中进行
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='detail_prefetch') as fetcher:
+        batch = list(islice(tasks, batch_size))
+        future = fetcher.submit(fetch, batch) if batch else None
+        while future is not None:
+            batch, weibos = future.result()
+            next_batch = list(islice(tasks, batch_size))
+            future = fetcher.submit(fetch, next_batch) if next_batch else None
+            for task in batch:
+                yield task, weibos.get(task.url)
+
+def main(ignore_status=False, overwrite_pics=False, overwrite_videos=False, workers=1, rate_limit=None, media_workers=4, pool_size=None, dedup_media=False, cookie=None,
+         async_fetch=False, async_concurrency=8):
+    """
+    处理下载任务
+
+    Args:
+        ignore_status: 是否忽略任务状态，处理所有任务
+        overwrite_pics: 是否覆盖已下载的图片
+        overwrite_videos: 是否覆盖已下载的视频
+        workers: 并发处理任务的线程数，1为顺序处理
+        rate_limit: 每秒最多开始的任务数，None为不限速
+        media_workers: 同时进行的媒体下载数
+        pool_size: 每个host的最大连接数，默认为任务线程数与媒体下载数之和
+        dedup_media: 是否启用按内容哈希去重的媒体库
+        cookie: 请求使用的cookie，为None时从配置读取
+        async_fetch: 是否用异步引擎预取详情页，任务线程只负责下载媒体和保存
+        async_concurrency: 异步引擎同时进行的详情页请求数
+    """
+    # 获取下载路径
+    download_paths = get_download_paths()
+    logger.info(f"下载路径设置为: {download_paths['base']}")
+
+    if dedup_media:
+        enable_media_store()
 
-        # 保存到CSV
-        if save_to_csv(weibo):
-            logger.info(f"微博爬取成功并已保存：{weibo.get('text', '')[:30]}...")
-            update_task_status(url, 'completed')
+    # 恢复上次运行中断遗留的处理中任务，然后逐批领取待处理任务，不一次性读取整个任务队列
+    recover_stale_tasks()
+    tasks = iter_tasks(ignore_status, batch_size=max(workers * 2, 10))
+
+    # 获取配置，cookie和连接池统一交给共享的HTTP客户端
+    set_cookie(cookie if cookie is not None else ConfigManager().get_cookie())
+    detail_concurrency = async_concurrency if async_fetch else workers
+    configure_http(pool_maxsize=pool_size or workers + media_workers + (async_concurrency if async_fetch else 0))
+
+    # 每个任务至少请求一次详情页接口，接口限速的上限决定了任务吞吐量的上限
+    api_max_rate = HOST_LIMITS['api']['max_rate']
+    if detail_concurrency > api_max_rate:
+        logger.warning(f"微博接口限速上限为每秒 {api_max_rate:g} 次，{detail_concurrency} 个并发的详情页请求中的多数会等待限速；"
+                       f"可用 --api-max-rate 提高上限（过高可能被限流）")
+
+    limiter = RateLimiter(rate_limit)
+    media_stage = MediaDownloadStage(media_workers)
+    writer = WeiboCsvWriter()
+    archive = WeiboArchive()
+
+    # 不覆盖媒体时，已完整下载的微博在请求网络之前跳过
+    skip_index = None
+    if not (overwrite_pics or overwrite_videos):
+        skip_index = SkipIndex(archive)
+        tasks = skip_completed_tasks(tasks, skip_index)
+
+    # 异步模式下详情页由异步引擎并发预取，否则由任务线程各自获取
+    if async_fetch:
+        logger.info(f"异步引擎预取详情页，并发数: {async_concurrency}")
+        items = prefetch_weibos(tasks, async_concurrency, overwrite_pics=overwrite_pics,
+                                overwrite_videos=overwrite_videos)
+    else:
+        items = ((task, None) for task in tasks)
+
+    def run(item):
+        task, weibo = item
+        observe('rate_limit_wait', limiter.acquire())
+        try:
+            with span('task'):
+                ok = process_task(task, media_stage, writer, archive, overwrite_pics=overwrite_pics,
+                                  overwrite_videos=overwrite_videos, skip_index=skip_index, weibo=weibo)
+        except Exception as e:
+            logger.error(f"处理任务时发生未知错误: {e}, URL: {task.url}")
+            update_task_status(task.url, 'failed')
+            ok = False
+        inc('tasks_succeeded' if ok else 'tasks_failed')
+        return ok
+
+    total = 0
+    succeeded = 0
+    with media_stage, writer, archive:
+        # 顺序处理每个任务
+        if workers <= 1:
+            for item in items:
+                total += 1
+                if run(item):
+                    succeeded += 1
         else:
-            logger.error("保存微博数据失败")
-            update_task_status(url, 'failed')
+            # 并发处理：线程池大小即为最大并发任务数，同时提交的任务不超过线程数的两倍
+            logger.info(f"并发模式: {workers} 个工作线程, 限速: {rate_limit or '无'} 任务/秒")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = set()
+                for item in items:
+                    total += 1
+                    futures.add(executor.submit(run, item))
+                    if len(futures) >= workers * 2:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        succeeded += sum(1 for future in done if future.result())
+                for future in as_completed(futures):
+                    if future.result():
+                        succeeded += 1
+
+    if total == 0:
+        logger.info("没有待处理的任务")
+    else:
+        logger.info(f"任务处理完成: 成功 {succeeded} / 共 {total}")
 
-def fetch_favorites(max_pages=5, add_to_tasks=False):
-    """获取收藏微博"""
+def fetch_favorites(max_pages=5, add_to_tasks=False, incremental=False, use_async=False):
+    """获取收藏微博，incremental为True时只获取上次同步之后的新收藏，use_async为True时使用异步引擎获取完整列表"""
     logger.info("开始获取收藏微博...")
 
-    task = create_task('favorites', max_pages=max_pages)
+    task = create_task('favorites', max_pages=max_pages, incremental=incremental, use_async=use_async)
     result = task.run()
 
     if result['status'] == 'success':
         logger.info(result['message'])
+        if not result['data']['filename']:
+            return result
         logger.info(f"数据已保存到: {result['data']['filename']}")
 
-        # 如果需要将URL添加到下载任务
-        if add_to_tasks:
+        # 如果需要将URL添加到下载任务（增量同步时已经在保存同步状态之前添加）
+        if add_to_tasks and not incremental:
             # 读取保存的CSV文件
             with open(result['data']['filename'], mode='r', encoding='utf-8-sig') as file:
                 reader = csv.DictReader(file)
@@ -100,11 +296,67 @@ def fetch_favorites(max_pages=5, add_to_tasks=False):
 
     return result
 
+def migrate_archive():
+    """将已有的每日CSV和收藏列表CSV导入存档数据库"""
+    with WeiboArchive() as archive:
+        archive.import_csv_dir()
+        for file_path in sorted(glob.glob(os.path.join('weibo', 'favorites_*.csv'))):
+            archive.import_favorites_csv(file_path)
+
+def classify_archive(provider='openai', categories=None, concurrency=4, token_budget=3000):
+    """
+    用LLM对存档中的全部微博分类，结果保存到存档的 post_categories 表
+
+    已缓存的内容不再请求，重复运行只处理新增或正文变化的微博
+
+    Args:
+        provider: 分类服务名称（fake / openai）
+        categories: 类别列表，为None时使用默认类别
+        concurrency: 同时进行的请求数
+        token_budget: 每个请求的估算token上限
+    """
+    with WeiboArchive() as archive, ClassificationCache() as cache:
+        classifier = BatchClassifier(make_provider(provider), categories=categories, cache=cache,
+                                     token_budget=token_budget, concurrency=concurrency)
+        total = 0
+        for posts in archive.iter_post_texts(batch_size=2000):
+            total += archive.save_categories(classifier.classify(posts))
+        logger.info(f"分类完成，共 {total} 条微博")
+        for category, count in archive.category_counts().items():
+            logger.info(f"  {category}: {count}")
+
+def build_embeddings(embedder='hashing'):
+    """计算存档中新增或正文变化的微博的向量"""
+    with WeiboArchive() as archive:
+        EmbeddingIndex(embedder=make_embedder(embedder)).update_from_archive(archive)
+
+def show_similar(bid, embedder='hashing', top_k=10):
+    """输出与某条微博最相似的微博，以及按相似微博的分类推荐的类别"""
+    index = EmbeddingIndex(embedder=make_embedder(embedder))
+    with WeiboArchive() as archive:
+        similar = index.most_similar(bid, k=top_k)
+        if not similar:
+            logger.error(f"向量索引中没有找到微博: {bid}，请先运行 --build-embeddings")
+            return
+        results = []
+        for other, score in similar:
+            post = archive.get_post(other) or {}
+            results.append({'bid': other, 'score': round(score, 4), 'text': (post.get('text') or '')[:60]})
+        suggestions = index.suggest_categories(bid, archive.get_categories())
+    print(json.dumps({'similar': results, 'suggested_categories': [c for c, _ in suggestions[:3]]},
+                     ensure_ascii=False, indent=2))
+
+def show_near_duplicates(threshold=0.9, embedder='hashing'):
+    """输出内容近似重复的微博分组"""
+    clusters = EmbeddingIndex(embedder=make_embedder(embedder)).near_duplicates(threshold=threshold)
+    logger.info(f"找到 {len(clusters)} 组近似重复的微博，共 {sum(len(c) for c in clusters)} 条")
+    print(json.dumps(clusters, ensure_ascii=False, indent=2))
+
 if __name__ == "__main__":
     # 检查命令行参数
     ignore_status = True
-    overwrite_pics = True
-    overwrite_videos = True
+    overwrite_pics = False
+    overwrite_videos = False
 
     parser = argparse.ArgumentParser(description="微博爬取工具")
     parser.add_argument('--ignore-status', action='store_true', help="忽略任务状态，将处理所有任务")
@@ -113,9 +365,49 @@ if __name__ == "__main__":
     parser.add_argument('--favorites', action='store_true', help='获取收藏微博')
     parser.add_argument('--max-pages', type=int, default=5, help='最大爬取页数')
     parser.add_argument('--add-to-tasks', action='store_true', help='将收藏微博添加到下载任务')
+    parser.add_argument('--incremental', action='store_true', help='增量同步收藏，遇到上次同步过的位置即停止，新收藏直接加入下载任务')
+    parser.add_argument('--async-fetch', action='store_true', help='使用异步引擎：获取收藏列表时预取后面几页，处理下载任务时并发预取详情页')
+    parser.add_argument('--async-concurrency', type=int, default=8, help='异步引擎同时进行的详情页请求数')
+    parser.add_argument('--workers', type=int, default=1, help='并发处理任务的线程数')
+    parser.add_argument('--rate-limit', type=float, default=None, help='每秒最多开始的任务数（默认不限速）')
+    parser.add_argument('--media-workers', type=int, default=4, help='同时进行的媒体下载数')
+    parser.add_argument('--pool-size', type=int, default=None, help='每个host保持的最大HTTP连接数')
+    parser.add_argument('--dedup-media', action='store_true', help='按内容哈希存储媒体文件，相同图片/视频只下载和保存一次')
+    parser.add_argument('--dedup-existing', action='store_true', help='整理已下载的媒体文件，重复内容改为硬链接')
+    parser.add_argument('--api-max-rate', type=float, default=None, help='微博接口每秒最大请求数（自适应限速的上限，默认2），决定了 --workers 能达到的任务吞吐量')
+    parser.add_argument('--cdn-max-rate', type=float, default=None, help='每个图片/视频CDN域名每秒最大请求数')
+    parser.add_argument('--migrate-archive', action='store_true', help='将已有的每日CSV导入SQLite存档数据库')
+    parser.add_argument('--import-tasks', metavar='CSV', help='将旧版CSV任务文件导入任务数据库')
+    parser.add_argument('--debug-capture', type=float, nargs='?', const=1.0, default=None, metavar='RATE',
+                        help='保存接口原始数据到 debug 目录的压缩归档，可指定采样比例（默认全部保存）')
+    parser.add_argument('--extract-debug', metavar='BID', help='从调试数据归档中取出某条微博的原始数据')
+    parser.add_argument('--recover-tasks', action='store_true', help='立即将所有处理中的任务恢复为待处理（确认没有其他程序在运行时使用）')
+    parser.add_argument('--reset-cursor', action='store_true', help='忽略状态处理全部任务时不从上次中断的位置继续，而是从头开始')
+    parser.add_argument('--classify', action='store_true', help='用LLM对存档中的微博分类（需先 --migrate-archive 或下载过微博）')
+    parser.add_argument('--llm-provider', default='openai', help='分类服务：openai（OpenAI兼容接口，读取环境变量 LLM_BASE_URL、LLM_API_KEY、LLM_MODEL）或 fake（本地测试）')
+    parser.add_argument('--llm-concurrency', type=int, default=4, help='同时进行的分类请求数')
+    parser.add_argument('--llm-token-budget', type=int, default=3000, help='每个分类请求的估算token上限，多条微博打包在一个请求中')
+    parser.add_argument('--categories', default=None, help='逗号分隔的类别列表，默认使用内置类别')
+    parser.add_argument('--build-embeddings', action='store_true', help='计算存档中微博正文的向量，用于相似微博查询和近似重复分组')
+    parser.add_argument('--similar', metavar='BID', help='查询与某条微博最相似的微博和推荐类别')
+    parser.add_argument('--near-duplicates', type=float, nargs='?', const=0.9, default=None, metavar='THRESHOLD',
+                        help='按向量相似度将近似重复的微博分组（默认阈值0.9）')
+    parser.add_argument('--embedder', default='hashing', help='向量模型：hashing（无需模型文件）或 sentence-transformers（本地模型）')
+    parser.add_argument('--top-k', type=int, default=10, help='--similar 返回的条数')
+    parser.add_argument('--metrics', type=float, nargs='?', const=30.0, default=None, metavar='INTERVAL',
+                        help='收集各阶段耗时和计数，定期输出摘要（默认每30秒），结束时写JSON报告到 log 目录')
+    parser.add_argument('--metrics-prom', metavar='FILE', help='同时把指标以Prometheus文本格式写入该文件')
 
     args = parser.parse_args()
 
+    try:
+        if args.api_max_rate:
+            configure_host_limits('api', max_rate=args.api_max_rate)
+        if args.cdn_max_rate:
+            configure_host_limits('cdn', max_rate=args.cdn_max_rate)
+    except ValueError as e:
+        parser.error(str(e))
+
     if args.ignore_status:
         ignore_status = True
         logger.info("忽略任务状态，将处理所有任务")
@@ -126,7 +418,43 @@ if __name__ == "__main__":
         overwrite_videos = True
         logger.info("启用视频覆盖模式，将重新下载所有视频")
 
-    if args.favorites:
-        fetch_favorites(max_pages=args.max_pages, add_to_tasks=args.add_to_tasks)
+    if args.debug_capture:
+        enable_debug_capture(sample_rate=args.debug_capture)
+    if args.metrics is not None or args.metrics_prom:
+        enable_metrics(interval=args.metrics if args.metrics is not None else 30.0,
+                       report_path=os.path.join('log', f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"),
+                       prometheus_path=args.metrics_prom)
+    if args.recover_tasks:
+        recover_stale_tasks(stale_after=0)
+    if args.reset_cursor:
+        reset_task_cursor()
+
+    if args.extract_debug:
+        weibo_data = find_weibo_capture(args.extract_debug)
+        if weibo_data is None:
+            logger.error(f"调试数据归档中没有找到微博: {args.extract_debug}")
+        else:
+            print(json.dumps(weibo_data, ensure_ascii=False, indent=2))
+    elif args.import_tasks:
+        import_tasks_from_csv(args.import_tasks)
+    elif args.migrate_archive:
+        migrate_archive()
+    elif args.classify:
+        classify_archive(provider=args.llm_provider,
+                         categories=[c.strip() for c in args.categories.split(',') if c.strip()] if args.categories else None,
+                         concurrency=args.llm_concurrency, token_budget=args.llm_token_budget)
+    elif args.build_embeddings:
+        build_embeddings(embedder=args.embedder)
+    elif args.similar:
+        show_similar(args.similar, embedder=args.embedder, top_k=args.top_k)
+    elif args.near_duplicates is not None:
+        show_near_duplicates(threshold=args.near_duplicates, embedder=args.embedder)
+    elif args.dedup_existing:
+        enable_media_store().dedupe_existing()
+    elif args.favorites:
+        fetch_favorites(max_pages=args.max_pages, add_to_tasks=args.add_to_tasks, incremental=args.incremental,
+                        use_async=args.async_fetch)
     else:
-        main(ignore_status, overwrite_pics, overwrite_videos)
\ No newline at end of file
+        main(ignore_status, overwrite_pics, overwrite_videos, workers=args.workers, rate_limit=args.rate_limit,
+             media_workers=args.media_workers, pool_size=args.pool_size,
+             dedup_media=args.dedup_media, async_fetch=args.async_fetch, async_concurrency=args.async_concurrency)
\ No newline at end of file